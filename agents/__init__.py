@@ -1,16 +1,22 @@
 # AI 윤리 리스크 진단 멀티에이전트 시스템
 # 에이전트 패키지 초기화
+# 에이전트 모듈은 LangChain(및 보고서 단계의 weasyprint 등)을 임포트하므로,
+# 패키지 임포트 시에는 불러오지 않고 클래스에 처음 접근할 때 해당 모듈을 임포트합니다. (PEP 562)
+import importlib
 
-from agents.service_analysis_agent import ServiceAnalysisAgent
-from agents.ethical_risk_agent import EthicalRiskAgent
-from agents.toxic_clause_agent import ToxicClauseAgent
-from agents.improvement_agent import ImprovementAgent
-from agents.report_composer_agent import ReportComposerAgent
+_LAZY_EXPORTS = {
+    'ServiceAnalysisAgent': 'agents.service_analysis_agent',
+    'EthicalRiskAgent': 'agents.ethical_risk_agent',
+    'ToxicClauseAgent': 'agents.toxic_clause_agent',
+    'ImprovementAgent': 'agents.improvement_agent',
+    'ReportComposerAgent': 'agents.report_composer_agent'
+}
 
-__all__ = [
-    'ServiceAnalysisAgent',
-    'EthicalRiskAgent',
-    'ToxicClauseAgent',
-    'ImprovementAgent',
-    'ReportComposerAgent'
-]
\ No newline at end of file
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module_name), name)
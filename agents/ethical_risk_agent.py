@@ -1,22 +1,47 @@
 import os
 import json
 import re
-from typing import Dict, Any, List
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple, Optional, Union
 
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from langchain.schema.runnable import Runnable
-from langchain.retrievers.ensemble import EnsembleRetriever # 타입 힌트용
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever # 타입 힌트용
 
 from utils.load_prompt import load_prompt_from_file
+from utils.query_planner import QueryPlanner, retrieve_plans
+from utils.context_packer import DEFAULT_CONTEXT_TOKEN_BUDGET, pack_contexts
+from indexing.metadata_filter import DOC_TYPE_GUIDELINE, SERVICE_DOC_TYPES
+
+EVALUATION_MODE_SINGLE = "single" # 4개 항목을 하나의 프롬프트로 한 번에 평가
+EVALUATION_MODE_PER_ITEM = "per_item" # 항목별 프롬프트로 동시에 평가한 뒤 병합
+EVALUATION_MODES = (EVALUATION_MODE_SINGLE, EVALUATION_MODE_PER_ITEM)
+
+
+class ItemResponseParseError(ValueError):
+    """항목별 모드에서 한 항목의 LLM 응답을 최대 요청 횟수만큼 모두 JSON으로 파싱하지 못했을 때 발생합니다."""
+
 
 class EthicalRiskAgent:
     """윤리적 리스크 평가 에이전트 (RAG 및 특정 가이드라인 참조 적용)"""
     
-    def __init__(self, llm: Runnable, retriever: EnsembleRetriever | None, 
+    def __init__(self, llm: Runnable, retriever: Optional[BaseRetriever], 
                  guideline_doc_keyword: str = "OECD", # RAG 쿼리 시 참조할 가이드라인 문서 키워드
-                 prompt_dir: str = "./prompts"):
+                 prompt_dir: str = "./prompts",
+                 context_token_budget: Optional[int] = DEFAULT_CONTEXT_TOKEN_BUDGET, # RAG 컨텍스트 최대 토큰 수 (None이면 제한 없음, 항목별 모드에서는 항목당)
+                 evaluation_mode: str = EVALUATION_MODE_SINGLE,
+                 item_max_concurrency: int = 4, # 항목별 모드의 동시 LLM 호출 수
+                 item_max_attempts: int = 2): # 항목별 모드에서 JSON 파싱 실패 시 항목당 최대 요청 횟수
+        if evaluation_mode not in EVALUATION_MODES:
+            raise ValueError(f"지원하지 않는 평가 모드입니다: {evaluation_mode} (가능한 값: {', '.join(EVALUATION_MODES)})")
         self.llm = llm
         self.retriever = retriever
+        self.context_token_budget = context_token_budget
+        self.evaluation_mode = evaluation_mode
+        self.item_max_concurrency = item_max_concurrency
+        self.item_max_attempts = max(item_max_attempts, 1)
         self.guideline_doc_keyword = guideline_doc_keyword # 예: "OECD", "AI 윤리 가이드라인" 등
         agent_name = self.__class__.__name__
 
@@ -31,6 +56,18 @@ class EthicalRiskAgent:
         if not self.user_prompt_template:
             raise FileNotFoundError(f"{agent_name}: 사용자 프롬프트 템플릿 파일을 로드할 수 없습니다. 경로: {user_prompt_template_path}")
 
+        self.item_system_prompt = None
+        self.item_user_prompt_template = None
+        if evaluation_mode == EVALUATION_MODE_PER_ITEM: # 항목별 프롬프트는 항목별 모드에서만 필요
+            item_system_prompt_path = os.path.join(prompt_dir, "ethical_risk_item_system.txt")
+            item_user_prompt_template_path = os.path.join(prompt_dir, "ethical_risk_item_user.txt")
+            self.item_system_prompt = load_prompt_from_file(item_system_prompt_path)
+            self.item_user_prompt_template = load_prompt_from_file(item_user_prompt_template_path)
+            if not self.item_system_prompt:
+                raise FileNotFoundError(f"{agent_name}: 항목별 시스템 프롬프트 파일을 로드할 수 없습니다. 경로: {item_system_prompt_path}")
+            if not self.item_user_prompt_template:
+                raise FileNotFoundError(f"{agent_name}: 항목별 사용자 프롬프트 템플릿 파일을 로드할 수 없습니다. 경로: {item_user_prompt_template_path}")
+
         self.ethical_risk_items_for_rag = {
             "bias_risk": "서비스의 잠재적인 편향성(Bias) 리스크",
             "privacy_risk": "서비스의 개인정보보호(Privacy) 관련 리스크",
@@ -38,19 +75,9 @@ class EthicalRiskAgent:
             "automation_risk": "서비스의 자동화된 의사결정(Automation) 관련 리스크"
         }
 
-    def _get_rag_context_for_item(self, item_description: str, service_info: Dict[str, Any], documents_to_consider: List[str]) -> str:
-        """
-        특정 평가 항목(item_description)에 대해 다양한 윤리적 측면을 고려하여 RAG로 관련 컨텍스트를 검색합니다.
-        각 측면별로 RAG 쿼리를 생성하고 결과를 취합합니다.
-        """
-        if not self.retriever:
-            return f"  - '{item_description}' 관련 컨텍스트: Retriever가 제공되지 않았습니다.\n"
-
-        service_name = service_info.get("service_name", "해당 AI 서비스")
-
         # 각 항목에 대해 검색할 윤리적 측면 또는 세부 키워드 리스트
         # 이 키워드들은 self.guideline_doc_keyword 와 함께 사용되어 검색 쿼리를 구체화합니다.
-        ethical_aspect_keywords = [
+        self.ethical_aspect_keywords = [
             "데이터 수집 및 처리의 적절성",
             "개인정보보호 및 프라이버시 침해 가능성",
             "알고리즘 편향성 및 공정성 문제",
@@ -62,99 +89,187 @@ class EthicalRiskAgent:
             # 필요에 따라 서비스 특성 및 guideline_doc_keyword에 맞춰 키워드 추가/수정
         ]
 
-        # 문서 경로가 있다면 쿼리에 포함시킬 문서명 문자열 생성
-        doc_names_suffix = ""
-        if documents_to_consider:
-            # 문서가 너무 많으면 일부만 표시 (예: 처음 3개)
-            doc_names_preview = [os.path.basename(doc_path) for doc_path in documents_to_consider[:3]]
-            suffix_etc = " 등" if len(documents_to_consider) > 3 else ""
-            doc_names_suffix = f" (주요 참고 문서 예시: {', '.join(doc_names_preview)}{suffix_etc})"
-
-        # 최종 컨텍스트 문자열을 빌드하기 위한 리스트
-        item_all_contexts_parts = [f"\n## '{item_description}' 항목 관련 윤리적 분석 컨텍스트 (RAG 결과):\n"]
-        item_all_contexts_parts.append(f"   (주요 참조 가이드라인 키워드: '{self.guideline_doc_keyword}')\n")
-        
-        found_any_context_for_item = False
-
-        for aspect_keyword in ethical_aspect_keywords:
-            # 각 윤리적 측면에 대한 특정 RAG 쿼리 생성
-            query = (
-                f"'{service_name}' 서비스의 '{item_description}' 기능/항목과 관련하여, "
-                f"'{aspect_keyword}' 측면에 대해 '{self.guideline_doc_keyword}' 가이드라인을 참조했을 때, "
-                f"관련된 정책, 기술적 구현, 데이터 처리 방식, 잠재적 위험 또는 완화 조치 등을 설명하는 내용을 찾아주세요."
-                f"{doc_names_suffix}"
-            )
+    def _retrieve_labeled_results(
+        self, service_info: Dict[str, Any], documents_to_consider: List[str]
+    ) -> Dict[str, List[Tuple[str, Union[List[Document], Exception]]]]:
+        """
+        모든 평가 항목에 대해 (서비스 문서 근거 쿼리 1개 + 윤리적 측면별 가이드라인 쿼리)를 한 번에 배치 검색하고,
+        항목 키별로 (쿼리 라벨, 검색 결과) 리스트를 반환합니다.
+        가이드라인 쿼리는 가이드라인 문서만, 서비스 근거 쿼리는 서비스 문서만 검색하여 서로 k개 결과를 빼앗지 않도록 합니다.
+        """
+        service_name = service_info.get("service_name", "해당 AI 서비스")
 
-            print(f"EthicalRiskAgent: RAG 쿼리 (항목: {item_description}, 측면: {aspect_keyword}) - \"{query[:180]}...\"")
+        # 항목마다 서비스 문서 근거 계획 1개 + 측면별 가이드라인 계획 (참조 가이드라인 키워드는 BM25 키워드 쿼리에 추가)
+        planner = QueryPlanner(subject=service_name, documents=documents_to_consider)
+        plans = []
+        labels = []
+        for item_description in self.ethical_risk_items_for_rag.values():
+            plans.append(planner.plan(item_description, doc_types=SERVICE_DOC_TYPES))
+            labels.append(f"{item_description} / 서비스 문서 근거")
+            for aspect_keyword in self.ethical_aspect_keywords:
+                plan = planner.plan(
+                    item_description, aspect_keyword,
+                    doc_types=[DOC_TYPE_GUIDELINE], extra_keywords=[self.guideline_doc_keyword]
+                )
+                print(f"EthicalRiskAgent: 검색 계획 (항목: {item_description}, 측면: {aspect_keyword}) - 의미: \"{plan.semantic_query}\", 키워드: \"{plan.keyword_query}\"")
+                plans.append(plan)
+                labels.append(f"{item_description} / {aspect_keyword}")
+
+        print(f"EthicalRiskAgent: {len(plans)}개 쿼리 배치 검색 중 (서비스 문서 / 가이드라인 문서 필터)...")
+        labeled_results = list(zip(labels, retrieve_plans(self.retriever, plans)))
+        queries_per_item = 1 + len(self.ethical_aspect_keywords)
+        return {
+            item_key: labeled_results[item_index * queries_per_item:(item_index + 1) * queries_per_item]
+            for item_index, item_key in enumerate(self.ethical_risk_items_for_rag)
+        }
 
-            relevant_docs_for_aspect = []
-            try:
-                if hasattr(self.retriever, 'invoke'):
-                    relevant_docs_for_aspect = self.retriever.invoke(query)
-                elif hasattr(self.retriever, 'get_relevant_documents'):
-                    relevant_docs_for_aspect = self.retriever.get_relevant_documents(query)
-                else:
-                    item_all_contexts_parts.append(f"\n### '{item_description}'의 '{aspect_keyword}' 측면:\n")
-                    item_all_contexts_parts.append(f"  - Retriever에 적절한 검색 메소드가 없어 컨텍스트를 가져올 수 없습니다.\n")
-                    continue # 다음 측면 키워드로
-            except Exception as e:
-                item_all_contexts_parts.append(f"\n### '{item_description}'의 '{aspect_keyword}' 측면:\n")
-                item_all_contexts_parts.append(f"  - RAG 컨텍스트 검색 중 오류 발생 ({e})\n")
-                continue # 다음 측면 키워드로
-
-            if relevant_docs_for_aspect:
-                found_any_context_for_item = True
-                item_all_contexts_parts.append(f"\n### '{item_description}'의 '{aspect_keyword}' 측면:\n")
-                for i, doc in enumerate(relevant_docs_for_aspect):
-                    source_file = doc.metadata.get('source_file', doc.metadata.get('source', 'N/A'))
-                    page_num = doc.metadata.get('page', 'N/A')
-                    section_title = doc.metadata.get('section_title', 'N/A') # indexer.py 등에서 추가한 메타데이터 가정
-                    content_preview = doc.page_content.replace(chr(0), '').strip()[:300] # NULL 바이트 제거 및 미리보기 길이 조정
-
-                    item_all_contexts_parts.append(
-                        f"  --- 컨텍스트 {i+1} (출처: {source_file}, 페이지: {page_num}, 섹션: {section_title}) ---\n"
-                        f"  {content_preview}...\n"
-                    )
-                    # 상세 디버깅이 필요할 때 아래 프린트문 주석 해제
-                    # print(f"Debug: Item='{item_description}', Aspect='{aspect_keyword}', Source='{source_file}', Page='{page_num}', Content='{content_preview[:50]}...'")
-            else:
-                item_all_contexts_parts.append(f"\n### '{item_description}'의 '{aspect_keyword}' 측면:\n")
-                item_all_contexts_parts.append(f"  - 이 측면에 대해 '{self.guideline_doc_keyword}' 가이드라인을 참조하여 검색된 관련 내용을 문서에서 찾을 수 없습니다.\n")
-
-        if not found_any_context_for_item and len(item_all_contexts_parts) <= 2 : # 헤더와 가이드라인 키워드 안내만 있는 경우
-            item_all_contexts_parts.append(f"  '{item_description}' 항목에 대해 모든 윤리적 측면에서 관련된 내용을 찾을 수 없었습니다.\n")
-            
-        return "".join(item_all_contexts_parts) + "\n"
-        
     def _get_comprehensive_rag_context(self, service_info: Dict[str, Any], documents_to_consider: List[str]) -> str:
+        """
+        모든 평가 항목의 검색 결과를 중복 청크를 합쳐 토큰 예산 안에서 하나의 컨텍스트로 조립합니다.
+        """
         comprehensive_context = "## 각 윤리 리스크 항목별 관련 문서 컨텍스트 (윤리 가이드라인 포함):\n"
         if not self.retriever:
             comprehensive_context += "Retriever가 제공되지 않아 RAG를 수행할 수 없습니다.\n"
             return comprehensive_context
 
-        for item_desc_for_query in self.ethical_risk_items_for_rag.items():
-            context_for_item = self._get_rag_context_for_item(item_desc_for_query, service_info, documents_to_consider)
-            comprehensive_context += context_for_item
-        
-        return comprehensive_context
+        # 항목/측면 쿼리에서 반복해서 검색되는 청크(특히 가이드라인 청크)는 한 번만 넣고 관련 검색 라벨을 모아 예산 안에서 점수순으로 조립
+        item_results = self._retrieve_labeled_results(service_info, documents_to_consider)
+        packed = pack_contexts(
+            [labeled for results in item_results.values() for labeled in results],
+            token_budget=self.context_token_budget,
+            header=comprehensive_context + f"   (주요 참조 가이드라인 키워드: '{self.guideline_doc_keyword}')\n"
+        )
+        print(f"EthicalRiskAgent: {packed.summary()}")
+        return packed.text
+
+    def _get_item_rag_contexts(self, service_info: Dict[str, Any], documents_to_consider: List[str]) -> Dict[str, str]:
+        """항목별 모드: 검색은 한 번의 배치로 하고, 컨텍스트는 항목별로 해당 항목의 검색 결과만으로 조립합니다."""
+        if not self.retriever:
+            return {item_key: "Retriever가 제공되지 않아 RAG를 수행할 수 없습니다.\n" for item_key in self.ethical_risk_items_for_rag}
+
+        contexts = {}
+        for item_key, labeled_results in self._retrieve_labeled_results(service_info, documents_to_consider).items():
+            item_description = self.ethical_risk_items_for_rag[item_key]
+            prefix = f"{item_description} / "
+            packed = pack_contexts(
+                [(label[len(prefix):] if label.startswith(prefix) else label, docs) for label, docs in labeled_results],
+                token_budget=self.context_token_budget,
+                header=f"## '{item_description}' 관련 문서 컨텍스트 (주요 참조 가이드라인 키워드: '{self.guideline_doc_keyword}'):\n"
+            )
+            print(f"EthicalRiskAgent: [{item_key}] {packed.summary()}")
+            contexts[item_key] = packed.text
+        return contexts
+
+    def _format_service_fields(self, service_info: Dict[str, Any]) -> Dict[str, str]:
+        return {
+            "service_name": service_info.get('service_name', '알 수 없음'),
+            "description": service_info.get('description', '알 수 없음'),
+            "core_features": ", ".join(service_info.get('core_features', ['정보 없음'])),
+            "target_users": ", ".join(service_info.get('target_users', ['정보 없음'])),
+            "collected_data_types": ", ".join(service_info.get('collected_data_types', ['정보 없음'])),
+        }
+
+    @staticmethod
+    def _parse_json_response(content: str) -> Dict[str, Any]:
+        """LLM 응답의 ```json 블록(없으면 전체 응답)을 파싱합니다. 실패 시 json.JSONDecodeError."""
+        json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group(1))
+        print("EthicalRiskAgent 경고: LLM 응답에서 명확한 JSON 블록을 찾지 못했습니다. 전체 응답 파싱 시도.")
+        return json.loads(content)
+
+    def _evaluate_item(self, item_key: str, service_fields: Dict[str, str], rag_context: str) -> Dict[str, Any]:
+        """평가 항목 하나를 LLM으로 평가합니다. JSON 파싱에 실패하면 이 항목만 다시 요청합니다."""
+        item_description = self.ethical_risk_items_for_rag[item_key]
+        human_prompt = self.item_user_prompt_template.format(
+            **service_fields,
+            risk_item_description=item_description,
+            rag_context_ethical_risk=rag_context
+        )
+        messages = [
+            SystemMessage(content=self.item_system_prompt),
+            HumanMessage(content=human_prompt)
+        ]
+        for attempt in range(1, self.item_max_attempts + 1):
+            print(f"EthicalRiskAgent: [{item_key}] LLM 호출 중 (시도 {attempt}/{self.item_max_attempts})...")
+            response = self.llm.invoke(messages)
+            try:
+                item_output = self._parse_json_response(response.content)
+                if "risk_level" not in item_output:
+                    raise json.JSONDecodeError("risk_level 필드 누락", response.content, 0)
+                return item_output
+            except json.JSONDecodeError as e:
+                print(f"EthicalRiskAgent 오류: [{item_key}] LLM 응답 JSON 파싱 실패 - {e}")
+                print(f"LLM 원본 응답 (일부):\n{response.content[:500].replace(chr(0), '')}...")
+                # 재요청에는 이전 응답과 형식 안내를 덧붙임 (같은 프롬프트를 다시 보내면 LLM 캐시가 같은 응답을 돌려주므로)
+                messages = messages[:2] + [
+                    AIMessage(content=response.content),
+                    HumanMessage(content="이전 응답을 JSON으로 파싱할 수 없었습니다. 시스템 프롬프트에 지정된 ```json 블록 형식으로만 다시 답해주십시오.")
+                ]
+        raise ItemResponseParseError(f"'{item_key}' 항목 평가 응답을 {self.item_max_attempts}회 모두 파싱하지 못했습니다.")
+
+    def _evaluate_items_concurrently(self, service_info: Dict[str, Any], documents: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        평가 항목별 LLM 호출을 동시에 실행하고 결과를 기존 ethical_risks 형식(수준, justification, source_document_reference)으로 병합합니다.
+        응답 파싱에 실패한 항목만 '평가 불가'로 병합하고, 그 외 오류(replay-only 캐시 미스, 스케줄러 재시도 후에도 실패한 요청 등)는 그대로 전파합니다.
+        Returns:
+            (병합된 ethical_risks, 파싱에 실패한 항목의 오류 메시지 리스트)
+        """
+        service_fields = self._format_service_fields(service_info)
+        item_contexts = self._get_item_rag_contexts(service_info, documents)
+        item_keys = list(self.ethical_risk_items_for_rag)
+
+        print(f"EthicalRiskAgent: 평가 항목 {len(item_keys)}개를 동시에 평가 중 (최대 {self.item_max_concurrency}개)...")
+        with ThreadPoolExecutor(max_workers=max(min(self.item_max_concurrency, len(item_keys)), 1), thread_name_prefix="ethical-item") as executor:
+            futures = [
+                # LLM 요청 우선순위 등 호출 스레드의 컨텍스트 변수를 작업 스레드에서도 유지
+                executor.submit(contextvars.copy_context().run, self._evaluate_item, item_key, service_fields, item_contexts[item_key])
+                for item_key in item_keys
+            ]
+
+        ethical_risks_output: Dict[str, Any] = {"justification": {}, "source_document_reference": {}}
+        errors = []
+        for item_key, future in zip(item_keys, futures): # 항목 순서대로 병합
+            try:
+                item_output = future.result()
+                ethical_risks_output[item_key] = item_output.get("risk_level", "평가 불가")
+                ethical_risks_output["justification"][item_key] = item_output.get("justification", "상세 근거 없음")
+                ethical_risks_output["source_document_reference"][f"{item_key}_reference"] = item_output.get("source_document_reference", "출처 없음")
+            except ItemResponseParseError as e:
+                errors.append(f"EthicalRiskAgent 오류: [{item_key}] 평가 실패 - {e}")
+                print(errors[-1])
+                ethical_risks_output[item_key] = "평가 불가"
+                ethical_risks_output["justification"][item_key] = f"평가 실패: {e}"
+                ethical_risks_output["source_document_reference"][f"{item_key}_reference"] = "출처 없음"
+        # 기존 단일 호출 형식과 같은 키 순서 (수준 4개 → justification → source_document_reference)
+        ordered = {item_key: ethical_risks_output[item_key] for item_key in item_keys}
+        ordered["justification"] = ethical_risks_output["justification"]
+        ordered["source_document_reference"] = ethical_risks_output["source_document_reference"]
+        return ordered, errors
     
     def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        print("EthicalRiskAgent 실행 시작 (가이드라인 참조 강화)...")
+        print(f"EthicalRiskAgent 실행 시작 (가이드라인 참조 강화, 평가 모드: {self.evaluation_mode})...")
         service_info = state.get("service_info", {})
         documents = state.get("documents", []) # 여기에는 서비스 문서 + 윤리 가이드라인 문서 경로가 포함되어야 함
 
         if not service_info:
             print("EthicalRiskAgent 경고: 서비스 정보(service_info)가 없습니다.")
-            return {"ethical_risks": {"error": "서비스 정보 부족"}, "ethical_risk_done": True} # 실패해도 done 플래그 설정
+            return {"ethical_risks": {"error": "서비스 정보 부족"}}
+
+        if self.evaluation_mode == EVALUATION_MODE_PER_ITEM:
+            ethical_risks_output, errors = self._evaluate_items_concurrently(service_info, documents)
+            print(f"EthicalRiskAgent: 평가된 윤리 리스크 - {ethical_risks_output}")
+            if not errors:
+                return {"ethical_risks": ethical_risks_output}
+            error_msg = "; ".join(errors) # 일부 항목만 실패해도 평가가 불완전하므로 오류로 기록
+            if len(errors) == len(self.ethical_risk_items_for_rag): # 모든 항목 실패 시 단일 호출 모드의 파싱 실패와 같게 처리
+                return {"error_message": error_msg, "ethical_risks": {"error": "JSON 파싱 실패"}}
+            return {"error_message": error_msg, "ethical_risks": ethical_risks_output}
 
         rag_context = self._get_comprehensive_rag_context(service_info, documents)
         
         human_prompt = self.user_prompt_template.format(
-            service_name=service_info.get('service_name', '알 수 없음'),
-            description=service_info.get('description', '알 수 없음'),
-            core_features=", ".join(service_info.get('core_features', ['정보 없음'])),
-            target_users=", ".join(service_info.get('target_users', ['정보 없음'])),
-            collected_data_types=", ".join(service_info.get('collected_data_types', ['정보 없음'])),
+            **self._format_service_fields(service_info),
             rag_context_ethical_risk=rag_context # RAG 결과 주입
         )
         
@@ -167,19 +282,13 @@ class EthicalRiskAgent:
         
         ethical_risks_output = {}
         try:
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response.content, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-                ethical_risks_output = json.loads(json_str)
-                print("EthicalRiskAgent: LLM으로부터 JSON 응답 파싱 성공.")
-            else:
-                print("EthicalRiskAgent 경고: LLM 응답에서 명확한 JSON 블록을 찾지 못했습니다. 전체 응답 파싱 시도.")
-                ethical_risks_output = json.loads(response.content) 
+            ethical_risks_output = self._parse_json_response(response.content)
+            print("EthicalRiskAgent: LLM으로부터 JSON 응답 파싱 성공.")
         except json.JSONDecodeError as e:
             error_msg = f"EthicalRiskAgent 오류: LLM 응답 JSON 파싱 실패 - {e}"
             print(error_msg)
             print(f"LLM 원본 응답 (일부):\n{response.content[:500].replace(chr(0), '')}...")
-            return {"error_message": state.get("error_message","") + "; " + error_msg, "ethical_risks": {"error": "JSON 파싱 실패"}, "ethical_risk_done": True}
+            return {"error_message": error_msg, "ethical_risks": {"error": "JSON 파싱 실패"}}
         
         print(f"EthicalRiskAgent: 평가된 윤리 리스크 - {ethical_risks_output}")
-        return {"ethical_risks": ethical_risks_output, "ethical_risk_done": True}
+        return {"ethical_risks": ethical_risks_output}
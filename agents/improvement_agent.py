@@ -93,9 +93,8 @@ class ImprovementAgent:
             error_msg = f"ImprovementAgent 오류: LLM 응답 JSON 파싱 실패 - {e}"
             print(error_msg)
             print(f"LLM 원본 응답 (일부):\n{response.content[:500].replace(chr(0), '')}...")
-            # 상태에 오류 메시지 추가 (기존 오류 메시지가 있다면 이어붙임)
-            current_error = state.get("error_message", "")
-            return {"error_message": (current_error + "; " if current_error else "") + error_msg, 
+            # 새 오류 메시지만 반환 (기존 오류 뒤에 이어 붙이는 것은 그래프 State 리듀서가 처리)
+            return {"error_message": error_msg, 
                     "recommendations": {"error": "개선안 JSON 파싱 실패"}}
         
         print(f"ImprovementAgent: 생성된 개선안 - {recommendations_output}")
@@ -6,9 +6,6 @@ from datetime import datetime
 
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.schema.runnable import Runnable
-# Markdown 및 PDF 변환을 위한 라이브러리 임포트
-from markdown import markdown # markdown2 사용 시 from markdown2 import Markdown; markdowner = Markdown()
-from weasyprint import HTML, CSS
 
 # prompts 폴더에서 프롬프트를 로드하는 함수
 def load_prompt_from_file(file_path: str) -> str:
@@ -61,8 +58,12 @@ class ReportComposerAgent:
         }
 
     def _convert_md_to_pdf(self, markdown_string: str, pdf_path: str):
-        """Markdown 문자열을 PDF 파일로 변환합니다."""
+        """Markdown 문자열을 PDF 파일로 변환합니다. (markdown, weasyprint는 보고서 단계에서만 필요하므로 여기서 임포트)"""
         try:
+            # Markdown 및 PDF 변환을 위한 라이브러리 임포트
+            from markdown import markdown # markdown2 사용 시 from markdown2 import Markdown; markdowner = Markdown()
+            from weasyprint import HTML, CSS
+
             # Markdown을 HTML로 변환
             # markdown2 사용 시: html_content = markdowner.convert(markdown_string)
             html_content = markdown(markdown_string, extensions=['extra', 'nl2br', 'sane_lists', 'codehilite', 'tables', 'fenced_code'])
@@ -191,7 +192,7 @@ class ReportComposerAgent:
             final_report_output["report_markdown"] = md_saved_path # md 저장은 성공했을 수 있음
             final_report_output["status"] = "Partial Success (Save/Convert Failed)"
             final_report_output["error_details"] = f"보고서 저장/PDF 변환 실패: {str(e)}"
-            return {"final_report": final_report_output, "error_message": state.get("error_message","") + f"; Report File Save/Convert Failed: {str(e)}"}
+            return {"final_report": final_report_output, "error_message": f"Report File Save/Convert Failed: {str(e)}"}
         
         final_report_output["summary"] = summary
         final_report_output["report_markdown"] = md_saved_path
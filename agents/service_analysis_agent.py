@@ -1,27 +1,30 @@
 import os
 import json
 import re
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Union
 
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.schema.runnable import Runnable
-from langchain.retrievers.ensemble import EnsembleRetriever # EnsembleRetriever 타입 힌트를 위해 직접 임포트
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever # 리트리버 타입 힌트용
 
 from utils.load_prompt import load_prompt_from_file
+from utils.query_planner import QueryPlanner, retrieve_plans
+from indexing.metadata_filter import SERVICE_DOC_TYPES
 
 class ServiceAnalysisAgent:
     """서비스 분석 에이전트
     
     서비스의 기능, 대상 사용자, 수집 데이터 등을 RAG를 활용하여 분석하는 에이전트
-    각 주요 정보 항목에 대해 개별 RAG 쿼리를 수행하여 컨텍스트의 관련성을 높입니다.
+    각 주요 정보 항목에 대해 개별 RAG 쿼리를 구성하여 컨텍스트의 관련성을 높이며, 쿼리들은 한 번의 배치 검색으로 처리합니다.
     """
     
-    def __init__(self, llm: Runnable, retriever: EnsembleRetriever, prompt_dir: str = "./prompts"):
+    def __init__(self, llm: Runnable, retriever: BaseRetriever, prompt_dir: str = "./prompts"):
         """초기화
         
         Args:
             llm: 사용할 LLM 모델
-            retriever: 미리 초기화된 EnsembleRetriever 인스턴스
+            retriever: 미리 초기화된 리트리버 인스턴스 (batch_retrieve 지원 시 배치 검색)
             prompt_dir: 프롬프트 파일이 있는 디렉토리 경로
         """
         self.llm = llm
@@ -53,29 +56,11 @@ class ServiceAnalysisAgent:
             "key_information_source": "서비스 정보를 얻을 수 있는 주요 출처 (문서명, 웹페이지 섹션 등)"
         }
 
-    def _get_single_item_rag_context(self, item_description: str, service_url: str, documents_to_consider: List[str]) -> str:
-        """단일 정보 항목에 대한 RAG 컨텍스트를 가져옵니다."""
-        if not self.retriever:
-            return f"  - {item_description}: Retriever가 제공되지 않아 컨텍스트를 가져올 수 없습니다.\n"
+    def _format_item_context(self, item_description: str, relevant_docs: Union[List[Document], Exception]) -> str:
+        """단일 정보 항목의 검색 결과(또는 검색 오류)를 컨텍스트 문자열로 변환합니다."""
+        if isinstance(relevant_docs, Exception):
+            return f"  - {item_description}: RAG 컨텍스트 검색 중 오류 발생 ({relevant_docs})\n"
 
-        # RAG 쿼리 구성
-        query = f"'{service_url}' 서비스의 '{item_description}'에 대한 정보를 관련 문서에서 찾아주세요."
-        if documents_to_consider:
-            doc_names = ", ".join([os.path.basename(doc_path) for doc_path in documents_to_consider])
-            query += f" (주요 참고 문서: {doc_names})"
-        
-        print(f"ServiceAnalysisAgent: RAG 쿼리 (항목: {item_description}) - \"{query}\"")
-        
-        try:
-            if hasattr(self.retriever, 'invoke'):
-                relevant_docs = self.retriever.invoke(query)
-            elif hasattr(self.retriever, 'get_relevant_documents'):
-                relevant_docs = self.retriever.get_relevant_documents(query)
-            else:
-                return f"  - {item_description}: Retriever 메소드 오류로 컨텍스트를 가져올 수 없습니다.\n"
-        except Exception as e:
-            return f"  - {item_description}: RAG 컨텍스트 검색 중 오류 발생 ({e})\n"
-            
         context_str = f"  - '{item_description}'에 대한 RAG 검색 결과:\n"
         if not relevant_docs:
             context_str += "    관련 문서를 찾을 수 없습니다.\n"
@@ -93,15 +78,25 @@ class ServiceAnalysisAgent:
         return context_str + "\n"
 
     def _get_comprehensive_rag_context(self, service_url: str, documents_to_consider: List[str]) -> str:
-        """정의된 모든 정보 항목에 대해 RAG를 수행하고 통합된 컨텍스트를 생성합니다."""
+        """정의된 모든 정보 항목의 쿼리를 한 번에 배치 검색하고 통합된 컨텍스트를 생성합니다."""
         comprehensive_context = "## 항목별 RAG 컨텍스트 요약:\n"
         if not self.retriever:
             comprehensive_context += "Retriever가 제공되지 않아 RAG를 수행할 수 없습니다.\n"
             return comprehensive_context
 
-        for item_desc_for_query in self.info_items_for_rag.items():
-            context_for_item = self._get_single_item_rag_context(item_desc_for_query, service_url, documents_to_consider)
-            comprehensive_context += context_for_item
+        item_descriptions = list(self.info_items_for_rag.values())
+        # 서비스 자체 문서(가이드라인 제외)만 검색하여 k개 결과를 가이드라인 청크에 낭비하지 않도록 함
+        # 참고 문서 목록은 쿼리 문장 대신 source_file 필터로 적용됨
+        planner = QueryPlanner(subject=service_url, documents=documents_to_consider)
+        plans = []
+        for item_description in item_descriptions:
+            plan = planner.plan(item_description, doc_types=SERVICE_DOC_TYPES)
+            print(f"ServiceAnalysisAgent: 검색 계획 (항목: {item_description}) - 의미: \"{plan.semantic_query}\", 키워드: \"{plan.keyword_query}\"")
+            plans.append(plan)
+
+        print(f"ServiceAnalysisAgent: {len(plans)}개 쿼리 배치 검색 중 (문서 유형 필터: {SERVICE_DOC_TYPES})...")
+        for item_description, relevant_docs in zip(item_descriptions, retrieve_plans(self.retriever, plans)):
+            comprehensive_context += self._format_item_context(item_description, relevant_docs)
         
         return comprehensive_context
 
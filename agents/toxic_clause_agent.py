@@ -1,20 +1,47 @@
 import os
 import json
 import re
-from typing import Dict, Any, List
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, Any, Iterator, List, Tuple, Optional
 
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.schema.runnable import Runnable
-from langchain.retrievers.ensemble import EnsembleRetriever
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 
 from utils.load_prompt import load_prompt_from_file
+from utils.query_planner import QueryPlanner, retrieve_plans
+from utils.context_packer import DEFAULT_CONTEXT_TOKEN_BUDGET, estimate_tokens, pack_contexts
+from utils.clause_prefilter import match_clause_categories
+from indexing.chunk_store import chunk_store_exists, iter_chunk_records, record_to_document
+from indexing.metadata_filter import DOC_TYPE_GUIDELINE, LEGAL_DOC_TYPES
+
+SCAN_MODE_KEYWORD = "keyword" # 법적 키워드 17개의 검색 결과(상위 k개 미리보기)만 한 번에 분석
+SCAN_MODE_EXHAUSTIVE = "exhaustive" # 약관/개인정보 청크 전체를 사전 필터 → 배치별 동시 LLM 분석(map) → 병합(reduce)
+SCAN_MODES = (SCAN_MODE_KEYWORD, SCAN_MODE_EXHAUSTIVE)
+DEFAULT_SCAN_BATCH_TOKEN_BUDGET = 3000 # 전수 검사 map 호출 한 번에 넣을 조항 후보의 최대 토큰 수
+SEVERITY_LEVELS = ["낮음", "중간", "높음"]
 
 class ToxicClauseAgent:
     """독소조항 탐지 에이전트 (RAG 적용, terms/privacy 텍스트 직접 입력 받지 않음)"""
     
-    def __init__(self, llm: Runnable, retriever: EnsembleRetriever | None, prompt_dir: str = "./prompts"):
+    def __init__(self, llm: Runnable, retriever: Optional[BaseRetriever], prompt_dir: str = "./prompts",
+                 context_token_budget: Optional[int] = DEFAULT_CONTEXT_TOKEN_BUDGET, # RAG 컨텍스트 최대 토큰 수 (None이면 제한 없음)
+                 scan_mode: str = SCAN_MODE_KEYWORD,
+                 chunk_store_dir: Optional[str] = None, # 전수 검사할 서비스 컬렉션 경로 (인덱서의 chunks.jsonl 위치)
+                 scan_max_concurrency: int = 4, # 전수 검사 모드의 동시 map 호출 수
+                 scan_batch_token_budget: int = DEFAULT_SCAN_BATCH_TOKEN_BUDGET):
+        if scan_mode not in SCAN_MODES:
+            raise ValueError(f"지원하지 않는 검사 모드입니다: {scan_mode} (가능한 값: {', '.join(SCAN_MODES)})")
         self.llm = llm
         self.retriever = retriever
+        self.context_token_budget = context_token_budget
+        self.scan_mode = scan_mode
+        self.chunk_store_dir = chunk_store_dir
+        self.scan_max_concurrency = max(scan_max_concurrency, 1)
+        self.scan_batch_token_budget = scan_batch_token_budget
         agent_name = self.__class__.__name__
 
         system_prompt_path = os.path.join(prompt_dir, "toxic_clause_system.txt")
@@ -28,8 +55,20 @@ class ToxicClauseAgent:
         if not self.user_prompt_template:
             raise FileNotFoundError(f"{agent_name}: 사용자 프롬프트 템플릿 파일을 로드할 수 없습니다. 경로: {user_prompt_template_path}")
 
+        self.map_system_prompt = None
+        self.map_user_prompt_template = None
+        if scan_mode == SCAN_MODE_EXHAUSTIVE: # map 프롬프트는 전수 검사 모드에서만 필요
+            map_system_prompt_path = os.path.join(prompt_dir, "toxic_clause_map_system.txt")
+            map_user_prompt_template_path = os.path.join(prompt_dir, "toxic_clause_map_user.txt")
+            self.map_system_prompt = load_prompt_from_file(map_system_prompt_path)
+            self.map_user_prompt_template = load_prompt_from_file(map_user_prompt_template_path)
+            if not self.map_system_prompt:
+                raise FileNotFoundError(f"{agent_name}: map 시스템 프롬프트 파일을 로드할 수 없습니다. 경로: {map_system_prompt_path}")
+            if not self.map_user_prompt_template:
+                raise FileNotFoundError(f"{agent_name}: map 사용자 프롬프트 템플릿 파일을 로드할 수 없습니다. 경로: {map_user_prompt_template_path}")
+
     def _get_rag_context_for_legal_analysis(self, service_info: Dict[str, Any], documents_to_consider: List[str]) -> str:
-        """서비스의 약관, 개인정보처리방침 등 법적 문서 관련 내용을 각 키워드별로 RAG 검색하여 취합합니다."""
+        """서비스의 약관, 개인정보처리방침 등 법적 문서 관련 내용을 각 키워드별로 RAG 검색(한 번의 배치 검색)하고, 중복 조항을 합쳐 토큰 예산 안에서 취합합니다."""
         if not self.retriever:
             return "Retriever가 제공되지 않아 약관/개인정보 관련 컨텍스트를 가져올 수 없습니다.\n"
 
@@ -42,67 +81,172 @@ class ToxicClauseAgent:
             "계약의 변경", "서비스 변경", "서비스 중단", "계정 정지", "해지"
         ]
 
-        # 문서 경로가 있다면 쿼리에 포함시킬 문서명 문자열 생성
-        doc_names_suffix = ""
-        if documents_to_consider:
-            doc_names = ", ".join([os.path.basename(doc_path) for doc_path in documents_to_consider])
-            doc_names_suffix = f" (주요 참고 문서: {doc_names})"
+        # 약관/개인정보 처리방침 문서만 검색 (해당 유형 문서가 없으면 전체 문서로 다시 검색)
+        # 참고 문서 목록은 쿼리 문장 대신 source_file 필터로 적용됨
+        planner = QueryPlanner(subject=service_name, documents=documents_to_consider)
+        plans = []
+        for keyword in query_keywords:
+            plan = planner.plan(keyword, doc_types=LEGAL_DOC_TYPES)
+            print(f"ToxicClauseAgent: 검색 계획 (키워드: {keyword}) - 의미: \"{plan.semantic_query}\", 키워드: \"{plan.keyword_query}\"")
+            plans.append(plan)
+
+        print(f"ToxicClauseAgent: {len(plans)}개 쿼리 배치 검색 중 (문서 유형 필터: {LEGAL_DOC_TYPES})...")
+        results = retrieve_plans(self.retriever, plans)
 
-        # 최종 컨텍스트 문자열을 빌드하기 위한 리스트
-        all_contexts_parts = ["## 서비스 약관 및 개인정보 처리방침 관련 문서 컨텍스트 (키워드별 RAG 결과):\n"]
-        found_any_context_overall = False
+        # 비슷한 키워드(예: "데이터 수집"/"데이터 이용")에서 반복해서 검색되는 조항은 한 번만 넣고 관련 키워드를 모아 표시
+        packed = pack_contexts(
+            list(zip(query_keywords, results)),
+            token_budget=self.context_token_budget,
+            header="## 서비스 약관 및 개인정보 처리방침 관련 문서 컨텍스트 (키워드별 RAG 결과):\n"
+        )
+        print(f"ToxicClauseAgent: {packed.summary()}")
+        return packed.text
 
-        for keyword in query_keywords:
-            # 각 키워드에 대한 spezifische 쿼리 생성
-            query = (
-                f"'{service_name}' 서비스의 공식 문서 또는 웹사이트 내용 중 "
-                f"'{keyword}' 키워드와 관련된 법적 조항, 정책, 또는 사용자에게 영향을 미칠 수 있는 중요한 고지 사항을 찾아주세요."
-                f"{doc_names_suffix}"
+    @staticmethod
+    def _parse_json_response(content: str) -> Dict[str, Any]:
+        """LLM 응답의 ```json 블록(없으면 전체 응답)을 파싱합니다. 실패 시 json.JSONDecodeError."""
+        json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group(1))
+        print("ToxicClauseAgent 경고: LLM 응답에서 명확한 JSON 블록을 찾지 못했습니다. 전체 응답 파싱 시도.")
+        return json.loads(content)
+
+    def _iter_clause_candidates(self, stats: Dict[str, int]) -> Iterator[Tuple[Document, List[str]]]:
+        """
+        청크 저장소의 약관/개인정보 청크를 파일 순서대로 읽으며 사전 필터(utils/clause_prefilter.py)를 통과한 청크와 해당 조항 유형을 내보냅니다.
+        약관/개인정보 유형으로 분류된 청크가 하나도 없으면 가이드라인을 제외한 모든 청크를 다시 검사합니다.
+        """
+        for legal_only in (True, False):
+            for record in iter_chunk_records(self.chunk_store_dir):
+                doc_type = record.get("metadata", {}).get("doc_type")
+                if legal_only and doc_type not in LEGAL_DOC_TYPES:
+                    continue
+                if not legal_only and doc_type == DOC_TYPE_GUIDELINE:
+                    continue
+                stats["scanned"] += 1
+                categories = match_clause_categories(record.get("text", ""))
+                if categories:
+                    stats["candidates"] += 1
+                    yield record_to_document(record), categories
+            if stats["scanned"]:
+                return
+            print(f"ToxicClauseAgent: 약관/개인정보 유형({LEGAL_DOC_TYPES}) 청크가 없어 서비스 문서 전체 청크를 검사합니다.")
+
+    def _iter_candidate_batches(self, candidates: Iterator[Tuple[Document, List[str]]]) -> Iterator[str]:
+        """조항 후보를 배치 토큰 예산(scan_batch_token_budget) 단위로 묶어 map 프롬프트에 넣을 텍스트로 내보냅니다."""
+        entries: List[Tuple[str, str]] = [] # (출처 및 사전 필터 표시, 본문)
+        used_tokens = 0
+        for doc, categories in candidates:
+            source_file = doc.metadata.get('source_file', doc.metadata.get('source', 'N/A'))
+            page_num = doc.metadata.get('page', 'N/A')
+            section_title = doc.metadata.get('section_title', 'N/A')
+            entry = (
+                f"(출처: {source_file}, 페이지: {page_num}, 섹션: {section_title}) [사전 필터: {', '.join(categories)}]",
+                doc.page_content.replace(chr(0), '').strip()
             )
+            entry_tokens = estimate_tokens(" ".join(entry)) + 10 # 조항 후보 번호 줄
+            if entries and used_tokens + entry_tokens > self.scan_batch_token_budget: # 예산보다 긴 청크는 단독 배치
+                yield self._format_candidates(entries)
+                entries, used_tokens = [], 0
+            entries.append(entry)
+            used_tokens += entry_tokens
+        if entries:
+            yield self._format_candidates(entries)
+
+    @staticmethod
+    def _format_candidates(entries: List[Tuple[str, str]]) -> str:
+        return "".join(f"  --- 조항 후보 {index + 1} {label} ---\n  {text}\n" for index, (label, text) in enumerate(entries))
+
+    def _map_batch(self, batch_label: str, clause_candidates: str, service_name: str) -> List[Dict[str, Any]]:
+        """조항 후보 배치 하나를 LLM으로 분석하여 탐지된 독소조항(severity 포함) 리스트를 반환합니다. 파싱 실패 시 json.JSONDecodeError."""
+        human_prompt = self.map_user_prompt_template.format(
+            service_name=service_name,
+            batch_label=batch_label,
+            clause_candidates=clause_candidates
+        )
+        messages = [
+            SystemMessage(content=self.map_system_prompt),
+            HumanMessage(content=human_prompt)
+        ]
+        response = self.llm.invoke(messages)
+        try:
+            map_output = self._parse_json_response(response.content)
+            if not isinstance(map_output, dict):
+                raise json.JSONDecodeError("JSON 객체가 아닌 응답", response.content, 0)
+            clauses = map_output.get("toxic_clauses", [])
+        except json.JSONDecodeError:
+            print(f"LLM 원본 응답 (일부, {batch_label}):\n{response.content[:500].replace(chr(0), '')}...")
+            raise
+        return [clause for clause in clauses if isinstance(clause, dict) and clause.get("clause")]
 
-            print(f"ToxicClauseAgent: RAG 쿼리 (키워드: {keyword}) - \"{query[:200]}...\"")
+    @staticmethod
+    def _reduce_findings(findings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        배치별 탐지 결과를 기존 출력 형식(toxic_clauses, overall_clause_risk)으로 병합합니다.
+        같은 조항(공백/대소문자만 다른 같은 인용문)은 위험도가 가장 높은 것 하나만 남기고, 위험도 높은 순(동점이면 문서 순서)으로 정렬합니다.
+        전반적 위험도는 탐지된 조항의 최고 위험도이며, 탐지된 조항이 없으면 '낮음'입니다.
+        """
+        severity_rank = lambda clause: SEVERITY_LEVELS.index(clause.get("severity")) if clause.get("severity") in SEVERITY_LEVELS else 1 # 누락 시 '중간'
+        unique: Dict[str, Dict[str, Any]] = {}
+        for clause in findings:
+            key = re.sub(r"\s+", " ", str(clause["clause"])).strip().lower()
+            if key not in unique or severity_rank(clause) > severity_rank(unique[key]):
+                unique[key] = clause
+        ranked = sorted(unique.values(), key=lambda clause: -severity_rank(clause))
+        overall = SEVERITY_LEVELS[max(map(severity_rank, ranked))] if ranked else SEVERITY_LEVELS[0]
+        return {
+            "toxic_clauses": [
+                {field: clause.get(field, "") for field in ("clause", "risk_reason", "potential_impact", "source_document_reference")}
+                for clause in ranked
+            ],
+            "overall_clause_risk": overall
+        }
+
+    def _scan_exhaustively(self, service_info: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        약관/개인정보 청크 전체를 사전 필터 → 배치별 map LLM 호출(동시 실행) → 병합 순서로 검사합니다.
+        청크를 읽으며 배치가 만들어지는 즉시 제출하되 진행 중인 배치는 동시 호출 수의 2배까지만 두고 끝난 결과부터 모으므로,
+        메모리 사용량은 문서 길이와 무관하고 처리 시간은 동시 호출 수(및 LLM 스케줄러 한도)에 따라 줄어듭니다.
+        분석에 실패한 배치가 있으면 그 배치의 위험도를 알 수 없으므로, '높음'이 확인된 경우가 아니면 전반적 위험도를 '평가 불가'로 둡니다.
+        Returns:
+            (병합된 toxic_clauses/overall_clause_risk, 실패한 배치의 오류 메시지 리스트)
+        """
+        service_name = service_info.get("service_name", "알 수 없음")
+        stats = {"scanned": 0, "candidates": 0}
+        max_pending = self.scan_max_concurrency * 2
+        findings: List[Dict[str, Any]] = []
+        errors: List[str] = []
+        batch_count = 0
 
-            relevant_docs_for_keyword = []
+        def collect(batch_label: str, future: Future) -> None:
             try:
-                if hasattr(self.retriever, 'invoke'):
-                    relevant_docs_for_keyword = self.retriever.invoke(query)
-                elif hasattr(self.retriever, 'get_relevant_documents'):
-                    relevant_docs_for_keyword = self.retriever.get_relevant_documents(query)
-                else:
-                    all_contexts_parts.append(f"\n### '{keyword}' 관련 내용:\n")
-                    all_contexts_parts.append("  - Retriever에 적절한 검색 메소드가 없어 컨텍스트를 가져올 수 없습니다.\n")
-                    continue # 다음 키워드로 넘어감
-            except Exception as e:
-                all_contexts_parts.append(f"\n### '{keyword}' 관련 내용:\n")
-                all_contexts_parts.append(f"  - RAG 컨텍스트 검색 중 오류 발생 ({e})\n")
-                continue # 다음 키워드로 넘어감
-
-            if relevant_docs_for_keyword:
-                found_any_context_overall = True
-                all_contexts_parts.append(f"\n### '{keyword}' 관련 내용:\n")
-                for i, doc in enumerate(relevant_docs_for_keyword):
-                    source_file = doc.metadata.get('source_file', doc.metadata.get('source', 'N/A'))
-                    page_num = doc.metadata.get('page', 'N/A')
-                    section_title = doc.metadata.get('section_title', 'N/A')
-                    content_preview = doc.page_content.replace(chr(0), '').strip()[:300] # NULL 바이트 제거 및 미리보기 길이 조정
-
-                    all_contexts_parts.append(
-                        f"  --- 컨텍스트 {i+1} (출처: {source_file}, 페이지: {page_num}, 섹션: {section_title}) ---\n"
-                        f"  {content_preview}...\n"
-                    )
-                    # 개별 문서 컨텍스트 출력은 너무 길어질 수 있으므로, 필요시 주석 해제하여 디버깅
-                    # print(f"Debug: Keyword='{keyword}', Source='{source_file}', Page='{page_num}', Content='{content_preview[:50]}...'")
-            else:
-                all_contexts_parts.append(f"\n### '{keyword}' 관련 내용:\n")
-                all_contexts_parts.append("  - 해당 키워드로 검색된 관련 법적 내용을 문서에서 찾을 수 없습니다.\n")
-
-        if not found_any_context_overall and len(all_contexts_parts) == 1: # 헤더만 있고, 어떤 키워드 결과도 (오류 포함) 추가되지 않은 경우
-             all_contexts_parts.append("  모든 키워드에 대해 관련된 법적 내용을 문서에서 찾을 수 없었습니다.\n")
-
-        return "".join(all_contexts_parts) + "\n"
+                findings.extend(future.result())
+            except json.JSONDecodeError as e: # 파싱 실패 외의 오류(LLM 캐시 미스, 재시도 후에도 실패한 요청 등)는 그대로 전파
+                errors.append(f"ToxicClauseAgent 오류: [{batch_label}] 독소조항 분석 응답 JSON 파싱 실패 - {e}")
+                print(errors[-1])
+
+        print(f"ToxicClauseAgent: 청크 저장소 전수 검사 중 (경로: {self.chunk_store_dir}, 동시 map 호출 최대 {self.scan_max_concurrency}개)...")
+        pending: Deque[Tuple[str, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=self.scan_max_concurrency, thread_name_prefix="toxic-map") as executor:
+            for batch in self._iter_candidate_batches(self._iter_clause_candidates(stats)):
+                batch_count += 1
+                batch_label = f"배치 {batch_count}"
+                # LLM 요청 우선순위 등 호출 스레드의 컨텍스트 변수를 작업 스레드에서도 유지
+                pending.append((batch_label, executor.submit(contextvars.copy_context().run, self._map_batch, batch_label, batch, service_name)))
+                if len(pending) >= max_pending: # 가장 먼저 제출한 배치가 끝날 때까지 청크 읽기를 멈춤 (backpressure)
+                    collect(*pending.popleft())
+            while pending:
+                collect(*pending.popleft())
+        print(f"ToxicClauseAgent: 청크 {stats['scanned']}개 중 사전 필터 통과 {stats['candidates']}개 → map 호출 {batch_count}회")
+
+        reduced = self._reduce_findings(findings)
+        if errors and reduced["overall_clause_risk"] != SEVERITY_LEVELS[-1]:
+            reduced["overall_clause_risk"] = "평가 불가" # 실패한 배치에 더 위험한 조항이 있을 수 있음
+        print(f"ToxicClauseAgent: 탐지 결과 {len(findings)}개 → 중복 제거 후 독소조항 {len(reduced['toxic_clauses'])}개 (배치 실패 {len(errors)}/{batch_count}개)")
+        return reduced, errors
 
     def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        print("ToxicClauseAgent 실행 시작...")
+        print(f"ToxicClauseAgent 실행 시작 (검사 모드: {self.scan_mode})...")
         # terms_text와 privacy_policy_text를 직접 받는 대신 RAG로 가져옴
         service_info = state.get("service_info", {}) 
         documents = state.get("documents", []) # 분석 대상 PDF 문서 경로
@@ -112,6 +256,15 @@ class ToxicClauseAgent:
             # 이 경우 RAG도 불가능하므로, 기본 오류 반환
             return {"error_message": "독소조항 분석을 위한 정보 부족 (서비스 정보 및 문서 없음)", "toxic_clauses": [], "overall_clause_risk": "평가 불가"}
 
+        if self.scan_mode == SCAN_MODE_EXHAUSTIVE:
+            if self.chunk_store_dir and chunk_store_exists(self.chunk_store_dir):
+                toxic_clause_output, errors = self._scan_exhaustively(service_info)
+                print(f"ToxicClauseAgent: 탐지된 독소 조항 정보 - {toxic_clause_output}")
+                if errors: # 일부 배치만 실패해도 검사가 불완전하므로 오류로 기록 (기존 오류 뒤에 이어 붙이는 것은 그래프 State 리듀서가 처리)
+                    return {**toxic_clause_output, "error_message": "; ".join(errors)}
+                return toxic_clause_output
+            print(f"ToxicClauseAgent 경고: 청크 저장소를 찾을 수 없어(경로: {self.chunk_store_dir}) 키워드 검색 방식으로 분석합니다.")
+
         # RAG 컨텍스트 생성
         rag_context = self._get_rag_context_for_legal_analysis(service_info, documents)
         
@@ -131,14 +284,8 @@ class ToxicClauseAgent:
         
         toxic_clause_output = {}
         try:
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response.content, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-                toxic_clause_output = json.loads(json_str)
-                print("ToxicClauseAgent: LLM으로부터 JSON 응답 파싱 성공.")
-            else:
-                print("ToxicClauseAgent 경고: LLM 응답에서 명확한 JSON 블록을 찾지 못했습니다. 전체 응답 파싱 시도.")
-                toxic_clause_output = json.loads(response.content)
+            toxic_clause_output = self._parse_json_response(response.content)
+            print("ToxicClauseAgent: LLM으로부터 JSON 응답 파싱 성공.")
         except json.JSONDecodeError as e:
             print(f"ToxicClauseAgent 오류: LLM 응답 JSON 파싱 실패 - {e}")
             print(f"LLM 원본 응답 (일부):\n{response.content[:500].replace(chr(0), '')}...")
@@ -150,7 +297,7 @@ class ToxicClauseAgent:
              return {
                 "toxic_clauses": toxic_clause_output.get("toxic_clauses", []),
                 "overall_clause_risk": toxic_clause_output.get("overall_clause_risk", "평가 불가"),
-                "error_message": state.get("error_message", "") + "; " + toxic_clause_output["error_message"] # 기존 오류에 추가
+                "error_message": toxic_clause_output["error_message"] # 기존 오류 뒤에 이어 붙이는 것은 그래프 State 리듀서가 처리
             }
         return {
             "toxic_clauses": toxic_clause_output.get("toxic_clauses", []),
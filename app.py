@@ -3,12 +3,13 @@ import json
 from typing import Dict, List, Any, Optional
 import argparse
 import glob
+from datetime import datetime
 
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
-from graph import build_ethics_assessment_graph, State 
-from indexing.retriever import build_ensemble_retriever 
+# LangChain/LangGraph, 에이전트, 인덱서(PyMuPDF, sentence-transformers) 등 무거운 모듈은
+# 해당 단계가 실제로 실행될 때 함수 안에서 임포트합니다. (--help, 입력 검증 오류는 즉시 응답)
+from indexing.paths import GUIDELINE_DIR, GUIDELINE_PERSIST_DIR, get_service_persist_dir
 
 load_dotenv()
 
@@ -18,7 +19,25 @@ def run_ethics_assessment_pipeline(
     service_url: Optional[str] = None,
     retriever_k_results: int = 3,
     output_dir: str = "./outputs",
-    guideline_keyword: str = "OECD" 
+    guideline_keyword: str = "OECD",
+    use_retrieval_cache: bool = True,
+    guideline_dir: Optional[str] = GUIDELINE_DIR,
+    embedding_device: Optional[str] = None,
+    context_token_budget: Optional[int] = None,
+    llm_cache_mode: str = "off",
+    llm_cache_path: Optional[str] = None,
+    llm_backend: str = "openai",
+    fake_llm_latency: float = 0.0,
+    fake_llm_output_tokens: Optional[int] = None,
+    llm_max_concurrency: int = 4,
+    llm_requests_per_minute: Optional[int] = None,
+    llm_tokens_per_minute: Optional[int] = None,
+    llm_max_retries: int = 3,
+    ethical_risk_mode: str = "single",
+    toxic_clause_mode: str = "keyword",
+    checkpoint_path: Optional[str] = None, # 노드별 State 체크포인트 SQLite 경로 (None이면 기본 경로, 빈 문자열이면 저장하지 않음)
+    resume_run_id: Optional[str] = None, # 이전 실행 ID. 지정하면 마지막으로 성공한 노드 다음부터 이어서 실행
+    checkpoint_keep_runs: int = 20 # 체크포인트를 보관할 최근 실행 수 (이전 실행의 기록은 실행이 끝날 때 삭제)
     ):
     print(f"AI 윤리 리스크 진단 파이프라인 시작 (대상 서비스 폴더: {service_data_dir})...")
 
@@ -30,7 +49,28 @@ def run_ethics_assessment_pipeline(
     if not service_pdf_paths:
         print(f"경고: '{service_data_dir}' 내에 분석할 서비스 PDF 문서가 없습니다.")
 
-    all_document_paths = list(set(service_pdf_paths + (guideline_doc_paths if guideline_doc_paths else [])))
+    # 공유 가이드라인 컬렉션: 가이드라인 폴더를 한 번만 인덱싱해 두고 모든 서비스 진단에서 함께 검색 (변경이 없으면 해시 비교만 수행)
+    guideline_persist_dir = None
+    shared_guideline_paths: List[str] = []
+    if guideline_dir:
+        if os.path.isdir(guideline_dir):
+            print(f"공유 가이드라인 컬렉션 확인 중 (가이드라인 폴더: {guideline_dir}, 컬렉션: {GUIDELINE_PERSIST_DIR})...")
+            try:
+                from indexing.indexer import update_guideline_index, list_pdf_files
+
+                if update_guideline_index(guideline_dir, GUIDELINE_PERSIST_DIR, device=embedding_device):
+                    guideline_persist_dir = GUIDELINE_PERSIST_DIR
+                    shared_guideline_paths = list_pdf_files(guideline_dir)
+                else:
+                    print("경고: 공유 가이드라인 컬렉션 갱신 중 오류가 발생했습니다. 서비스 문서만 검색합니다.")
+            except Exception as e:
+                print(f"오류: 공유 가이드라인 컬렉션 인덱싱 중 예외 발생 - {e}. 서비스 문서만 검색합니다.")
+        else:
+            print(f"경고: 가이드라인 폴더 '{guideline_dir}'를 찾을 수 없어 공유 가이드라인 컬렉션 없이 진행합니다.")
+
+    all_document_paths = list(set(
+        service_pdf_paths + (guideline_doc_paths if guideline_doc_paths else []) + [os.path.abspath(p) for p in shared_guideline_paths]
+    ))
     if not all_document_paths:
          print(f"경고: 분석할 PDF 문서(서비스 또는 가이드라인)가 전혀 없습니다.")
     
@@ -39,11 +79,39 @@ def run_ethics_assessment_pipeline(
         print("오류: 서비스 URL 또는 분석 대상 PDF 문서(서비스 또는 가이드라인) 중 하나 이상은 제공되어야 합니다.")
         return {"error": "Insufficient input for analysis.", "final_report": {"status": "Input Error"}}
         
-    print("LLM 초기화 중 (gpt-4o)...")
-    llm = ChatOpenAI(model="gpt-4o", temperature=0.2, request_timeout=120, max_retries=2)
+    from graph import build_ethics_assessment_graph, State
+    from indexing.retriever import build_ensemble_retriever
+    from utils.llm_cache import DEFAULT_LLM_CACHE_PATH, LLM_CACHE_MODE_REPLAY_ONLY, wrap_llm_with_cache
+    from utils.llm_scheduler import LLMScheduler
+    from utils.run_checkpoint import (
+        DEFAULT_CHECKPOINT_PATH, create_checkpointer, find_resume_point, new_run_id, prune_checkpoints, run_config
+    )
+
+    if llm_backend == "fake":
+        from utils.fake_llm import DEFAULT_FAKE_OUTPUT_TOKENS, FakeChatModel
+
+        print(f"LLM 초기화 중 (오프라인 모의 LLM, 지연: {fake_llm_latency}초)...")
+        llm = FakeChatModel(latency_seconds=fake_llm_latency, output_tokens=fake_llm_output_tokens or DEFAULT_FAKE_OUTPUT_TOKENS)
+    else:
+        from langchain_openai import ChatOpenAI
+
+        print("LLM 초기화 중 (gpt-4o)...")
+        llm_kwargs = {}
+        if llm_cache_mode == LLM_CACHE_MODE_REPLAY_ONLY and not os.getenv("OPENAI_API_KEY"):
+            llm_kwargs["api_key"] = "replay-only" # 재생 모드는 API를 호출하지 않으므로 키 없이도 실행 가능
+        # 재시도는 스케줄러가 요청 한도와 함께 관리 (클라이언트 자체 재시도는 끔)
+        llm = ChatOpenAI(model="gpt-4o", temperature=0.2, request_timeout=120, max_retries=0, **llm_kwargs)
+    # 스케줄러(동시 요청 수, 분당 요청/토큰 한도, 우선순위, 백오프)를 LLM 바로 위에 두고, 캐시는 그 바깥에 두어 캐시 적중은 대기하지 않음
+    llm_scheduler = LLMScheduler(
+        llm,
+        max_concurrency=llm_max_concurrency,
+        requests_per_minute=llm_requests_per_minute,
+        tokens_per_minute=llm_tokens_per_minute,
+        max_retries=llm_max_retries
+    )
+    llm = wrap_llm_with_cache(llm_scheduler, llm_cache_mode, llm_cache_path or DEFAULT_LLM_CACHE_PATH)
 
-    service_name_for_db = os.path.basename(os.path.normpath(service_data_dir))
-    chroma_persist_dir = os.path.join("./vectorstore", f"chroma_{service_name_for_db}") 
+    chroma_persist_dir = get_service_persist_dir(service_data_dir)
     os.makedirs(os.path.dirname(chroma_persist_dir), exist_ok=True)
 
     print(f"Retriever 초기화 중 (k={retriever_k_results}, PDF 소스: {service_data_dir} 및 가이드라인, Chroma DB: {chroma_persist_dir})...")
@@ -53,7 +121,10 @@ def run_ethics_assessment_pipeline(
             retriever_instance = build_ensemble_retriever(
                 pdf_dir=service_data_dir, 
                 chroma_persist_dir=chroma_persist_dir,
-                k_results=retriever_k_results
+                k_results=retriever_k_results,
+                use_retrieval_cache=use_retrieval_cache,
+                guideline_persist_dir=guideline_persist_dir,
+                device=embedding_device
             )
             if retriever_instance is None:
                 print(f"경고: Retriever 초기화 실패. '{service_data_dir}'에 대한 인덱싱이 필요할 수 있습니다.")
@@ -62,6 +133,12 @@ def run_ethics_assessment_pipeline(
     else:
         print(f"정보: 분석할 PDF 문서가 없어 Retriever를 초기화하지 않습니다.")
 
+    checkpointer = None
+    if checkpoint_path != "" or resume_run_id:
+        checkpoint_path = checkpoint_path or DEFAULT_CHECKPOINT_PATH
+        print(f"노드별 체크포인트 저장 위치: {checkpoint_path}")
+        checkpointer = create_checkpointer(checkpoint_path)
+
     print("진단 워크플로우 그래프 빌드 중...")
     graph = None
     try:
@@ -69,7 +146,13 @@ def run_ethics_assessment_pipeline(
             llm=llm, 
             retriever_instance=retriever_instance,
             guideline_keyword_for_ethics=guideline_keyword,
-            report_output_dir=output_dir 
+            report_output_dir=output_dir,
+            ethical_risk_mode=ethical_risk_mode,
+            toxic_clause_mode=toxic_clause_mode,
+            chunk_store_dir=chroma_persist_dir,
+            toxic_scan_max_concurrency=llm_max_concurrency, # map 호출 동시성은 LLM 스케줄러 한도에 맞춤
+            checkpointer=checkpointer,
+            **({"context_token_budget": context_token_budget} if context_token_budget is not None else {}) # 지정하지 않으면 에이전트 기본 예산
         )
     except FileNotFoundError as e: 
         print(f"오류: 그래프 빌드 실패 (필수 프롬프트 파일 누락 가능성) - {e}")
@@ -90,19 +173,38 @@ def run_ethics_assessment_pipeline(
         "overall_clause_risk": "", 
         "recommendations": {}, 
         "final_report": {},
-        "ethical_risk_done": False, 
-        "toxic_clause_done": False,
-        "join_attempt_count": 0, 
         "error_message": None 
     }
     print(f"초기 상태 설정 완료: URL='{service_url_to_analyze}', 전체 문서 수={len(all_document_paths)}")
-    
-    print("진단 워크플로우 실행 시작...")
+
+    output_service_name = os.path.basename(os.path.normpath(service_data_dir))
+    run_id = resume_run_id or new_run_id(output_service_name)
+    graph_input: Optional[State] = initial_state
+    invoke_config = run_config(run_id) if checkpointer is not None else None
     final_state = None
+    if resume_run_id:
+        resume_point = find_resume_point(graph, resume_run_id)
+        if resume_point is None:
+            print(f"오류: 실행 ID '{resume_run_id}'의 체크포인트를 찾을 수 없습니다. (체크포인트 경로: {checkpoint_path})")
+            return {"error": f"No checkpoint found for run: {resume_run_id}", "final_report": {"status": "Resume Error"}}
+        if resume_point.next:
+            print(f"실행 ID '{resume_run_id}' 재개: 마지막으로 성공한 노드 이후({', '.join(resume_point.next)})부터 실행합니다.")
+            graph_input = None # 입력 없이 체크포인트 State에서 이어서 실행
+            invoke_config = resume_point.config
+        else:
+            print(f"실행 ID '{resume_run_id}'는 이미 오류 없이 완료되었습니다. 저장된 최종 상태를 사용합니다.")
+            final_state = dict(resume_point.values)
+    elif checkpointer is not None:
+        print(f"실행 ID: {run_id} (실패 시 --resume {run_id} 로 마지막으로 성공한 노드 이후부터 다시 실행)")
+
+    print("진단 워크플로우 실행 시작...")
     try:
-        final_state = graph.invoke(initial_state, config={'recursion_limit': 150})
+        if final_state is None:
+            final_state = graph.invoke(graph_input, config=invoke_config)
     except Exception as e:
         print(f"오류: 그래프 실행 중 예외 발생 - {e}")
+        if checkpointer is not None:
+            print(f"  (HINT: 같은 옵션에 --resume {run_id} 를 붙여 실행하면 마지막으로 성공한 노드 이후부터 다시 실행합니다.)")
         # 실행 중 오류 발생 시 final_state가 None일 수 있으므로, 오류 상태를 만들어 반환
         final_state = initial_state # 최소한 초기 상태라도 사용
         final_state["error_message"] = f"Graph execution error: {str(e)}"
@@ -113,6 +215,13 @@ def run_ethics_assessment_pipeline(
         }
 
     print("진단 워크플로우 실행 완료.")
+    if checkpointer is not None:
+        pruned_runs = prune_checkpoints(checkpointer, checkpoint_keep_runs)
+        if pruned_runs:
+            print(f"오래된 실행 {pruned_runs}개의 체크포인트 삭제 (최근 {checkpoint_keep_runs}개 실행 보관)")
+    if llm is not llm_scheduler: # LLM 캐시 사용 시 적중률 출력
+        print(llm.summary())
+    print(llm_scheduler.summary())
     
     if final_state is None: # 만약의 경우를 대비한 방어 코드
         print("오류: 그래프 실행 후 최종 상태가 없습니다.")
@@ -121,7 +230,6 @@ def run_ethics_assessment_pipeline(
     # 최종 상태 전체를 output_dir에 저장
     try:
         os.makedirs(output_dir, exist_ok=True)
-        output_service_name = os.path.basename(os.path.normpath(service_data_dir))
         # 최종 상태 JSON 파일명에 타임스탬프 추가 (덮어쓰기 방지)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         final_state_json_path = os.path.join(output_dir, f"ethics_assessment_final_state_{output_service_name}_{timestamp}.json")
@@ -133,6 +241,8 @@ def run_ethics_assessment_pipeline(
 
     # 화면에 요약 및 보고서 경로 출력
     print("\n===== AI 윤리 리스크 진단 결과 요약 =====")
+    if checkpointer is not None:
+        print(f"실행 ID: {run_id}")
     if final_state.get("error_message"): 
         print(f"오류로 인해 파이프라인이 정상적으로 완료되지 못했습니다: {final_state.get('error_message')}")
     
@@ -170,9 +280,13 @@ def run_ethics_assessment_pipeline(
 def main():
     parser = argparse.ArgumentParser(description="AI 윤리 리스크 진단 파이프라인 실행 도구")
     parser.add_argument("--service_data_dir", type=str, required=True, 
-                        help="분석 대상 서비스의 문서(PDF)가 포함된 디렉토리 경로. 윤리 가이드라인 PDF도 이 폴더에 함께 위치해야 RAG 대상이 됩니다.")
+                        help="분석 대상 서비스의 문서(PDF)가 포함된 디렉토리 경로. 윤리 가이드라인은 --guideline_dir의 공유 컬렉션에서 함께 검색되므로 서비스 폴더에 복사할 필요가 없습니다.")
     parser.add_argument("--guideline_docs", nargs="*", default=[],
-                        help="참고할 윤리 가이드라인 PDF 문서 경로 목록 (선택 사항, 공백으로 구분). service_data_dir과 다른 경로에 있을 경우 지정. (현재 Retriever는 service_data_dir만 사용하므로, 가이드라인 문서도 해당 폴더에 위치시키는 것을 권장)")
+                        help="에이전트 쿼리에 참고 문서로 표기할 추가 가이드라인 문서 경로 목록 (선택 사항, 공백으로 구분). RAG 검색 대상은 --guideline_dir의 공유 컬렉션입니다.")
+    parser.add_argument("--guideline_dir", type=str, default=GUIDELINE_DIR,
+                        help=f"모든 서비스가 공유하는 윤리 가이드라인 폴더 (PDF/Markdown, 기본값: {GUIDELINE_DIR}). {GUIDELINE_PERSIST_DIR}에 한 번만 인덱싱되고 변경 시에만 갱신됩니다.")
+    parser.add_argument("--no_shared_guidelines", action="store_true",
+                        help="공유 가이드라인 컬렉션을 사용하지 않고 서비스 컬렉션만 검색합니다.")
     parser.add_argument("--guideline_keyword", type=str, default="OECD",
                         help="EthicalRiskAgent가 RAG 쿼리 시 참조할 가이드라인 문서의 키워드 (기본값: OECD).")
     parser.add_argument("--url", type=str, default=None,
@@ -181,8 +295,50 @@ def main():
                         help="RAG 검색 시 가져올 문서 청크 수 (기본값: 3).")
     parser.add_argument("--output_dir", type=str, default="./outputs", 
                         help="결과 보고서 및 JSON 파일을 저장할 디렉토리 (기본값: ./outputs).")
+    parser.add_argument("--device", type=str, default=None,
+                        help="임베딩 모델 디바이스 (예: cpu, cuda). 지정하지 않으면 사용 가능한 디바이스를 자동 선택합니다.")
+    parser.add_argument("--no_retrieval_cache", action="store_true",
+                        help="실행 간 검색 결과 캐시를 사용하지 않습니다. (기본: 사용, 인덱스가 바뀌면 자동 무효화)")
+    parser.add_argument("--ethical_risk_mode", type=str, default="single", choices=["single", "per_item"],
+                        help="윤리 리스크 평가 방식 (기본값: single). per_item은 4개 리스크 항목을 항목별 컨텍스트로 동시에 평가한 뒤 병합하며, "
+                             "응답 파싱에 실패한 항목만 다시 요청합니다.")
+    parser.add_argument("--toxic_clause_mode", type=str, default="keyword", choices=["keyword", "exhaustive"],
+                        help="독소조항 검사 방식 (기본값: keyword). exhaustive는 약관/개인정보 청크 전체를 어휘 사전 필터에 통과시킨 뒤 "
+                             "후보 청크 배치를 동시에 분석(--llm_max_concurrency)하고 결과를 병합합니다.")
+    parser.add_argument("--resume", type=str, default=None, metavar="RUN_ID",
+                        help="이전 실행 ID. 체크포인트에서 마지막으로 성공한 노드 이후부터 이어서 실행합니다 (이전 실행과 같은 옵션으로 실행).")
+    parser.add_argument("--checkpoint_path", type=str, default=None,
+                        help="노드별 상태 체크포인트 SQLite 파일 경로 (기본값: ./cache/checkpoints.sqlite).")
+    parser.add_argument("--no_checkpoint", action="store_true",
+                        help="노드별 상태 체크포인트를 저장하지 않습니다. (--resume 사용 불가)")
+    parser.add_argument("--checkpoint_keep_runs", type=int, default=20,
+                        help="체크포인트를 보관할 최근 실행 수 (기본값: 20). 실행이 끝날 때 그보다 오래된 실행의 체크포인트를 삭제합니다.")
+    parser.add_argument("--llm_backend", type=str, default="openai", choices=["openai", "fake"],
+                        help="LLM 백엔드 (기본값: openai). fake는 네트워크 없이 에이전트별 형식의 결정적 응답을 돌려주는 모의 LLM으로, "
+                             "인덱싱/검색/그래프/보고서 렌더링을 오프라인에서 프로파일링할 때 사용합니다.")
+    parser.add_argument("--fake_llm_latency", type=float, default=0.0,
+                        help="모의 LLM 호출당 지연 시간(초) (기본값: 0).")
+    parser.add_argument("--fake_llm_tokens", type=int, default=None,
+                        help="모의 LLM 응답 본문의 목표 토큰 수 (기본값: 300).")
+    parser.add_argument("--llm_max_concurrency", type=int, default=4,
+                        help="동시에 보낼 최대 LLM 요청 수 (기본값: 4).")
+    parser.add_argument("--llm_rpm", type=int, default=None,
+                        help="분당 최대 LLM 요청 수 (기본값: 제한 없음).")
+    parser.add_argument("--llm_tpm", type=int, default=None,
+                        help="분당 최대 LLM 토큰 수 (프롬프트 + 응답 추정, 기본값: 제한 없음).")
+    parser.add_argument("--llm_max_retries", type=int, default=3,
+                        help="429/5xx/연결 오류 시 지수 백오프로 재시도할 최대 횟수 (기본값: 3).")
+    parser.add_argument("--llm_cache", type=str, default="off", choices=["off", "read-write", "replay-only"],
+                        help="LLM 응답 캐시 모드 (기본값: off). read-write는 같은 프롬프트의 응답을 재사용하고 새 응답을 저장하며, "
+                             "replay-only는 저장된 응답만 사용하고 캐시에 없는 프롬프트는 즉시 실패합니다(네트워크 호출 없음).")
+    parser.add_argument("--llm_cache_path", type=str, default=None,
+                        help="LLM 응답 캐시 SQLite 파일 경로 (기본값: ./cache/llm_responses.sqlite).")
+    parser.add_argument("--context_token_budget", type=int, default=None,
+                        help="윤리 리스크/독소조항 에이전트가 프롬프트에 넣을 RAG 컨텍스트의 최대 토큰 수 (기본값: 6000, 0이면 제한 없음). 중복 청크는 예산과 무관하게 한 번만 포함됩니다.")
 
     args = parser.parse_args()
+    if args.resume and args.no_checkpoint:
+        parser.error("--resume은 --no_checkpoint와 함께 사용할 수 없습니다.")
     
     guideline_absolute_paths = [os.path.abspath(p) for p in args.guideline_docs] if args.guideline_docs else []
 
@@ -192,7 +348,25 @@ def main():
         service_url=args.url,
         retriever_k_results=args.k_results,
         output_dir=os.path.abspath(args.output_dir), 
-        guideline_keyword=args.guideline_keyword
+        guideline_keyword=args.guideline_keyword,
+        use_retrieval_cache=not args.no_retrieval_cache,
+        guideline_dir=None if args.no_shared_guidelines else os.path.abspath(args.guideline_dir),
+        embedding_device=args.device,
+        context_token_budget=args.context_token_budget,
+        llm_cache_mode=args.llm_cache,
+        llm_cache_path=args.llm_cache_path,
+        llm_backend=args.llm_backend,
+        fake_llm_latency=args.fake_llm_latency,
+        fake_llm_output_tokens=args.fake_llm_tokens,
+        llm_max_concurrency=args.llm_max_concurrency,
+        llm_requests_per_minute=args.llm_rpm,
+        llm_tokens_per_minute=args.llm_tpm,
+        llm_max_retries=args.llm_max_retries,
+        ethical_risk_mode=args.ethical_risk_mode,
+        toxic_clause_mode=args.toxic_clause_mode,
+        checkpoint_path="" if args.no_checkpoint else args.checkpoint_path,
+        resume_run_id=args.resume,
+        checkpoint_keep_runs=args.checkpoint_keep_runs
     )
 
 if __name__ == "__main__":
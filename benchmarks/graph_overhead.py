@@ -0,0 +1,111 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 진단 그래프의 오케스트레이션 오버헤드 측정
+내용 : 오프라인 모의 LLM(utils/fake_llm.py)과 리트리버 없이 진단 그래프를 여러 번 실행하여 실행당 시간을 재고,
+       같은 에이전트를 그래프 없이 순서대로 직접 호출한 시간과 비교하여 LangGraph 실행(superstep, 상태 병합, 라우팅)에 드는 오버헤드를 출력합니다.
+       실행된 superstep 수와 노드 실행 순서도 함께 출력하므로 병렬 브랜치의 fan-in이 대기 루프 없이 한 번에 이루어지는지 확인할 수 있습니다.
+       --latency를 주면 LLM 호출당 지연을 넣어 병렬 브랜치로 줄어드는 실행 시간도 확인할 수 있습니다.
+실행 : python benchmarks/graph_overhead.py [--runs 20] [--latency 0.0]
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import contextlib
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+DEFAULT_RUNS = 20
+PROMPT_DIR = os.path.join(PROJECT_ROOT, "prompts")
+
+
+def initial_state():
+    return {
+        "service_url": "",
+        "documents": ["모의_서비스_이용약관.pdf"],
+        "service_info": {},
+        "ethical_risks": {},
+        "toxic_clauses": [],
+        "overall_clause_risk": "",
+        "recommendations": {},
+        "final_report": {},
+        "error_message": None,
+    }
+
+
+def time_runs(run, runs: int):
+    """run()을 runs회 실행한 시간(초) 리스트. 에이전트 로그는 출력하지 않음."""
+    timings = []
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="진단 그래프 오케스트레이션 오버헤드 측정")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help=f"측정 실행 횟수 (기본값: {DEFAULT_RUNS})")
+    parser.add_argument("--latency", type=float, default=0.0, help="모의 LLM 호출당 지연 시간(초) (기본값: 0)")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_ROOT) # 에이전트가 ./prompts 상대 경로를 사용
+    with contextlib.redirect_stdout(io.StringIO()):
+        from graph import build_ethics_assessment_graph, merge_error_messages
+        from agents import ServiceAnalysisAgent, EthicalRiskAgent, ToxicClauseAgent, ImprovementAgent, ReportComposerAgent
+        from utils.fake_llm import FakeChatModel
+
+    llm = FakeChatModel(latency_seconds=args.latency)
+    with tempfile.TemporaryDirectory() as output_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            graph = build_ethics_assessment_graph(llm=llm, retriever_instance=None, report_output_dir=output_dir)
+            agents = [
+                ServiceAnalysisAgent(llm=llm, retriever=None, prompt_dir=PROMPT_DIR),
+                EthicalRiskAgent(llm=llm, retriever=None, prompt_dir=PROMPT_DIR),
+                ToxicClauseAgent(llm=llm, retriever=None, prompt_dir=PROMPT_DIR),
+                ImprovementAgent(llm=llm, prompt_dir=PROMPT_DIR),
+                ReportComposerAgent(llm=llm, prompt_dir=PROMPT_DIR, output_dir=output_dir),
+            ]
+
+        def run_direct():
+            """같은 에이전트를 그래프 없이 순서대로 호출 (상태 병합은 그래프와 같은 규칙)"""
+            state = initial_state()
+            for agent in agents:
+                update = agent(state)
+                error_message = merge_error_messages(state.get("error_message"), update.pop("error_message", None))
+                state.update(update, error_message=error_message)
+            return state
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            events = list(graph.stream(initial_state(), stream_mode="debug"))
+            final_state = graph.invoke(initial_state())
+        tasks = [(event["step"], event["payload"]["name"]) for event in events if event["type"] == "task"]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_direct() # 워밍업 (지연 임포트)
+        direct_timings = time_runs(run_direct, args.runs)
+        graph_timings = time_runs(lambda: graph.invoke(initial_state()), args.runs)
+
+    steps = {}
+    for step, name in tasks:
+        steps.setdefault(step, []).append(name)
+    print(f"그래프 실행: superstep {len(steps)}개, 노드 실행 {len(tasks)}회")
+    for step, names in sorted(steps.items()):
+        print(f"  step {step}: {', '.join(names)}")
+    print(f"최종 상태: 보고서 상태 '{final_state.get('final_report', {}).get('status')}', 오류 {final_state.get('error_message')!r}")
+
+    direct_median = statistics.median(direct_timings)
+    graph_median = statistics.median(graph_timings)
+    print(f"\n에이전트 직접 호출: 중간값 {direct_median * 1000:.1f}ms, 최소 {min(direct_timings) * 1000:.1f}ms ({args.runs}회, LLM 지연 {args.latency}초)")
+    print(f"그래프 실행      : 중간값 {graph_median * 1000:.1f}ms, 최소 {min(graph_timings) * 1000:.1f}ms ({args.runs}회, LLM 지연 {args.latency}초)")
+    print(f"실행당 오케스트레이션 오버헤드 (그래프 - 직접 호출, 중간값): {(graph_median - direct_median) * 1000:+.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
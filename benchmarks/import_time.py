@@ -0,0 +1,101 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : CLI 시작 시간(임포트 시간) 예산 확인
+내용 : `python app.py --help`와 입력 검증 오류 경로를 여러 번 실행하여 최소/중간 실행 시간이 예산 이내인지 확인하고,
+       `import app` 직후 무거운 의존성(LangChain, LangGraph, openai, weasyprint, sentence-transformers 등)이
+       임포트되지 않았는지 검사합니다. 예산을 넘거나 무거운 모듈이 임포트되면 종료 코드 1을 반환합니다.
+실행 : python benchmarks/import_time.py [--budget 1.0] [--runs 5]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_SECONDS = 1.0
+DEFAULT_RUNS = 5
+
+# app.py 임포트 시점에 로드되면 안 되는 모듈 (해당 단계가 실행될 때만 임포트되어야 함)
+HEAVY_MODULES = [
+    "langchain",
+    "langchain_core",
+    "langchain_openai",
+    "langchain_community",
+    "langchain_huggingface",
+    "langgraph",
+    "openai",
+    "sentence_transformers",
+    "torch",
+    "chromadb",
+    "fitz",
+    "weasyprint",
+    "markdown",
+    "graph",
+    "agents.service_analysis_agent",
+    "indexing.indexer",
+    "indexing.retriever",
+]
+
+COMMANDS = {
+    "--help": [sys.executable, "app.py", "--help"],
+    "입력 검증 오류": [sys.executable, "app.py", "--service_data_dir", os.path.join(PROJECT_ROOT, "__missing_service_dir__")],
+}
+
+
+def time_command(command, runs: int):
+    """명령을 runs번 실행하여 실행 시간(초) 리스트를 반환합니다."""
+    durations = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        subprocess.run(command, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        durations.append(time.perf_counter() - started_at)
+    return durations
+
+
+def find_heavy_imports():
+    """`import app` 후 sys.modules에 올라온 무거운 모듈 목록을 반환합니다."""
+    probe = (
+        "import sys, json, app; "
+        f"heavy = {HEAVY_MODULES!r}; "
+        "print(json.dumps([name for name in heavy if name in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=PROJECT_ROOT, capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"app 임포트 실패: {result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="app.py 시작 시간 예산 확인")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help=f"명령별 중간 실행 시간 예산(초) (기본값: {DEFAULT_BUDGET_SECONDS}).")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                        help=f"명령별 반복 실행 횟수 (기본값: {DEFAULT_RUNS}).")
+    args = parser.parse_args()
+
+    failed = False
+    for label, command in COMMANDS.items():
+        durations = time_command(command, args.runs)
+        median = statistics.median(durations)
+        status = "✅" if median <= args.budget else "❌"
+        failed |= median > args.budget
+        print(f"{status} {label}: 중간값 {median:.3f}초, 최소 {min(durations):.3f}초 (예산 {args.budget:.2f}초, {args.runs}회)")
+
+    heavy_imports = find_heavy_imports()
+    if heavy_imports:
+        failed = True
+        print(f"❌ `import app` 시점에 임포트된 무거운 모듈: {', '.join(heavy_imports)}")
+    else:
+        print("✅ `import app` 시점에 무거운 모듈이 임포트되지 않았습니다.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,19 @@
-from indexing.indexer import index_documents
-from indexing.retriever import build_ensemble_retriever
+# 인덱서/리트리버는 PyMuPDF, LangChain, sentence-transformers 등 무거운 의존성을 임포트하므로
+# 패키지 임포트 시에는 불러오지 않고, 속성에 처음 접근할 때 해당 모듈을 임포트합니다. (PEP 562)
+import importlib
 
-__all__ = [
-    'index_documents',
-    'build_ensemble_retriever'
-]
\ No newline at end of file
+_LAZY_EXPORTS = {
+    'index_documents': 'indexing.indexer',
+    'build_ensemble_retriever': 'indexing.retriever',
+    'get_embedding_model': 'indexing.model_registry',
+    'warm_up': 'indexing.model_registry'
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module_name), name)
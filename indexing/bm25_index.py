@@ -0,0 +1,239 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 인덱싱 시점에 미리 구축하여 메모리 매핑으로 로드하는 BM25 역색인
+내용 : 청크 저장소(chunks.jsonl)로부터 어휘 사전, 포스팅 리스트, 문서 길이를 numpy 배열로 저장합니다.
+       로드 시 배열은 np.load(mmap_mode="r")로 매핑되므로 시작 시간이 청크 수에 비례하지 않고,
+       검색 시에는 질의어의 포스팅만 읽어 점수를 계산합니다. (rank_bm25 BM25Okapi와 동일한 점수식)
+       메타데이터 필터가 주어지면 필터 열(filter_<필드>.npy)로 만든 마스크로 포스팅을 먼저 거른 뒤 점수를 계산합니다.
+"""
+
+import os
+import json
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from indexing.chunk_store import get_chunk_store_path, record_to_document
+from indexing.metadata_filter import FILTER_FIELDS, build_row_mask, encode_filter_columns
+from indexing.paths import replace_directory, restore_interrupted_replace
+
+BM25_DIR_NAME = "bm25"
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25 # 음수 IDF를 평균 IDF의 이 비율로 대체 (rank_bm25 기본값)
+
+
+def tokenize(text: str) -> List[str]:
+    """LangChain BM25Retriever 기본 전처리와 동일한 공백 기준 토큰화"""
+    return text.split()
+
+
+def get_bm25_index_dir(persist_dir: str) -> str:
+    return os.path.join(persist_dir, BM25_DIR_NAME)
+
+
+def bm25_index_exists(persist_dir: str) -> bool:
+    restore_interrupted_replace(get_bm25_index_dir(persist_dir))
+    return os.path.exists(os.path.join(get_bm25_index_dir(persist_dir), "meta.json"))
+
+
+def build_bm25_index(persist_dir: str, k1: float = BM25_K1, b: float = BM25_B, epsilon: float = BM25_EPSILON) -> int:
+    """
+    청크 저장소를 읽어 BM25 역색인을 구축하고 persist_dir/bm25/ 에 저장합니다.
+
+    Returns:
+        색인된 청크 수.
+    """
+    store_path = get_chunk_store_path(persist_dir)
+    postings: Dict[str, Tuple[List[int], List[int]]] = {} # 단어 → (문서 번호 리스트, 단어 빈도 리스트)
+    doc_lengths: List[int] = []
+    chunk_offsets: List[int] = [] # 청크 저장소 내 각 레코드의 바이트 오프셋 (문서 지연 로딩용)
+    chunk_metadatas: List[Dict[str, Any]] = [] # 필터 필드만 보관
+
+    if os.path.exists(store_path):
+        with open(store_path, "rb") as f:
+            offset = f.tell()
+            for raw_line in iter(f.readline, b""):
+                line_offset, offset = offset, offset + len(raw_line)
+                if not raw_line.strip():
+                    continue
+                record = json.loads(raw_line)
+                doc_index = len(doc_lengths)
+                tokens = tokenize(record.get("text", ""))
+                term_freqs: Dict[str, int] = {}
+                for token in tokens:
+                    term_freqs[token] = term_freqs.get(token, 0) + 1
+                for term, freq in term_freqs.items():
+                    doc_ids, tfs = postings.setdefault(term, ([], []))
+                    doc_ids.append(doc_index)
+                    tfs.append(freq)
+                doc_lengths.append(len(tokens))
+                chunk_offsets.append(line_offset)
+                metadata = record.get("metadata", {})
+                chunk_metadatas.append({field: metadata.get(field) for field in FILTER_FIELDS})
+
+    num_docs = len(doc_lengths)
+    vocab = {term: term_id for term_id, term in enumerate(sorted(postings))}
+    postings_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    for term, term_id in vocab.items():
+        postings_offsets[term_id + 1] = len(postings[term][0])
+    postings_offsets = np.cumsum(postings_offsets)
+
+    postings_docs = np.empty(int(postings_offsets[-1]), dtype=np.int32)
+    postings_tfs = np.empty(int(postings_offsets[-1]), dtype=np.float32)
+    for term, term_id in vocab.items():
+        start, end = postings_offsets[term_id], postings_offsets[term_id + 1]
+        postings_docs[start:end] = postings[term][0]
+        postings_tfs[start:end] = postings[term][1]
+
+    # rank_bm25 BM25Okapi와 동일한 IDF 계산 (음수 IDF는 epsilon * 평균 IDF로 대체)
+    doc_freqs = np.diff(postings_offsets).astype(np.float64)
+    idf = np.log(num_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+    if len(idf):
+        average_idf = float(idf.mean())
+        idf[idf < 0] = epsilon * average_idf
+
+    index_dir = get_bm25_index_dir(persist_dir)
+    tmp_dir = index_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "postings_offsets.npy"), postings_offsets)
+    np.save(os.path.join(tmp_dir, "postings_docs.npy"), postings_docs)
+    np.save(os.path.join(tmp_dir, "postings_tfs.npy"), postings_tfs)
+    np.save(os.path.join(tmp_dir, "idf.npy"), idf.astype(np.float32))
+    np.save(os.path.join(tmp_dir, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.float32))
+    np.save(os.path.join(tmp_dir, "chunk_offsets.npy"), np.asarray(chunk_offsets, dtype=np.int64))
+    filter_codes, filter_values = encode_filter_columns(chunk_metadatas)
+    for field, column in filter_codes.items():
+        np.save(os.path.join(tmp_dir, f"filter_{field}.npy"), column)
+    with open(os.path.join(tmp_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "num_docs": num_docs,
+            "avgdl": float(np.mean(doc_lengths)) if doc_lengths else 0.0,
+            "k1": k1,
+            "b": b,
+            "epsilon": epsilon,
+            "filter_values": filter_values,
+        }, f, ensure_ascii=False)
+
+    replace_directory(tmp_dir, index_dir)
+    return num_docs
+
+
+class BM25Index:
+    """디스크에 저장된 BM25 역색인을 메모리 매핑으로 로드하여 검색합니다."""
+
+    def __init__(self, persist_dir: str):
+        index_dir = get_bm25_index_dir(persist_dir)
+        restore_interrupted_replace(index_dir)
+        self.chunk_store_path = get_chunk_store_path(persist_dir)
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(index_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+        self.num_docs: int = meta["num_docs"]
+        self.avgdl: float = meta["avgdl"]
+        self.k1: float = meta["k1"]
+        self.b: float = meta["b"]
+
+        def _mmap(name: str) -> np.ndarray:
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        self.postings_offsets = _mmap("postings_offsets.npy")
+        self.postings_docs = _mmap("postings_docs.npy")
+        self.postings_tfs = _mmap("postings_tfs.npy")
+        self.idf = _mmap("idf.npy")
+        self.doc_lengths = _mmap("doc_lengths.npy")
+        self.chunk_offsets = _mmap("chunk_offsets.npy")
+        self.filter_values: Dict[str, List[str]] = meta.get("filter_values", {})
+        self.filter_codes: Dict[str, np.ndarray] = {
+            field: _mmap(f"filter_{field}.npy")
+            for field in self.filter_values
+            if os.path.exists(os.path.join(index_dir, f"filter_{field}.npy"))
+        }
+
+    def filter_mask(self, metadata_filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """필터를 만족하는 문서의 불리언 마스크 (필터가 없으면 None)"""
+        return build_row_mask(self.filter_codes, self.filter_values, self.num_docs, metadata_filter)
+
+    def score_postings(self, query: str, row_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        질의어의 포스팅만 읽어 BM25 점수를 계산합니다. row_mask가 주어지면 해당 문서의 포스팅만 점수를 계산합니다.
+
+        Returns:
+            (점수가 0보다 큰 문서 번호 배열, 해당 점수 배열).
+        """
+        term_ids = [self.vocab[token] for token in tokenize(query) if token in self.vocab]
+        if not term_ids or self.num_docs == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+        doc_parts, score_parts = [], []
+        for term_id in term_ids: # 질의에 같은 단어가 반복되면 rank_bm25와 같이 중복 가산
+            start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+            docs = np.asarray(self.postings_docs[start:end])
+            tfs = np.asarray(self.postings_tfs[start:end])
+            if row_mask is not None:
+                keep = row_mask[docs]
+                docs, tfs = docs[keep], tfs[keep]
+            norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_lengths[docs]) / self.avgdl)
+            doc_parts.append(docs)
+            score_parts.append(self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + norm))
+
+        docs = np.concatenate(doc_parts)
+        scores = np.concatenate(score_parts)
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        summed = np.zeros(len(unique_docs), dtype=np.float32)
+        np.add.at(summed, inverse, scores)
+        return unique_docs, summed
+
+    def search(self, query: str, k: int, metadata_filter: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        """상위 k개의 (문서 번호, 점수)를 점수 내림차순(동점 시 문서 번호 순)으로 반환합니다. 필터는 점수 계산 전에 적용됩니다."""
+        row_mask = self.filter_mask(metadata_filter)
+        if row_mask is not None and not row_mask.any():
+            return []
+        docs, scores = self.score_postings(query, row_mask)
+        if len(docs) == 0:
+            return []
+        order = np.lexsort((docs, -scores))[:k]
+        return [(int(docs[i]), float(scores[i])) for i in order]
+
+    def get_document(self, doc_index: int) -> Document:
+        """청크 저장소에서 해당 레코드만 읽어 Document로 반환합니다."""
+        with open(self.chunk_store_path, "rb") as f:
+            f.seek(int(self.chunk_offsets[doc_index]))
+            return record_to_document(json.loads(f.readline()))
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """BM25Index를 사용하는 LangChain 리트리버 (EnsembleRetriever에 BM25Retriever 대신 사용)"""
+
+    index: Any
+    k: int = 4
+
+    def batch_search_documents(
+        self, queries: List[str], metadata_filters: Optional[List[Optional[Dict[str, Any]]]] = None
+    ) -> List[List[Document]]:
+        """
+        여러 쿼리를 검색하고, 여러 쿼리에 걸쳐 등장한 문서는 청크 저장소에서 한 번만 읽습니다.
+        metadata_filters는 쿼리와 같은 순서의 쿼리별 필터 리스트입니다. (None이면 필터 없음)
+        """
+        metadata_filters = metadata_filters or [None] * len(queries)
+        hits = [self.index.search(query, self.k, metadata_filter) for query, metadata_filter in zip(queries, metadata_filters)]
+        loaded: Dict[int, Document] = {}
+        for doc_index, _ in (hit for query_hits in hits for hit in query_hits):
+            if doc_index not in loaded:
+                loaded[doc_index] = self.index.get_document(doc_index)
+        return [[loaded[doc_index] for doc_index, _ in query_hits] for query_hits in hits]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        return [self.index.get_document(doc_index) for doc_index, _ in self.index.search(query, self.k)]
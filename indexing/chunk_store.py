@@ -0,0 +1,90 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 인덱서가 생성한 정규(canonical) 청크 코퍼스의 저장 및 로드
+내용 : 청크 텍스트, 메타데이터, 청크 ID를 컬렉션 디렉토리의 chunks.jsonl에 한 줄씩 저장합니다.
+       Chroma 컬렉션과 BM25 인덱스가 모두 같은 청크에서 만들어지므로 두 검색 경로의 청크 경계가 일치하고,
+       리트리버 생성 시 PDF를 다시 파싱할 필요가 없습니다.
+"""
+
+import os
+import json
+from typing import Dict, Any, Iterator, List, Optional, Set
+
+from langchain_core.documents import Document
+
+CHUNK_STORE_FILE_NAME = "chunks.jsonl"
+
+
+def get_chunk_store_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, CHUNK_STORE_FILE_NAME)
+
+
+def chunk_store_exists(persist_dir: str) -> bool:
+    return os.path.exists(get_chunk_store_path(persist_dir))
+
+
+def iter_chunk_records(persist_dir: str) -> Iterator[Dict[str, Any]]:
+    """청크 저장소의 레코드({"chunk_id", "text", "metadata"})를 파일 순서대로 하나씩 읽습니다."""
+    store_path = get_chunk_store_path(persist_dir)
+    if not os.path.exists(store_path):
+        return
+    with open(store_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def record_to_document(record: Dict[str, Any]) -> Document:
+    metadata = dict(record.get("metadata", {}))
+    metadata.setdefault("chunk_id", record.get("chunk_id"))
+    return Document(page_content=record.get("text", ""), metadata=metadata)
+
+
+def load_chunk_documents(persist_dir: str) -> List[Document]:
+    """청크 저장소 전체를 LangChain Document 리스트로 로드합니다. 저장소가 없으면 빈 리스트."""
+    return [record_to_document(record) for record in iter_chunk_records(persist_dir)]
+
+
+class ChunkStoreWriter:
+    """
+    청크 저장소를 임시 파일에 새로 쓴 뒤 commit() 시 원자적으로 교체하는 작성기.
+    증분 인덱싱 시 변경되지 않은 파일의 레코드는 copy_existing()으로 기존 저장소에서 그대로 옮겨옵니다.
+    """
+
+    def __init__(self, persist_dir: str):
+        os.makedirs(persist_dir, exist_ok=True)
+        self.persist_dir = persist_dir
+        self.store_path = get_chunk_store_path(persist_dir)
+        self.tmp_path = self.store_path + ".tmp"
+        self._file = open(self.tmp_path, "w", encoding="utf-8")
+        self.num_records = 0
+
+    def copy_existing(self, keep_files: Optional[Set[str]] = None) -> int:
+        """기존 저장소에서 source_file이 keep_files에 속한 레코드만 복사합니다. (None이면 전부)"""
+        copied = 0
+        for record in iter_chunk_records(self.persist_dir):
+            if keep_files is None or record.get("metadata", {}).get("source_file") in keep_files:
+                self._write_record(record)
+                copied += 1
+        return copied
+
+    def write(self, chunk: Document) -> None:
+        self._write_record({
+            "chunk_id": chunk.metadata.get("chunk_id"),
+            "text": chunk.page_content,
+            "metadata": chunk.metadata,
+        })
+
+    def _write_record(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.num_records += 1
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self.tmp_path, self.store_path)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
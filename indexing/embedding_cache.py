@@ -0,0 +1,205 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 청크 텍스트 해시 기반의 영구 임베딩 캐시
+내용 : (모델명, 정규화된 청크 텍스트 해시)를 키로 임베딩 벡터를 디스크에 저장하여,
+       재인덱싱이나 서비스 간에 공유되는 문서(예: OECD 가이드라인)의 모델 추론을 건너뜁니다.
+       벡터는 float16/float32 raw 배열 파일(vectors.bin)에, 키 → 행 번호는 index.json에 저장되며,
+       최대 항목 수를 넘으면 가장 오래 사용되지 않은 항목부터 max_entries의 90%까지 제거(LRU)합니다.
+       index.json은 조회/추가마다 쓰지 않고 인덱싱 실행이 끝날 때 flush()로 한 번 저장합니다.
+"""
+
+import os
+import re
+import json
+import hashlib
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_DIR = "./vectorstore/embedding_cache"
+DEFAULT_MAX_ENTRIES = 200_000 # all-MiniLM-L6-v2(384차원, float16) 기준 약 150MB
+EVICT_LOW_WATER_RATIO = 0.9 # 정리 시 max_entries의 이 비율까지 줄여, 가득 찬 뒤에도 배치마다 벡터 파일을 재작성하지 않도록 함
+VECTORS_FILE_NAME = "vectors.bin"
+INDEX_FILE_NAME = "index.json"
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text_for_cache(text: str) -> str:
+    """유니코드 정규화(NFC) 및 공백 축약으로 사소한 차이만 있는 청크가 같은 키를 갖도록 합니다."""
+    return _WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_cache_key(text: str) -> str:
+    return hashlib.sha256(normalize_text_for_cache(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """모델별 디렉토리에 임베딩 벡터를 저장하는 크기 제한 디스크 캐시 (단일 프로세스 사용 가정)"""
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        dtype: str = "float16",
+        max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        model_slug = re.sub(r"[^0-9A-Za-z._-]+", "_", model_name)
+        self.model_name = model_name
+        self.cache_path = os.path.join(cache_dir, model_slug)
+        self.vectors_path = os.path.join(self.cache_path, VECTORS_FILE_NAME)
+        self.index_path = os.path.join(self.cache_path, INDEX_FILE_NAME)
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max_entries
+
+        self.dim: Optional[int] = None
+        self.entries: Dict[str, List[int]] = {} # 키 → [행 번호, 마지막 사용 tick]
+        self.num_rows = 0
+        self.tick = 0
+        self._dirty = False # 마지막 저장 이후 entries/tick이 바뀌었는지 여부
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("dtype") != self.dtype.name or index.get("model_name") != self.model_name:
+                print(f"⚠️  경고: 임베딩 캐시 '{self.cache_path}'의 설정이 달라 캐시를 새로 시작합니다.")
+                return
+            self.dim = index.get("dim")
+            self.entries = index.get("entries", {})
+            self.num_rows = index.get("num_rows", 0)
+            self.tick = index.get("tick", 0)
+            self._truncate_unindexed_rows()
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  경고: 임베딩 캐시 인덱스 로드 실패 ({e}). 캐시를 새로 시작합니다.")
+            self.dim, self.entries, self.num_rows, self.tick = None, {}, 0, 0
+
+    def _truncate_unindexed_rows(self) -> None:
+        """flush 전에 중단되어 인덱스에 기록되지 않은 채 벡터 파일 끝에 남은 행을 잘라 행 번호를 인덱스와 맞춥니다."""
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return
+        indexed_size = self.num_rows * self.dim * self.dtype.itemsize
+        if os.path.getsize(self.vectors_path) > indexed_size:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(indexed_size)
+
+    def _save_index(self) -> None:
+        os.makedirs(self.cache_path, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model_name": self.model_name,
+                "dtype": self.dtype.name,
+                "dim": self.dim,
+                "num_rows": self.num_rows,
+                "tick": self.tick,
+                "entries": self.entries,
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def flush(self) -> None:
+        """변경된 인덱스(새 항목, 사용 시점)를 디스크에 저장합니다. 인덱싱 실행이 끝날 때 한 번 호출합니다."""
+        if self._dirty:
+            self._save_index()
+
+    def _read_rows(self, rows: List[int]) -> np.ndarray:
+        vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self.num_rows, self.dim))
+        return np.asarray(vectors[rows], dtype=np.float32)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """캐시에 있는 키의 벡터만 {키: 벡터}로 반환하고 사용 시점을 갱신합니다."""
+        hit_keys = [key for key in dict.fromkeys(keys) if key in self.entries]
+        if not hit_keys or self.dim is None:
+            return {}
+        self.tick += 1
+        for key in hit_keys:
+            self.entries[key][1] = self.tick
+        self._dirty = True
+        vectors = self._read_rows([self.entries[key][0] for key in hit_keys])
+        return {key: vector.tolist() for key, vector in zip(hit_keys, vectors)}
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """새 벡터를 파일 끝에 추가합니다. 최대 항목 수를 넘으면 LRU로 정리합니다. (인덱스는 flush()에서 저장)"""
+        new_items = {key: vector for key, vector in items.items() if key not in self.entries}
+        if not new_items:
+            return
+        matrix = np.asarray(list(new_items.values()), dtype=self.dtype)
+        if self.dim is None:
+            self.dim = int(matrix.shape[1])
+        elif matrix.shape[1] != self.dim:
+            print(f"⚠️  경고: 임베딩 차원({matrix.shape[1]})이 캐시 차원({self.dim})과 달라 캐시에 저장하지 않습니다.")
+            return
+
+        os.makedirs(self.cache_path, exist_ok=True)
+        with open(self.vectors_path, "ab") as f:
+            f.write(matrix.tobytes())
+        self.tick += 1
+        for offset, key in enumerate(new_items):
+            self.entries[key] = [self.num_rows + offset, self.tick]
+        self.num_rows += len(new_items)
+        self._dirty = True
+
+        if len(self.entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self) -> None:
+        """가장 최근에 사용된 항목을 max_entries의 EVICT_LOW_WATER_RATIO 비율만큼만 남기고 벡터 파일을 압축(재작성)합니다."""
+        keep_count = int(self.max_entries * EVICT_LOW_WATER_RATIO)
+        keep = sorted(self.entries.items(), key=lambda item: item[1][1], reverse=True)[:keep_count]
+        keep.sort(key=lambda item: item[1][0]) # 파일 내 순서대로 읽기
+        kept_vectors = self._read_rows([entry[0] for _, entry in keep]).astype(self.dtype)
+
+        tmp_path = self.vectors_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(kept_vectors.tobytes())
+        os.replace(tmp_path, self.vectors_path)
+
+        evicted = len(self.entries) - len(keep)
+        self.entries = {key: [new_row, entry[1]] for new_row, (key, entry) in enumerate(keep)}
+        self.num_rows = len(keep)
+        self._save_index() # 벡터 파일의 행 번호가 바뀌었으므로 인덱스도 바로 맞춤
+        print(f"🧹 임베딩 캐시 정리: {evicted}개 항목 제거 (남은 항목: {self.num_rows})")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain Embeddings 래퍼. embed_documents 호출 시 캐시에 없는 텍스트만 기반 모델로 임베딩합니다.
+    (쿼리 임베딩은 캐시하지 않고 그대로 위임)
+    """
+
+    def __init__(self, base_embeddings: Embeddings, cache: EmbeddingCache):
+        self.base_embeddings = base_embeddings
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_cache_key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        miss_texts_by_key: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in miss_texts_by_key:
+                miss_texts_by_key[key] = text
+
+        if miss_texts_by_key:
+            new_vectors = self.base_embeddings.embed_documents(list(miss_texts_by_key.values()))
+            # 캐시 적중 여부와 관계없이 같은 텍스트가 같은 벡터를 갖도록 캐시 dtype 정밀도로 맞춤
+            rounded = np.asarray(new_vectors, dtype=self.cache.dtype).astype(np.float32)
+            computed = {key: vector.tolist() for key, vector in zip(miss_texts_by_key.keys(), rounded)}
+            self.cache.put_many(computed)
+            cached.update(computed)
+
+        self.hits += len(texts) - len(miss_texts_by_key)
+        self.misses += len(miss_texts_by_key)
+        return [list(cached[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base_embeddings.embed_query(text)
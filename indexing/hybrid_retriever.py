@@ -0,0 +1,210 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 여러 쿼리를 한 번에 처리하는 하이브리드(벡터 + BM25) 리트리버
+내용 : 에이전트가 수십 개의 RAG 쿼리를 순차적으로 invoke하는 대신 batch_retrieve(queries)로
+       쿼리 임베딩을 한 번의 forward pass로 계산하고, 벡터 저장소(Chroma 또는 flat)에 한 번의 행렬 질의를 보낸 뒤,
+       BM25 점수를 쿼리별로 계산하여 EnsembleRetriever와 같은 가중 RRF(Reciprocal Rank Fusion)로 결합합니다.
+       쿼리별 메타데이터 필터(source_file, doc_type, section_title)는 두 검색 경로 모두에서 점수 계산 전에 적용됩니다.
+       MultiCollectionRetriever는 서비스별 컬렉션과 공유 가이드라인 컬렉션처럼 여러 컬렉션을 함께 검색하여 다시 RRF로 결합합니다.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import json
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from indexing.metadata_filter import matches_filter, normalize_filter
+
+RRF_C = 60 # EnsembleRetriever 기본 RRF 상수
+
+
+def _fusion_key(doc: Document) -> str:
+    """같은 청크를 식별하는 키 (청크 ID가 없으면 본문으로 식별 - EnsembleRetriever와 동일)"""
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+def weighted_rrf(ranked_lists: List[List[Document]], weights: List[float], c: int = RRF_C) -> List[Document]:
+    """
+    여러 검색 결과 리스트를 가중 RRF로 결합합니다. 결합 점수는 metadata['fused_score']에 기록됩니다.
+
+    Returns:
+        결합 점수 내림차순으로 정렬된 (중복 제거된) Document 리스트.
+    """
+    scores: Dict[str, float] = {}
+    docs_by_key: Dict[str, Document] = {}
+    for docs, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(docs, start=1):
+            key = _fusion_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rank + c)
+            docs_by_key.setdefault(key, doc)
+    fused = []
+    for key in sorted(scores, key=lambda k: scores[k], reverse=True):
+        doc = docs_by_key[key]
+        fused.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "fused_score": scores[key]}))
+    return fused
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    벡터 검색(Chroma 또는 flat)과 BM25 검색을 결합하는 리트리버.
+    invoke(query)는 단일 쿼리용이며, batch_retrieve(queries)는 여러 쿼리를 한 번의 배치 연산으로 처리합니다.
+    """
+
+    vectorstore: Any # indexing.vector_store 백엔드 (ChromaVectorStore 또는 FlatVectorStore)
+    embedding: Any # LangChain Embeddings
+    lexical_retriever: Any = None # BM25IndexRetriever 또는 BM25Retriever (없으면 벡터 검색만 사용)
+    k: int = 3
+    weights: List[float] = [0.6, 0.4] # [벡터, BM25]
+    c: int = RRF_C
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """모든 쿼리를 한 번의 embed_documents 호출(한 번의 forward pass)로 임베딩하고 L2 정규화합니다."""
+        vectors = np.asarray(self.embedding.embed_documents(queries), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _vector_search_batch(
+        self, queries: List[str], metadata_filters: List[Optional[Dict[str, Any]]]
+    ) -> List[List[Document]]:
+        """고유 쿼리만 한 번에 임베딩하고, 같은 필터를 쓰는 쿼리끼리 묶어 벡터 저장소에 질의합니다."""
+        unique_queries = list(dict.fromkeys(queries))
+        vectors = self._embed_queries(unique_queries)
+        row_of = {query: row for row, query in enumerate(unique_queries)}
+
+        groups: Dict[str, List[int]] = {}
+        for position, metadata_filter in enumerate(metadata_filters):
+            groups.setdefault(json.dumps(normalize_filter(metadata_filter), sort_keys=True), []).append(position)
+
+        results: List[List[Document]] = [[] for _ in queries]
+        for positions in groups.values():
+            group_vectors = vectors[[row_of[queries[position]] for position in positions]]
+            for position, docs in zip(positions, self.vectorstore.query(group_vectors, self.k, metadata_filters[positions[0]])):
+                results[position] = docs
+        return results
+
+    def _lexical_search_batch(
+        self, queries: List[str], metadata_filters: List[Optional[Dict[str, Any]]]
+    ) -> List[List[Document]]:
+        if self.lexical_retriever is None:
+            return [[] for _ in queries]
+        if hasattr(self.lexical_retriever, "batch_search_documents"):
+            return self.lexical_retriever.batch_search_documents(queries, metadata_filters)
+        # 필터를 지원하지 않는 메모리 내 BM25Retriever: 검색 후 필터링
+        results = self.lexical_retriever.batch(queries)
+        return [
+            [doc for doc in docs if matches_filter(doc.metadata, metadata_filter)]
+            for docs, metadata_filter in zip(results, metadata_filters)
+        ]
+
+    def batch_retrieve(
+        self,
+        queries: List[str],
+        metadata_filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+        keyword_queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        """
+        여러 쿼리를 한 번에 검색합니다.
+
+        Args:
+            queries: 검색 쿼리 리스트 (벡터 검색에 사용).
+            metadata_filters: 쿼리와 같은 순서의 쿼리별 메타데이터 필터 리스트
+                (예: {"doc_type": ["terms", "privacy"]}, None이면 필터 없음).
+            keyword_queries: 쿼리와 같은 순서의 BM25용 키워드 쿼리 리스트 (None이면 queries를 그대로 사용).
+
+        Returns:
+            입력 쿼리 순서와 같은, 쿼리별 결합(RRF) 결과 Document 리스트의 리스트.
+        """
+        if not queries:
+            return []
+        metadata_filters = metadata_filters or [None] * len(queries)
+        vector_results = self._vector_search_batch(queries, metadata_filters)
+        if self.lexical_retriever is None:
+            return [weighted_rrf([docs], [self.weights[0]], self.c) for docs in vector_results]
+        lexical_results = self._lexical_search_batch(keyword_queries or queries, metadata_filters)
+        return [
+            weighted_rrf([vector_docs, lexical_docs], self.weights, self.c)
+            for vector_docs, lexical_docs in zip(vector_results, lexical_results)
+        ]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        return self.batch_retrieve([query])[0]
+
+
+class MultiCollectionRetriever(BaseRetriever):
+    """
+    여러 컬렉션의 리트리버(HybridRetriever 또는 CachedRetriever)를 함께 검색하고 결과를 RRF로 결합하는 리트리버.
+    컬렉션이 담고 있는 문서 유형(collection_doc_types)을 알고 있으면, doc_type 필터와 겹치지 않는 컬렉션은 검색하지 않습니다.
+    (예: 가이드라인 전용 쿼리는 공유 가이드라인 컬렉션만, 서비스 문서 쿼리는 서비스 컬렉션만 검색)
+    """
+
+    retrievers: List[Any]
+    collection_doc_types: List[Optional[List[str]]] = [] # 리트리버별 문서 유형 목록 (None이면 알 수 없음 → 항상 검색)
+    c: int = RRF_C
+    max_concurrency: int = 4 # 동시에 검색할 최대 컬렉션 수 (1이면 순차 검색)
+
+    def _should_search(self, collection_index: int, metadata_filter: Optional[Dict[str, Any]]) -> bool:
+        doc_types = self.collection_doc_types[collection_index] if collection_index < len(self.collection_doc_types) else None
+        normalized = normalize_filter(metadata_filter)
+        if doc_types is None or normalized is None or "doc_type" not in normalized:
+            return True
+        return bool(set(normalized["doc_type"]) & set(doc_types))
+
+    def batch_retrieve(
+        self,
+        queries: List[str],
+        metadata_filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+        keyword_queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        """컬렉션별로 해당되는 쿼리만 모아 batch_retrieve를 동시에 호출하고, 쿼리별 결과를 컬렉션 간 RRF로 결합합니다."""
+        if not queries:
+            return []
+        metadata_filters = metadata_filters or [None] * len(queries)
+        collection_jobs = []
+        for collection_index, retriever in enumerate(self.retrievers):
+            positions = [
+                position for position, metadata_filter in enumerate(metadata_filters)
+                if self._should_search(collection_index, metadata_filter)
+            ]
+            if positions:
+                collection_jobs.append((retriever, positions))
+
+        def search_collection(job) -> List[List[Document]]:
+            retriever, positions = job
+            return retriever.batch_retrieve(
+                [queries[position] for position in positions],
+                [metadata_filters[position] for position in positions],
+                keyword_queries=[keyword_queries[position] for position in positions] if keyword_queries else None
+            )
+
+        # 컬렉션 검색(쿼리 임베딩, 벡터 질의, BM25, 캐시 조회)은 서로 독립적이므로 동시에 실행 (결과는 컬렉션 순서대로 결합)
+        if len(collection_jobs) > 1 and self.max_concurrency > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(collection_jobs)), thread_name_prefix="collection") as executor:
+                collection_results = list(executor.map(search_collection, collection_jobs))
+        else:
+            collection_results = [search_collection(job) for job in collection_jobs]
+
+        per_query_results: List[List[List[Document]]] = [[] for _ in queries]
+        for (_, positions), results in zip(collection_jobs, collection_results):
+            for position, docs in zip(positions, results):
+                per_query_results[position].append(docs)
+
+        merged = []
+        for ranked_lists in per_query_results:
+            if len(ranked_lists) == 1:
+                merged.append(ranked_lists[0])
+            else:
+                merged.append(weighted_rrf(ranked_lists, [1.0] * len(ranked_lists), self.c))
+        return merged
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        return self.batch_retrieve([query])[0]
@@ -1,68 +1,83 @@
 """
 작성자 : kp
 작성일 : 2025-05-18 (수정: 2025-05-19)
-목적 : PDF 문서 청크 및 벡터 임베딩 후 ChromaDB 저장
-내용 : PyMuPDFLoader + RecursiveCharacterTextSplitter + HuggingFaceEmbeddings 기반으로
-       PDF 문서를 읽고 폰트 크기 기반으로 추론된 섹션 제목을 포함하여 chroma에 저장
+목적 : PDF 문서 청크 및 벡터 임베딩 후 벡터 저장소(ChromaDB 또는 flat) 저장
+내용 : PyMuPDF(fitz) + RecursiveCharacterTextSplitter + HuggingFaceEmbeddings 기반으로
+       PDF 문서를 읽고 폰트 크기 기반으로 추론된 섹션 제목을 포함하여 chroma에 저장.
+       각 페이지는 get_text("dict") 한 번으로 본문 텍스트와 섹션 제목을 함께 추출합니다.
+       컬렉션 옆의 매니페스트(index_manifest.json)를 기준으로 신규/변경 파일만 증분 인덱싱합니다.
+       페이지 → 청크 → 임베딩 배치 → Chroma upsert 단계가 제너레이터로 연결되어 메모리 사용량이 코퍼스 크기와 무관합니다.
+       같은 청크를 chunks.jsonl(청크 저장소)에도 기록하고, 이를 기반으로 메모리 매핑용 BM25 역색인(bm25/)을 구축합니다.
+       벡터 저장소는 VECTOR_BACKEND(또는 --vector_backend)로 선택합니다. (chroma: Chroma 컬렉션, flat: 메모리 매핑 행렬)
+       윤리 가이드라인(guidelines/, PDF 및 Markdown)은 모든 서비스가 공유하는 별도 컬렉션(./vectorstore/guidelines)에 한 번만 인덱싱합니다.
+실행 : python -m indexing.indexer --service_data_dir ./data/daglo [--rebuild] [--vector_backend flat]
+       python -m indexing.indexer --guidelines  (공유 가이드라인 컬렉션)
 """
 
 import os
+import re
 import glob
-from typing import List, Dict, Any
+import time
+import uuid
+import argparse
+from typing import List, Dict, Any, Callable, Deque, Iterable, Iterator, Optional, Tuple
 import shutil
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 import fitz # PyMuPDF
+import numpy as np
 
 # Langchain 라이브러리 임포트 (환경에 따라 langchain_community 등으로 변경될 수 있음)
-from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from dotenv import load_dotenv
 
+from indexing.bm25_index import build_bm25_index, bm25_index_exists, get_bm25_index_dir
+from indexing.chunk_store import ChunkStoreWriter, chunk_store_exists, get_chunk_store_path, CHUNK_STORE_FILE_NAME
+from indexing.embedding_cache import (
+    CachedEmbeddings, EmbeddingCache,
+    DEFAULT_CACHE_DIR as DEFAULT_EMBEDDING_CACHE_DIR, DEFAULT_MAX_ENTRIES as DEFAULT_EMBEDDING_CACHE_MAX_ENTRIES
+)
+from indexing.manifest import (
+    compute_file_hash, make_chunk_id, load_manifest, save_manifest, new_manifest, diff_manifest, get_manifest_path
+)
+from indexing.model_registry import get_embedding_model
+from indexing.paths import GUIDELINE_DIR, GUIDELINE_PERSIST_DIR, get_service_persist_dir
+from indexing.metadata_filter import infer_doc_type, DOC_TYPE_RULES_VERSION, DOC_TYPE_GUIDELINE
+from indexing.vector_store import open_vector_store, detect_vector_backend, VECTOR_BACKENDS, DEFAULT_VECTOR_BACKEND, FLAT_DTYPES
+
 load_dotenv()
 
 # 📁 설정
 PDF_DIR = "./data/claude/"  # indexer.py 파일 위치 기준 상대 경로
 CHROMA_DIR = "./vectorstore/chroma_claude" # indexer.py 파일 위치 기준 상대 경로
+SOURCE_FILE_PATTERNS = ("*.pdf", "*.md") # 인덱싱 대상 파일 (Markdown은 제목 단위 섹션을 페이지처럼 처리)
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DEVICE: Optional[str] = None # 임베딩 디바이스 ("cpu", "cuda" 등, None이면 자동 선택)
 CHUNK_SIZE = 250
 CHUNK_OVERLAP = 50
+NUM_WORKERS = max(1, (os.cpu_count() or 1) - 1) # PDF 병렬 파싱 프로세스 수 (1이면 순차 처리)
+PAGES_PER_TASK = 50 # 병렬 파싱 시 하나의 작업이 처리할 최대 페이지 수 (큰 PDF를 여러 워커로 분할)
+EMBEDDING_CACHE_DIR: Optional[str] = DEFAULT_EMBEDDING_CACHE_DIR # 청크 임베딩 디스크 캐시 경로 (None이면 사용 안 함)
+EMBEDDING_CACHE_MAX_ENTRIES = DEFAULT_EMBEDDING_CACHE_MAX_ENTRIES
+EMBEDDING_BATCH_SIZE = 64 # 한 번에 임베딩할 청크 수 (CPU 전용 호스트에서 처리량을 보며 조정)
+NORMALIZE_EMBEDDINGS = True # L2 정규화 (코사인 유사도 기반 검색)
+CHROMA_UPSERT_BATCH_SIZE = 1000 # Chroma upsert 1회당 최대 청크 수 (Chroma 최대 배치 크기 이하)
+VECTOR_BACKEND = DEFAULT_VECTOR_BACKEND # 벡터 저장소 백엔드: "chroma" 또는 "flat" (메모리 매핑 행렬 + 정확 검색)
+FLAT_VECTOR_DTYPE = "float16" # flat 백엔드의 벡터 저장 형식: "float16" 또는 "int8"
 # 폰트 기반 제목 추론을 위한 임계값
 TITLE_FONT_SIZE_MIN_DIFFERENCE = 1.5 # 일반 텍스트보다 최소 이만큼 커야 제목으로 간주 (절대값)
 TITLE_FONT_SIZE_MIN_RATIO = 1.15    # 일반 텍스트보다 최소 이 비율만큼 커야 제목으로 간주 (비율)
 
 
-def extract_section_title_by_font_heuristic(page: fitz.Page) -> str:
+def _infer_section_title(
+    font_counts: Dict[float, int],
+    text_spans_by_size: Dict[float, List[Dict[str, Any]]]
+) -> str:
     """
-    주어진 fitz.Page 객체에서 폰트 크기 기반 휴리스틱을 사용하여 섹션 제목을 추론합니다.
+    폰트 크기별 문자 수 히스토그램과 스팬 목록으로부터 섹션 제목을 추론합니다.
     가장 큰 폰트 크기를 가진 텍스트를 제목으로 간주하되, 일반 텍스트와 충분히 구분될 때만 인정합니다.
     """
-    font_counts: Dict[float, int] = {} # 폰트 크기별 문자 수 카운트
-    text_spans_by_size: Dict[float, List[Dict[str, Any]]] = {} # 폰트 크기별 텍스트 스팬 저장
-
-    blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
-    if not blocks:
-        return "N/A"
-
-    for block in blocks:
-        if block["type"] == 0:  # Text block
-            for line in block["lines"]:
-                for span in line["spans"]:
-                    size = round(span["size"], 2) # 소수점 둘째 자리까지 반올림하여 유사 폰트 그룹화
-                    text = span["text"].strip()
-                    if not text: # 빈 텍스트는 무시
-                        continue
-                    
-                    font_counts[size] = font_counts.get(size, 0) + len(text)
-                    
-                    if size not in text_spans_by_size:
-                        text_spans_by_size[size] = []
-                    text_spans_by_size[size].append({
-                        "text": text,
-                        "y": span["bbox"][1], # 정렬을 위한 y 좌표
-                        "x": span["bbox"][0]  # 정렬을 위한 x 좌표
-                    })
-
     if not font_counts:
         return "N/A"
 
@@ -71,9 +86,7 @@ def extract_section_title_by_font_heuristic(page: fitz.Page) -> str:
     body_text_size = sorted_font_counts[0][0] if sorted_font_counts else 0.0
 
     # 페이지에서 가장 큰 폰트 크기 찾기
-    largest_font_size_on_page = 0.0
-    if font_counts:
-        largest_font_size_on_page = max(font_counts.keys())
+    largest_font_size_on_page = max(font_counts.keys())
     
     # 제목으로 간주할 수 있는지 여부 판단
     # 1. 페이지에 다양한 폰트 크기가 사용되었고,
@@ -99,72 +112,335 @@ def extract_section_title_by_font_heuristic(page: fitz.Page) -> str:
     return "N/A" # 그 외의 경우 제목을 찾지 못함
 
 
-def load_documents_from_dir(pdf_dir: str) -> List[Dict[str, Any]]: # Langchain Document는 Dict[str, Any]로 표현될 수 있음
-    """폴더 내 모든 PDF 문서를 불러오고 폰트 크기 기반으로 추론된 섹션 제목을 메타데이터에 추가"""
-    all_docs_with_metadata = []
+def extract_page_content(page: fitz.Page) -> Tuple[str, str]:
+    """
+    fitz.Page의 get_text("dict") 결과를 한 번만 순회하여 페이지 본문 텍스트와
+    폰트 크기 기반 휴리스틱으로 추론한 섹션 제목을 함께 반환합니다.
+    본문 텍스트는 PyMuPDFLoader가 생성하는 페이지 텍스트(page.get_text())와 동일한 형태로 재구성됩니다.
+
+    Returns:
+        (페이지 텍스트, 섹션 제목) 튜플.
+    """
+    font_counts: Dict[float, int] = {} # 폰트 크기별 문자 수 카운트
+    text_spans_by_size: Dict[float, List[Dict[str, Any]]] = {} # 폰트 크기별 텍스트 스팬 저장
+    text_lines: List[str] = [] # 페이지 본문 재구성을 위한 라인 목록
+
+    blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
+    for block in blocks:
+        if block["type"] != 0:  # Text block만 처리
+            continue
+        for line in block["lines"]:
+            line_parts = []
+            for span in line["spans"]:
+                raw_text = span["text"]
+                line_parts.append(raw_text)
+
+                text = raw_text.strip()
+                if not text: # 빈 텍스트는 폰트 통계에서 무시
+                    continue
+                size = round(span["size"], 2) # 소수점 둘째 자리까지 반올림하여 유사 폰트 그룹화
+                font_counts[size] = font_counts.get(size, 0) + len(text)
+                text_spans_by_size.setdefault(size, []).append({
+                    "text": text,
+                    "y": span["bbox"][1], # 정렬을 위한 y 좌표
+                    "x": span["bbox"][0]  # 정렬을 위한 x 좌표
+                })
+            text_lines.append("".join(line_parts) + "\n")
+
+    return "".join(text_lines).strip(), _infer_section_title(font_counts, text_spans_by_size)
+
+
+def extract_section_title_by_font_heuristic(page: fitz.Page) -> str:
+    """
+    주어진 fitz.Page 객체에서 폰트 크기 기반 휴리스틱을 사용하여 섹션 제목을 추론합니다.
+    (하위 호환용. 본문 텍스트도 필요하다면 extract_page_content를 사용하세요.)
+    """
+    return extract_page_content(page)[1]
+
+
+def _build_page_metadata(fitz_doc: fitz.Document, pdf_path: str, page_index: int) -> Dict[str, Any]:
+    """PyMuPDFLoader와 동일한 키 구성의 페이지 메타데이터를 생성합니다."""
+    metadata: Dict[str, Any] = {
+        k: v for k, v in (fitz_doc.metadata or {}).items()
+        if isinstance(v, (str, int, float)) # Chroma 메타데이터는 스칼라 값만 허용
+    }
+    metadata.update({
+        "source": pdf_path,
+        "file_path": pdf_path,
+        "page": page_index,
+        "total_pages": len(fitz_doc),
+    })
+    return metadata
+
+
+def _extract_pdf_page_range(pdf_path: str, start_page: int = 0, end_page: Optional[int] = None) -> List[Document]:
+    """
+    PDF의 [start_page, end_page) 범위 페이지를 Document 리스트로 추출합니다.
+    ProcessPoolExecutor 워커에서 실행될 수 있도록 모듈 최상위 함수로 정의합니다.
+    """
+    file_name = os.path.basename(pdf_path)
+    page_docs: List[Document] = []
+    with fitz.open(pdf_path) as fitz_doc:
+        last_page = len(fitz_doc) if end_page is None else min(end_page, len(fitz_doc))
+        for i in range(start_page, last_page):
+            page_text, section_title = extract_page_content(fitz_doc[i])
+            metadata = _build_page_metadata(fitz_doc, pdf_path, i)
+            metadata['source_file'] = file_name # 파일명 메타데이터 추가
+            metadata['doc_type'] = infer_doc_type(file_name) # 검색 필터용 문서 유형 (guideline/privacy/terms/service)
+            metadata['section_title'] = section_title
+            page_docs.append(Document(page_content=page_text, metadata=metadata))
+    return page_docs
+
+
+MARKDOWN_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+
+def _is_markdown_file(file_path: str) -> bool:
+    return file_path.lower().endswith(".md")
+
+
+def _extract_markdown_sections(md_path: str) -> List[Document]:
+    """
+    Markdown 파일을 제목(#) 단위 섹션으로 나누어 Document 리스트로 추출합니다.
+    각 섹션은 PDF의 페이지처럼 취급되며(page = 섹션 순번), 섹션 제목은 제목 텍스트를 그대로 사용합니다.
+    """
+    file_name = os.path.basename(md_path)
+    with open(md_path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    headings = list(MARKDOWN_HEADING_PATTERN.finditer(text))
+    boundaries = [0] + [match.start() for match in headings if match.start() > 0] + [len(text)]
+    titles_by_start = {match.start(): match.group(2).strip() for match in headings}
+
+    sections = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        section_text = text[start:end].strip()
+        if section_text:
+            sections.append((titles_by_start.get(start, "N/A"), section_text))
+
+    section_docs: List[Document] = []
+    for i, (section_title, section_text) in enumerate(sections):
+        metadata: Dict[str, Any] = {
+            "source": md_path,
+            "file_path": md_path,
+            "page": i,
+            "total_pages": len(sections),
+            "source_file": file_name,
+            "doc_type": infer_doc_type(file_name),
+            "section_title": section_title,
+        }
+        section_docs.append(Document(page_content=section_text, metadata=metadata))
+    return section_docs
+
+
+def _safe_extract_pdf_page_range(task: Tuple[str, int, Optional[int]]) -> Tuple[List[Document], Optional[str]]:
+    """워커 예외가 전체 인덱싱을 중단시키지 않도록 (문서 리스트, 오류 메시지)로 감싸서 반환합니다. (Markdown 파일도 처리)"""
+    file_path, start_page, end_page = task
+    try:
+        if _is_markdown_file(file_path):
+            return _extract_markdown_sections(file_path), None
+        return _extract_pdf_page_range(file_path, start_page, end_page), None
+    except Exception as e:
+        return [], str(e)
+
+
+def _plan_extraction_tasks(pdf_files: List[str], pages_per_task: int) -> List[Tuple[str, int, Optional[int]]]:
+    """
+    PDF 파일 목록을 (경로, 시작 페이지, 끝 페이지) 작업 단위로 나눕니다.
+    pages_per_task보다 긴 PDF는 여러 페이지 범위로 분할되어 여러 워커에 분산됩니다.
+    """
+    tasks: List[Tuple[str, int, Optional[int]]] = []
+    for pdf_path in pdf_files:
+        if _is_markdown_file(pdf_path):
+            tasks.append((pdf_path, 0, None)) # Markdown은 분할하지 않음
+            continue
+        try:
+            with fitz.open(pdf_path) as fitz_doc:
+                page_count = len(fitz_doc)
+        except Exception:
+            tasks.append((pdf_path, 0, None)) # 페이지 수를 알 수 없으면 통째로 작업에 맡기고 워커에서 오류 보고
+            continue
+        if pages_per_task <= 0 or page_count <= pages_per_task:
+            tasks.append((pdf_path, 0, None))
+            continue
+        for start_page in range(0, page_count, pages_per_task):
+            tasks.append((pdf_path, start_page, min(start_page + pages_per_task, page_count)))
+    return tasks
+
+
+def list_pdf_files(pdf_dir: str) -> List[str]:
+    """폴더 내 인덱싱 대상 파일(PDF, Markdown) 경로를 정렬된 순서로 반환합니다. (결정적 순서 보장)"""
     if not os.path.exists(pdf_dir) or not os.path.isdir(pdf_dir):
         print(f"⚠️  경고: PDF 디렉토리 '{pdf_dir}'를 찾을 수 없거나 디렉토리가 아닙니다.")
-        return all_docs_with_metadata
+        return []
+    pdf_files = sorted(
+        path for pattern in SOURCE_FILE_PATTERNS for path in glob.glob(os.path.join(pdf_dir, pattern))
+    )
+    if not pdf_files:
+        print(f"ℹ️  정보: PDF 디렉토리 '{pdf_dir}' 내에 PDF/Markdown 파일이 없습니다.")
+    return pdf_files
+
 
-    pdf_files = glob.glob(os.path.join(pdf_dir, "*.pdf"))
+def load_documents_from_dir(
+    pdf_dir: str,
+    num_workers: int = NUM_WORKERS,
+    pages_per_task: int = PAGES_PER_TASK
+) -> List[Document]:
+    """
+    폴더 내 모든 PDF 문서를 불러오고 폰트 크기 기반으로 추론된 섹션 제목을 메타데이터에 추가.
+    각 PDF는 한 번만 열리며, 페이지별 텍스트와 섹션 제목은 동일한 get_text("dict") 결과에서 추출됩니다.
+
+    Args:
+        pdf_dir: PDF 문서가 있는 디렉토리.
+        num_workers: 병렬 파싱에 사용할 프로세스 수. 1 이하이면 현재 프로세스에서 순차 처리.
+        pages_per_task: 병렬 모드에서 하나의 작업으로 처리할 최대 페이지 수 (큰 PDF 분할용).
+
+    Returns:
+        파일명 정렬 순서 → 페이지 순서로 정렬된 페이지별 Document 리스트 (청크 ID가 실행마다 동일하도록 결정적 순서 보장).
+    """
+    pdf_files = list_pdf_files(pdf_dir)
     if not pdf_files:
-        print(f"ℹ️  정보: PDF 디렉토리 '{pdf_dir}' 내에 PDF 파일이 없습니다.")
-        return all_docs_with_metadata
+        return []
+    return load_documents_from_files(pdf_files, num_workers=num_workers, pages_per_task=pages_per_task)
 
-    print(f"📂 총 {len(pdf_files)}개의 PDF 파일 감지.")
-    for pdf_path in pdf_files:
+
+def _bounded_ordered_map(executor: ProcessPoolExecutor, fn: Callable, tasks: List[Any], max_pending: int) -> Iterator[Any]:
+    """
+    executor.map과 같이 입력 순서대로 결과를 내보내되, 동시에 제출된 작업 수를 max_pending으로 제한합니다.
+    소비자(임베딩/업서트)가 느리면 파싱도 함께 멈추므로(backpressure) 메모리 사용량이 일정하게 유지됩니다.
+    """
+    pending: Deque[Future] = deque()
+    task_iter = iter(tasks)
+    for task in task_iter:
+        pending.append(executor.submit(fn, task))
+        if len(pending) >= max_pending:
+            break
+    while pending:
+        result = pending.popleft().result()
+        next_task = next(task_iter, None)
+        if next_task is not None:
+            pending.append(executor.submit(fn, next_task))
+        yield result
+
+
+def iter_page_documents(
+    pdf_files: List[str],
+    num_workers: int = NUM_WORKERS,
+    pages_per_task: int = PAGES_PER_TASK,
+    failed_files: Optional[set] = None
+) -> Iterator[Document]:
+    """
+    PDF 파일 목록을 (입력 순서 → 페이지 순서대로) 페이지별 Document로 하나씩 생성합니다.
+    한 번에 메모리에 올라가는 페이지는 진행 중인 작업(최대 워커 수 x 2개, 작업당 pages_per_task 페이지)뿐입니다.
+
+    Args:
+        pdf_files: 처리할 PDF 경로 리스트.
+        num_workers: 병렬 파싱에 사용할 프로세스 수. 1 이하이면 현재 프로세스에서 순차 처리.
+        pages_per_task: 하나의 작업으로 처리할 최대 페이지 수 (큰 PDF 분할용).
+        failed_files: 전달되면 처리 중 오류가 발생한 파일명을 기록합니다.
+    """
+    tasks = _plan_extraction_tasks(pdf_files, pages_per_task)
+    if num_workers <= 1:
+        results: Iterator[Tuple[List[Document], Optional[str]]] = map(_safe_extract_pdf_page_range, tasks)
+        yield from _iter_task_results(tasks, results, failed_files)
+        return
+
+    print(f"⚙️  병렬 파싱 시작 (워커 수: {num_workers}, 작업 수: {len(tasks)}, 작업당 최대 페이지: {pages_per_task})...")
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        results = _bounded_ordered_map(executor, _safe_extract_pdf_page_range, tasks, max_pending=num_workers * 2)
+        yield from _iter_task_results(tasks, results, failed_files)
+
+
+def _iter_task_results(
+    tasks: List[Tuple[str, int, Optional[int]]],
+    results: Iterator[Tuple[List[Document], Optional[str]]],
+    failed_files: Optional[set]
+) -> Iterator[Document]:
+    """작업 결과를 순서대로 풀어 페이지 Document를 내보내고, 파일 단위 진행 상황을 출력합니다."""
+    current_file, current_pages = None, 0
+    for (pdf_path, start_page, _), (page_docs, error) in zip(tasks, results):
         file_name = os.path.basename(pdf_path)
-        print(f"\n📄 '{file_name}' 로드 및 처리 중...")
-        
-        fitz_doc = None # fitz.Document 객체 초기화
-        try:
-            fitz_doc = fitz.open(pdf_path)
-            
-            # Langchain의 PyMuPDFLoader를 사용하여 페이지별 Document 객체 생성
-            loader = PyMuPDFLoader(pdf_path)
-            docs_from_loader = loader.load() # 페이지별 Document 객체 리스트
-            
-            for i, lc_doc_page in enumerate(docs_from_loader):
-                lc_doc_page.metadata['source_file'] = file_name # 파일명 메타데이터 추가
-                
-                if i < len(fitz_doc):
-                    fitz_page = fitz_doc[i] # 현재 페이지의 fitz.Page 객체
-                    section_title = extract_section_title_by_font_heuristic(fitz_page)
-                    lc_doc_page.metadata['section_title'] = section_title
-                else:
-                    # PyMuPDFLoader가 로드한 페이지 수와 fitz_doc의 페이지 수가 다를 경우 방어 코드
-                    lc_doc_page.metadata['section_title'] = "N/A (페이지 인덱스 불일치)"
-                    
-            all_docs_with_metadata.extend(docs_from_loader)
-            print(f"  '{file_name}' 로드 완료. (페이지 수: {len(docs_from_loader)})")
-
-        except Exception as e:
-            print(f"❌ 에러: '{file_name}' 처리 중 오류 발생: {e}")
-        finally:
-            if fitz_doc:
-                fitz_doc.close() # fitz.Document 객체 닫기
-            
-    return all_docs_with_metadata
+        if file_name != current_file:
+            if current_file is not None:
+                print(f"  '{current_file}' 로드 완료. (페이지 수: {current_pages})")
+            print(f"\n📄 '{file_name}' 로드 및 처리 중...")
+            current_file, current_pages = file_name, 0
+        if error:
+            print(f"❌ 에러: '{file_name}' (시작 페이지 {start_page}) 처리 중 오류 발생: {error}")
+            if failed_files is not None:
+                failed_files.add(file_name)
+            continue
+        current_pages += len(page_docs)
+        yield from page_docs
+    if current_file is not None:
+        print(f"  '{current_file}' 로드 완료. (페이지 수: {current_pages})")
+
+
+def load_documents_from_files(
+    pdf_files: List[str],
+    num_workers: int = NUM_WORKERS,
+    pages_per_task: int = PAGES_PER_TASK
+) -> List[Document]:
+    """주어진 PDF 파일 목록을 (입력 순서대로) 페이지별 Document로 로드합니다. 인자는 load_documents_from_dir와 동일."""
+    print(f"📂 총 {len(pdf_files)}개의 PDF 파일 감지.")
+    return list(iter_page_documents(pdf_files, num_workers=num_workers, pages_per_task=pages_per_task))
 
 
-def split_documents(
-    docs: List[Dict[str, Any]], # Langchain Document
-    chunk_size: int = CHUNK_SIZE,
-    chunk_overlap: int = CHUNK_OVERLAP
-) -> List[Dict[str, Any]]: # Langchain Document
-    """문서를 청크 단위로 분할 (메타데이터는 상속됨)"""
-    splitter = RecursiveCharacterTextSplitter(
+def _make_text_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", ". ", " ", ""], # 다양한 구분자 사용
         length_function=len, # 문자열 길이 계산 함수
     )
+
+
+def split_documents(
+    docs: List[Document],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+) -> List[Document]:
+    """문서를 청크 단위로 분할 (메타데이터는 상속됨)"""
+    splitter = _make_text_splitter(chunk_size, chunk_overlap)
     chunked_docs = splitter.split_documents(docs)
     print(f"✂️  총 {len(docs)}개 원본 페이지(문서)를 {len(chunked_docs)}개의 청크로 분할 완료.")
     return chunked_docs
 
 
-def print_chunking_examples(chunked_docs: List[Dict[str, Any]], num_examples: int = 3, preview_length: int = 100):
+def iter_chunks(
+    page_docs: Iterable[Document],
+    file_hashes: Dict[str, str],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+) -> Iterator[Document]:
+    """
+    페이지 Document 스트림을 청크 스트림으로 변환하며 결정적 청크 ID(metadata['chunk_id'])를 부여합니다.
+    분할은 페이지 단위로 이루어지므로 split_documents와 동일한 청크 경계를 갖습니다.
+    """
+    splitter = _make_text_splitter(chunk_size, chunk_overlap)
+    chunk_counts: Dict[str, int] = {} # 파일별 청크 순번
+    for page_doc in page_docs:
+        for chunk in splitter.split_documents([page_doc]):
+            file_name = chunk.metadata.get('source_file', '')
+            chunk_index = chunk_counts.get(file_name, 0)
+            chunk.metadata['chunk_id'] = make_chunk_id(file_name, file_hashes.get(file_name, "unknown"), chunk_index)
+            chunk_counts[file_name] = chunk_index + 1
+            yield chunk
+
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """이터러블을 batch_size 크기의 리스트로 묶어 차례로 내보냅니다."""
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def print_chunking_examples(chunked_docs: List[Document], num_examples: int = 3, preview_length: int = 100):
     """분할된 청크의 예시를 출력"""
     print(f"\n🔍 청킹 예시 (처음 {num_examples}개 청크 미리보기):")
     if not chunked_docs:
@@ -173,7 +449,7 @@ def print_chunking_examples(chunked_docs: List[Dict[str, Any]], num_examples: in
 
     for i, chunk in enumerate(chunked_docs[:num_examples]):
         source_file = chunk.metadata.get('source_file', chunk.metadata.get('source', 'N/A'))
-        page_number = chunk.metadata.get('page', 'N/A') # PyMuPDFLoader가 0-based로 추가
+        page_number = chunk.metadata.get('page', 'N/A') # _build_page_metadata가 0-based로 추가
         section_title = chunk.metadata.get('section_title', 'N/A')
         
         content_preview_raw = chunk.page_content[:preview_length]
@@ -188,59 +464,401 @@ def print_chunking_examples(chunked_docs: List[Dict[str, Any]], num_examples: in
         print(f"  (청크 길이: {len(chunk.page_content)}자)")
 
 
-def index_documents(docs: List[Dict[str, Any]], persist_dir: str):
-    """문서를 임베딩하고 Chroma에 저장"""
+def _load_embedding_model(embedding_cache_dir: Optional[str] = EMBEDDING_CACHE_DIR, device: Optional[str] = EMBEDDING_DEVICE):
+    """
+    프로세스 전역 레지스트리에서 임베딩 모델을 가져오고(프로세스당 한 번 로드), embedding_cache_dir가 주어지면 디스크 캐시로 감쌉니다.
+    """
     try:
-        embedding = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME,
-            # encode_kwargs={'normalize_embeddings': True} # 필요시 코사인 유사도 위해 정규화
-        )
+        embedding = get_embedding_model(EMBEDDING_MODEL_NAME, device)
     except Exception as e:
         print(f"❌ 에러: 임베딩 모델 '{EMBEDDING_MODEL_NAME}' 로드 중 오류 발생: {e}")
-        return
+        return None
+
+    if not embedding_cache_dir:
+        return embedding
+    cache = EmbeddingCache(EMBEDDING_MODEL_NAME, cache_dir=embedding_cache_dir, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+    print(f"💽 임베딩 캐시 사용: {cache.cache_path} (저장된 항목: {len(cache.entries)}개)")
+    return CachedEmbeddings(embedding, cache)
 
-    print(f"✅ 문서 {len(docs)}개 임베딩 시작 (모델: {EMBEDDING_MODEL_NAME})...")
+
+def _token_length_function(embedding) -> Callable[[str], int]:
+    """
+    버킷 정렬에 사용할 길이 함수를 반환합니다.
+    sentence-transformers 토크나이저에 접근 가능하면 토큰 수를, 아니면 문자 수를 사용합니다.
+    """
+    base_embedding = getattr(embedding, "base_embeddings", embedding) # CachedEmbeddings 래퍼 해제
+    client = getattr(base_embedding, "client", None) or getattr(base_embedding, "_client", None) # langchain_huggingface는 _client
+    tokenizer = getattr(client, "tokenizer", None)
+    if tokenizer is not None and hasattr(tokenizer, "tokenize"):
+        return lambda text: len(tokenizer.tokenize(text))
+    return len
+
+
+def embed_texts_in_batches(
+    embedding,
+    texts: List[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    normalize: bool = NORMALIZE_EMBEDDINGS
+) -> np.ndarray:
+    """
+    텍스트를 토큰 길이 순으로 정렬해 비슷한 길이끼리 배치(버킷)로 묶어 임베딩한 뒤 원래 순서로 복원합니다.
+    길이가 크게 다른 청크가 한 배치에서 함께 패딩되는 낭비를 줄입니다.
+
+    Args:
+        embedding: LangChain Embeddings 객체 (CachedEmbeddings 포함).
+        texts: 임베딩할 텍스트 리스트.
+        batch_size: 한 번의 embed_documents 호출에 넘길 텍스트 수.
+        normalize: True이면 각 벡터를 L2 정규화 (코사인 유사도 = 내적).
+
+    Returns:
+        (len(texts), dim) float32 배열 (입력 순서 유지).
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    length_of = _token_length_function(embedding)
+    order = sorted(range(len(texts)), key=lambda i: length_of(texts[i]))
+    vectors: Optional[np.ndarray] = None
+
+    started_at = time.perf_counter()
+    for batch_start in range(0, len(order), batch_size):
+        batch_indices = order[batch_start:batch_start + batch_size]
+        batch_vectors = np.asarray(embedding.embed_documents([texts[i] for i in batch_indices]), dtype=np.float32)
+        if vectors is None:
+            vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+        vectors[batch_indices] = batch_vectors # 원래 위치에 기록하여 입력 순서 복원
+    elapsed = time.perf_counter() - started_at
+
+    if normalize:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, 1e-12)
+
+    throughput = len(texts) / elapsed if elapsed > 0 else float("inf")
+    print(f"  ⚡ 임베딩 처리량: {len(texts)}개 청크 / {elapsed:.2f}초 = {throughput:.1f} chunks/sec (배치 크기: {batch_size})")
+    return vectors
+
+
+def _upsert_chunk_batch(vector_store, embedding, chunks: List[Document], batch_size: int) -> None:
+    """청크 한 묶음을 버킷 배치로 임베딩하여 metadata['chunk_id'] (없으면 임의 UUID)를 ID로 벡터 저장소에 upsert합니다."""
+    ids = [chunk.metadata.get('chunk_id') or str(uuid.uuid4()) for chunk in chunks]
+    vectors = embed_texts_in_batches(embedding, [chunk.page_content for chunk in chunks], batch_size=batch_size)
+    vector_store.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=[chunk.page_content for chunk in chunks],
+        metadatas=[chunk.metadata for chunk in chunks],
+    )
+
+
+def index_chunk_stream(
+    chunks: Iterable[Document],
+    persist_dir: str,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    upsert_batch_size: int = CHROMA_UPSERT_BATCH_SIZE,
+    vector_backend: Optional[str] = None,
+    flat_dtype: Optional[str] = None,
+    embedding_cache_dir: Optional[str] = EMBEDDING_CACHE_DIR,
+    device: Optional[str] = EMBEDDING_DEVICE
+) -> Tuple[bool, int]:
+    """
+    청크 스트림을 upsert_batch_size 단위로 임베딩하여 벡터 저장소에 차례로 upsert합니다.
+    Chroma 백엔드에서는 한 번에 메모리에 올라가는 청크/벡터가 한 묶음뿐이므로 코퍼스 크기와 무관하게 메모리가 일정합니다.
+    (flat 백엔드는 persist 시 한 번에 기록하므로 양자화된 벡터가 메모리에 누적됩니다)
+    vector_backend/flat_dtype이 None이면 VECTOR_BACKEND/FLAT_VECTOR_DTYPE 설정을, embedding_cache_dir가 None이면 캐시 없이 임베딩합니다.
+
+    Returns:
+        (성공 여부, upsert된 청크 수).
+    """
+    embedding = _load_embedding_model(embedding_cache_dir, device)
+    if embedding is None:
+        return False, 0
+
+    vector_backend = vector_backend or VECTOR_BACKEND
+    print(f"✅ 청크 스트리밍 임베딩 시작 (모델: {EMBEDDING_MODEL_NAME}, 배치 크기: {batch_size}, upsert 단위: {upsert_batch_size}, 벡터 백엔드: {vector_backend})...")
+    total = 0
     try:
-        vectorstore = Chroma.from_documents(
-            documents=docs, # Langchain Document 객체 리스트
-            embedding=embedding,
-            persist_directory=persist_dir,
-        )
-        vectorstore.persist() # 변경사항 디스크에 즉시 저장
-        print(f"✅ 벡터 DB 저장 완료: {persist_dir}")
+        vector_store = open_vector_store(persist_dir, vector_backend, embedding=embedding, flat_dtype=flat_dtype or FLAT_VECTOR_DTYPE)
+        for chunk_batch in iter_batches(chunks, upsert_batch_size):
+            _upsert_chunk_batch(vector_store, embedding, chunk_batch, batch_size)
+            total += len(chunk_batch)
+            print(f"  💾 누적 {total}개 청크 upsert 완료")
+        if isinstance(embedding, CachedEmbeddings):
+            print(f"  임베딩 캐시: 적중 {embedding.hits}개, 신규 계산 {embedding.misses}개")
+        vector_store.persist()
+        print(f"✅ 벡터 DB 저장 완료: {persist_dir} (청크 {total}개)")
+        return True, total
     except Exception as e:
-        print(f"❌ 에러: 문서 임베딩 또는 Chroma DB 저장 중 오류 발생: {e}")
+        print(f"❌ 에러: 문서 임베딩 또는 벡터 DB 저장 중 오류 발생: {e}")
+        return False, total
+    finally:
+        if isinstance(embedding, CachedEmbeddings):
+            embedding.cache.flush() # 실패해도 이미 계산한 임베딩은 다음 실행에서 재사용
+
+
+def index_documents(
+    docs: List[Document],
+    persist_dir: str,
+    ids: Optional[List[str]] = None,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    vector_backend: Optional[str] = None
+) -> bool:
+    """
+    문서를 길이 버킷 단위 배치로 임베딩하고 벡터 저장소에 upsert.
+    ids가 주어지면 metadata['chunk_id']로 기록하여 해당 ID로 저장합니다.
+    vector_backend("chroma" 또는 "flat")가 None이면 VECTOR_BACKEND 설정을 사용합니다.
+
+    Returns:
+        저장 성공 여부.
+    """
+    if ids is not None:
+        for doc, doc_id in zip(docs, ids):
+            doc.metadata['chunk_id'] = doc_id
+    success, _ = index_chunk_stream(docs, persist_dir, batch_size=batch_size, vector_backend=vector_backend)
+    return success
 
 
-if __name__ == "__main__":
-    print("--- PDF 임베딩 프로세스 시작 (폰트 크기 기반 섹션 추론) ---")
+def delete_indexed_chunks(persist_dir: str, chunk_ids: List[str], vector_backend: Optional[str] = None) -> bool:
+    """벡터 저장소에서 주어진 청크 ID의 벡터를 삭제합니다."""
+    if not chunk_ids:
+        return True
+    try:
+        vector_store = open_vector_store(persist_dir, vector_backend or VECTOR_BACKEND)
+        vector_store.delete(ids=chunk_ids)
+        vector_store.persist()
+        print(f"🗑️  기존 청크 {len(chunk_ids)}개 삭제 완료.")
+        return True
+    except Exception as e:
+        print(f"❌ 에러: 벡터 DB ('{persist_dir}')에서 청크 삭제 중 오류 발생: {e}")
+        return False
+
+
+def get_index_settings(
+    vector_backend: Optional[str] = None,
+    doc_type: Optional[str] = None,
+    flat_dtype: Optional[str] = None
+) -> Dict[str, Any]:
+    """매니페스트에 기록할 인덱싱 설정. 값이 바뀌면 모든 파일이 재인덱싱됩니다."""
+    settings = {
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "doc_type_rules": DOC_TYPE_RULES_VERSION,
+        "vector_backend": vector_backend or VECTOR_BACKEND,
+    }
+    if settings["vector_backend"] == "flat":
+        settings["flat_dtype"] = flat_dtype or FLAT_VECTOR_DTYPE
+    if doc_type is not None:
+        settings["doc_type"] = doc_type
+    return settings
+
+
+def _build_bm25_index_with_log(persist_dir: str) -> None:
+    print("🔤 BM25 역색인 구축 중 (청크 저장소 기반)...")
+    started_at = time.perf_counter()
+    num_docs = build_bm25_index(persist_dir)
+    print(f"✅ BM25 역색인 저장 완료: {get_bm25_index_dir(persist_dir)} (청크 {num_docs}개, {time.perf_counter() - started_at:.2f}초)")
+
+
+def update_index(
+    pdf_dir: str,
+    persist_dir: str,
+    num_workers: int = NUM_WORKERS,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    show_examples: bool = True,
+    vector_backend: Optional[str] = None,
+    doc_type: Optional[str] = None,
+    flat_dtype: Optional[str] = None,
+    embedding_cache_dir: Optional[str] = EMBEDDING_CACHE_DIR,
+    device: Optional[str] = EMBEDDING_DEVICE
+) -> bool:
+    """
+    매니페스트를 기준으로 PDF 폴더를 증분 인덱싱합니다.
+    신규/변경된 파일만 파싱·임베딩·upsert하고, 삭제되었거나 변경된 파일의 기존 벡터는 제거합니다.
+    doc_type이 주어지면 파일명 추론 대신 모든 청크의 문서 유형을 해당 값으로 기록합니다. (예: 공유 가이드라인 컬렉션)
+    vector_backend/flat_dtype이 None이면 기존 인덱스에 기록된 설정을 그대로 사용하므로 (없으면 VECTOR_BACKEND/FLAT_VECTOR_DTYPE) 호출할 때마다 백엔드가 바뀌어 재인덱싱되지 않습니다.
+    flat_dtype/embedding_cache_dir/device는 index_chunk_stream에 그대로 전달됩니다. (embedding_cache_dir가 None이면 캐시 사용 안 함)
+
+    Returns:
+        인덱스(및 매니페스트) 갱신 성공 여부.
+    """
+    pdf_files = list_pdf_files(pdf_dir)
+    pdf_paths_by_name = {os.path.basename(path): path for path in pdf_files}
+
+    print("\n🔑 파일 콘텐츠 해시 계산 중...")
+    file_hashes = {name: compute_file_hash(path) for name, path in pdf_paths_by_name.items()}
+
+    manifest = load_manifest(persist_dir)
+    vector_backend = vector_backend or (detect_vector_backend(persist_dir) if os.path.isdir(persist_dir) else VECTOR_BACKEND)
+    flat_dtype = flat_dtype or (manifest or {}).get("settings", {}).get("flat_dtype")
+    index_settings = get_index_settings(vector_backend, doc_type, flat_dtype)
+    if manifest is None and os.path.exists(persist_dir) and os.listdir(persist_dir):
+        print(f"⚠️  경고: '{persist_dir}'에 매니페스트 없이 데이터가 존재합니다. 중복 방지를 위해 --rebuild로 재생성하는 것을 권장합니다.")
+    changed, removed, unchanged = diff_manifest(manifest, file_hashes, index_settings)
+    if unchanged and not chunk_store_exists(persist_dir):
+        print(f"ℹ️  정보: 청크 저장소({CHUNK_STORE_FILE_NAME})가 없어 모든 파일을 다시 인덱싱합니다.")
+        changed, unchanged = sorted(changed + unchanged), []
+    print(f"📋 변경 사항: 신규/변경 {len(changed)}개, 삭제 {len(removed)}개, 유지 {len(unchanged)}개")
+    previous_backend = (manifest or {}).get("settings", {}).get("vector_backend", DEFAULT_VECTOR_BACKEND)
+    if manifest is not None and previous_backend != vector_backend:
+        print(f"ℹ️  정보: 벡터 백엔드가 '{previous_backend}'에서 '{vector_backend}'로 바뀌어 모든 파일을 다시 인덱싱합니다. (이전 백엔드 파일은 --rebuild로 정리)")
+
+    previous_files = manifest.get("files", {}) if manifest else {}
+    if manifest is None or manifest.get("settings") != index_settings:
+        manifest = new_manifest(index_settings)
+        manifest["files"] = {name: previous_files[name] for name in unchanged}
+
+    if not changed and not removed:
+        print("✅ 변경된 파일이 없어 인덱싱을 건너뜁니다.")
+        if not bm25_index_exists(persist_dir):
+            _build_bm25_index_with_log(persist_dir)
+        save_manifest(persist_dir, manifest)
+        return True
+
+    stale_chunk_ids = [
+        chunk_id
+        for name in changed + removed
+        for chunk_id in previous_files.get(name, {}).get("chunk_ids", [])
+    ]
+    os.makedirs(persist_dir, exist_ok=True)
+    if not delete_indexed_chunks(persist_dir, stale_chunk_ids, vector_backend=vector_backend):
+        return False
+    for name in removed:
+        manifest["files"].pop(name, None)
+        print(f"  - 삭제된 파일 반영: '{name}'")
+
+    # 청크 저장소: 유지되는 파일의 청크는 그대로 복사하고, 신규/변경 파일의 청크는 스트림에서 기록
+    chunk_store_writer = ChunkStoreWriter(persist_dir)
+    try:
+        chunk_store_writer.copy_existing(keep_files=set(unchanged))
+
+        success = True
+        if changed:
+            print("\n📦 신규/변경 PDF 스트리밍 처리 시작 (페이지 → 청크 → 임베딩 배치 → upsert)...")
+            print(f"  청크 크기: {CHUNK_SIZE}, 중첩: {CHUNK_OVERLAP}")
+            page_counts: Dict[str, int] = {}
+            chunk_ids_per_file: Dict[str, List[str]] = {}
+            failed_files: set = set()
+            chunk_examples: List[Document] = []
+
+            def _track_pages(pages: Iterator[Document]) -> Iterator[Document]:
+                for page in pages:
+                    if doc_type is not None:
+                        page.metadata['doc_type'] = doc_type
+                    file_name = page.metadata.get('source_file', '')
+                    page_counts[file_name] = page_counts.get(file_name, 0) + 1
+                    yield page
+
+            def _track_chunks(chunks: Iterator[Document]) -> Iterator[Document]:
+                for chunk in chunks:
+                    chunk_ids_per_file.setdefault(chunk.metadata.get('source_file', ''), []).append(chunk.metadata['chunk_id'])
+                    chunk_store_writer.write(chunk)
+                    if show_examples and len(chunk_examples) < 3:
+                        chunk_examples.append(chunk)
+                    yield chunk
+
+            page_stream = _track_pages(iter_page_documents(
+                [pdf_paths_by_name[name] for name in changed], num_workers=num_workers, failed_files=failed_files
+            ))
+            chunk_stream = _track_chunks(iter_chunks(page_stream, file_hashes))
+            success, total_chunks = index_chunk_stream(
+                chunk_stream, persist_dir, batch_size=batch_size, vector_backend=vector_backend,
+                flat_dtype=flat_dtype, embedding_cache_dir=embedding_cache_dir, device=device
+            )
+            print(f"✂️  총 {sum(page_counts.values())}개 페이지에서 {total_chunks}개 청크 처리.")
+            if show_examples:
+                print_chunking_examples(chunk_examples) # 청킹 결과 예시 출력
+
+            for name in changed:
+                if name in failed_files and name not in chunk_ids_per_file:
+                    manifest["files"].pop(name, None) # 로드 실패한 파일은 다음 실행에서 재시도
+                    continue
+                completed = success and name not in failed_files
+                manifest["files"][name] = {
+                    # 일부만 저장된 파일은 해시를 비워 두어 다음 실행에서 기존 청크 삭제 후 재인덱싱되도록 함
+                    "sha256": file_hashes[name] if completed else None,
+                    "page_count": page_counts.get(name, 0),
+                    "chunk_ids": chunk_ids_per_file.get(name, []),
+                }
+        chunk_store_writer.commit()
+    except BaseException: # Ctrl+C 중단 포함
+        chunk_store_writer.abort() # 임시 파일을 지우고 기존 청크 저장소를 그대로 유지
+        raise
+    print(f"📚 청크 저장소 저장 완료: {get_chunk_store_path(persist_dir)} (청크 {chunk_store_writer.num_records}개)")
+    _build_bm25_index_with_log(persist_dir)
+    save_manifest(persist_dir, manifest)
+    print(f"📝 매니페스트 저장 완료: {get_manifest_path(persist_dir)}")
+    return success
+
+
+def update_guideline_index(
+    guideline_dir: str = GUIDELINE_DIR,
+    persist_dir: str = GUIDELINE_PERSIST_DIR,
+    num_workers: int = NUM_WORKERS,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    show_examples: bool = False,
+    vector_backend: Optional[str] = None,
+    flat_dtype: Optional[str] = None,
+    embedding_cache_dir: Optional[str] = EMBEDDING_CACHE_DIR,
+    device: Optional[str] = EMBEDDING_DEVICE
+) -> bool:
+    """
+    모든 서비스가 공유하는 윤리 가이드라인 컬렉션을 증분 인덱싱합니다. (모든 청크의 doc_type은 guideline)
+    가이드라인 파일이 바뀌지 않았다면 해시 비교만 하고 바로 반환하므로 파이프라인 시작 시마다 호출해도 됩니다.
+    """
+    return update_index(
+        guideline_dir, persist_dir,
+        num_workers=num_workers, batch_size=batch_size, show_examples=show_examples,
+        vector_backend=vector_backend, doc_type=DOC_TYPE_GUIDELINE,
+        flat_dtype=flat_dtype, embedding_cache_dir=embedding_cache_dir, device=device
+    )
 
-    print("\n📦 PDF 로드 및 메타데이터(섹션 제목) 추출 중...")
-    raw_docs_with_metadata = load_documents_from_dir(PDF_DIR)
 
-    if not raw_docs_with_metadata:
-        print("🚫 로드된 PDF 문서가 없어 프로세스를 중단합니다.")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF 문서 증분 인덱싱 도구 (폰트 크기 기반 섹션 추론)")
+    parser.add_argument("--service_data_dir", type=str, default=PDF_DIR,
+                        help=f"인덱싱할 PDF 문서 디렉토리 (기본값: {PDF_DIR}).")
+    parser.add_argument("--chroma_dir", type=str, default=None,
+                        help="Chroma DB 저장 경로 (기본값: ./vectorstore/chroma_<서비스 폴더명>).")
+    parser.add_argument("--guidelines", action="store_true",
+                        help=f"서비스 폴더 대신 공유 가이드라인 컬렉션을 인덱싱합니다 ({GUIDELINE_DIR} → {GUIDELINE_PERSIST_DIR}).")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="기존 벡터 DB와 매니페스트를 삭제하고 전체를 다시 인덱싱합니다.")
+    parser.add_argument("--num_workers", type=int, default=NUM_WORKERS,
+                        help=f"PDF 병렬 파싱 프로세스 수 (기본값: {NUM_WORKERS}, 1이면 순차 처리).")
+    parser.add_argument("--embedding_cache_dir", type=str, default=EMBEDDING_CACHE_DIR,
+                        help=f"청크 임베딩 디스크 캐시 경로 (기본값: {EMBEDDING_CACHE_DIR}). 서비스 간에 공유됩니다.")
+    parser.add_argument("--no_embedding_cache", action="store_true",
+                        help="임베딩 캐시를 사용하지 않고 모든 청크를 새로 임베딩합니다.")
+    parser.add_argument("--batch_size", type=int, default=EMBEDDING_BATCH_SIZE,
+                        help=f"임베딩 배치 크기 (기본값: {EMBEDDING_BATCH_SIZE}). 출력되는 chunks/sec를 보며 조정하세요.")
+    parser.add_argument("--device", type=str, default=EMBEDDING_DEVICE,
+                        help="임베딩 디바이스 (예: cpu, cuda). 지정하지 않으면 사용 가능한 디바이스를 자동 선택합니다.")
+    parser.add_argument("--vector_backend", type=str, choices=VECTOR_BACKENDS, default=None,
+                        help=f"벡터 저장소 백엔드 (기본값: 기존 인덱스의 백엔드, 없으면 {VECTOR_BACKEND}). flat은 메모리 매핑 행렬로 정확 검색합니다.")
+    parser.add_argument("--flat_dtype", type=str, choices=FLAT_DTYPES, default=None,
+                        help=f"flat 백엔드의 벡터 저장 형식 (기본값: 기존 인덱스의 형식, 없으면 {FLAT_VECTOR_DTYPE}).")
+    args = parser.parse_args()
+
+    if args.guidelines:
+        source_dir = GUIDELINE_DIR
+        chroma_dir = args.chroma_dir or GUIDELINE_PERSIST_DIR
+    else:
+        source_dir = args.service_data_dir
+        chroma_dir = args.chroma_dir or get_service_persist_dir(args.service_data_dir)
+
+    print("--- PDF 임베딩 프로세스 시작 (폰트 크기 기반 섹션 추론, 증분 인덱싱) ---")
+    print(f"  대상 폴더: {source_dir} → 벡터 DB: {chroma_dir}")
+
+    if args.rebuild and os.path.exists(chroma_dir):
+        print(f"🗑️  기존 벡터 DB '{chroma_dir}' 삭제 중 (--rebuild)...")
+        shutil.rmtree(chroma_dir) # 디렉토리와 내용 모두 삭제
+
+    if update_index(
+        source_dir, chroma_dir,
+        num_workers=args.num_workers, batch_size=args.batch_size, vector_backend=args.vector_backend,
+        doc_type=DOC_TYPE_GUIDELINE if args.guidelines else None, flat_dtype=args.flat_dtype,
+        embedding_cache_dir=None if args.no_embedding_cache else args.embedding_cache_dir, device=args.device
+    ):
+        print("\n--- 모든 프로세스 완료 ---")
     else:
-        print(f"\n✂️  문서 청크 분할 중 (청크 크기: {CHUNK_SIZE}, 중첩: {CHUNK_OVERLAP})...")
-        chunked_docs = split_documents(raw_docs_with_metadata)
-
-        print_chunking_examples(chunked_docs) # 청킹 결과 예시 출력
-
-        print("\n💾 벡터 DB 저장 준비 중...")
-        # Chroma 디렉토리 존재 및 데이터 유무 확인
-        if os.path.exists(CHROMA_DIR) and os.listdir(CHROMA_DIR):
-            choice = input(f"⚠️  경고: 벡터 DB 디렉토리 '{CHROMA_DIR}'에 이미 데이터가 존재합니다. \n    기존 데이터를 삭제하고 새로 생성하시겠습니까? (y/n): ").strip().lower()
-            if choice == 'y':
-                print(f"🗑️  기존 벡터 DB '{CHROMA_DIR}' 삭제 중...")
-                shutil.rmtree(CHROMA_DIR) # 디렉토리와 내용 모두 삭제
-                os.makedirs(CHROMA_DIR, exist_ok=True) # 삭제 후 다시 생성
-                print("🧠 임베딩 및 저장 시작...")
-                index_documents(chunked_docs, CHROMA_DIR)
-            else:
-                print("🚫 작업을 중단합니다. 기존 DB를 유지합니다.")
-        else:
-            os.makedirs(CHROMA_DIR, exist_ok=True) # 디렉토리가 없으면 생성
-            print("🧠 임베딩 및 저장 시작...")
-            index_documents(chunked_docs, CHROMA_DIR)
-
-    print("\n--- 모든 프로세스 완료 ---")
+        print("\n🚫 인덱싱 중 오류가 발생했습니다. 위 로그를 확인하세요.")
@@ -0,0 +1,115 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : Chroma 컬렉션별 인덱스 매니페스트 관리
+내용 : 컬렉션 디렉토리 옆에 파일별 콘텐츠 해시, 페이지 수, 청크 ID를 기록한 JSON 매니페스트를 저장하고,
+       현재 PDF 폴더와 비교하여 신규/변경/삭제/유지 파일을 계산합니다. (증분 재인덱싱용)
+"""
+
+import os
+import json
+import hashlib
+from typing import Dict, Any, List, Tuple, Optional
+
+MANIFEST_FILE_NAME = "index_manifest.json"
+MANIFEST_FORMAT_VERSION = 1
+HASH_READ_BLOCK_SIZE = 1024 * 1024 # 해시 계산 시 한 번에 읽을 바이트 수
+
+
+def compute_file_hash(file_path: str) -> str:
+    """파일 내용을 블록 단위로 읽어 SHA-256 해시(hex)를 계산합니다."""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def make_chunk_id(file_name: str, file_hash: str, chunk_index: int) -> str:
+    """
+    파일명·콘텐츠 해시와 파일 내 청크 순번으로 결정적인 청크 ID를 생성합니다.
+    (같은 내용의 파일이 다른 이름으로 함께 있어도 ID가 충돌하지 않도록 파일명을 포함)
+    """
+    file_key = hashlib.sha1(f"{file_name}:{file_hash}".encode("utf-8")).hexdigest()[:16]
+    return f"{file_key}-{chunk_index:05d}"
+
+
+def get_manifest_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, MANIFEST_FILE_NAME)
+
+
+def new_manifest(index_settings: Dict[str, Any]) -> Dict[str, Any]:
+    """빈 매니페스트를 생성합니다. index_settings(임베딩 모델, 청크 크기 등)가 바뀌면 전체 재인덱싱 대상이 됩니다."""
+    return {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "settings": dict(index_settings),
+        "files": {}
+    }
+
+
+def load_manifest(persist_dir: str) -> Optional[Dict[str, Any]]:
+    """컬렉션 디렉토리의 매니페스트를 로드합니다. 없거나 손상되었으면 None을 반환합니다."""
+    manifest_path = get_manifest_path(persist_dir)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️  경고: 매니페스트 '{manifest_path}' 로드 실패 ({e}). 전체 재인덱싱이 필요합니다.")
+        return None
+    if manifest.get("format_version") != MANIFEST_FORMAT_VERSION:
+        print(f"⚠️  경고: 매니페스트 형식 버전이 다릅니다 ({manifest.get('format_version')}). 전체 재인덱싱이 필요합니다.")
+        return None
+    return manifest
+
+
+def save_manifest(persist_dir: str, manifest: Dict[str, Any]) -> None:
+    """매니페스트를 임시 파일에 쓴 뒤 교체하여 중간 실패 시에도 기존 매니페스트가 깨지지 않도록 저장합니다."""
+    os.makedirs(persist_dir, exist_ok=True)
+    manifest_path = get_manifest_path(persist_dir)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def compute_index_version(persist_dir: str) -> Optional[str]:
+    """
+    매니페스트 파일 내용의 해시를 인덱스 버전으로 사용합니다. 재인덱싱으로 파일 구성이나 설정이 바뀌면 값이 달라집니다.
+    매니페스트가 없으면 None을 반환합니다.
+    """
+    manifest_path = get_manifest_path(persist_dir)
+    if not os.path.exists(manifest_path):
+        return None
+    return compute_file_hash(manifest_path)
+
+
+def diff_manifest(
+    manifest: Optional[Dict[str, Any]],
+    file_hashes: Dict[str, str],
+    index_settings: Dict[str, Any]
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    매니페스트와 현재 파일 해시를 비교합니다.
+
+    Args:
+        manifest: 기존 매니페스트 (없으면 None).
+        file_hashes: {파일명: 콘텐츠 해시} - 현재 폴더 상태.
+        index_settings: 현재 인덱싱 설정. 매니페스트의 설정과 다르면 모든 파일을 변경된 것으로 간주.
+
+    Returns:
+        (신규 또는 변경된 파일명 리스트, 삭제된 파일명 리스트, 변경 없는 파일명 리스트). 각 리스트는 정렬되어 있습니다.
+    """
+    previous_files = manifest.get("files", {}) if manifest else {}
+    settings_changed = manifest is not None and manifest.get("settings") != dict(index_settings)
+
+    changed, unchanged = [], []
+    for file_name in sorted(file_hashes):
+        entry = previous_files.get(file_name)
+        if settings_changed or entry is None or entry.get("sha256") != file_hashes[file_name]:
+            changed.append(file_name)
+        else:
+            unchanged.append(file_name)
+    removed = sorted(name for name in previous_files if name not in file_hashes)
+    return changed, removed, unchanged
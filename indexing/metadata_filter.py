@@ -0,0 +1,123 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 검색 전에 적용하는 청크 메타데이터 필터 (source_file, doc_type, section_title)
+내용 : 인덱싱 시 파일명으로 문서 유형(doc_type)을 추론하여 청크 메타데이터에 기록하고,
+       검색 시 {필드: 값 또는 값 리스트} 형태의 필터를 벡터 검색(Chroma where / flat 행 마스크)과
+       BM25(포스팅 마스크) 양쪽에서 점수 계산 전에 적용합니다.
+       flat 인덱스와 BM25 역색인은 필터 필드를 정수 코드 배열로 저장하여 마스크를 배열 연산으로 계산합니다.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+FILTER_FIELDS = ("source_file", "doc_type", "section_title")
+
+# 문서 유형
+DOC_TYPE_GUIDELINE = "guideline" # 윤리 가이드라인, 규제 문서 (예: OECD AI 원칙, EU AI Act)
+DOC_TYPE_PRIVACY = "privacy" # 개인정보 처리방침
+DOC_TYPE_TERMS = "terms" # 이용약관, 이용 정책
+DOC_TYPE_SERVICE = "service" # 그 외 서비스 소개/도움말 문서
+SERVICE_DOC_TYPES = [DOC_TYPE_SERVICE, DOC_TYPE_TERMS, DOC_TYPE_PRIVACY] # 서비스 자체 문서 (가이드라인 제외)
+LEGAL_DOC_TYPES = [DOC_TYPE_TERMS, DOC_TYPE_PRIVACY]
+
+# 파일명 키워드 → 문서 유형 (위에서부터 순서대로 검사)
+DOC_TYPE_FILENAME_PATTERNS = [
+    (DOC_TYPE_GUIDELINE, re.compile(r"oecd|guideline|가이드라인|ai[ _-]?act|규제|윤리|principle", re.IGNORECASE)),
+    (DOC_TYPE_PRIVACY, re.compile(r"privacy|개인정보", re.IGNORECASE)),
+    (DOC_TYPE_TERMS, re.compile(r"terms|약관|usage policy|이용\s*정책|conditions", re.IGNORECASE)),
+]
+DOC_TYPE_RULES_VERSION = 1 # 추론 규칙이 바뀌면 올려서 재인덱싱되도록 함 (인덱스 설정에 기록)
+
+
+def infer_doc_type(file_name: str) -> str:
+    """파일명 키워드로 문서 유형을 추론합니다."""
+    for doc_type, pattern in DOC_TYPE_FILENAME_PATTERNS:
+        if pattern.search(file_name):
+            return doc_type
+    return DOC_TYPE_SERVICE
+
+
+def normalize_filter(metadata_filter: Optional[Dict[str, Any]]) -> Optional[Dict[str, List[str]]]:
+    """
+    {필드: 값 또는 값 리스트} 필터를 {필드: 허용 값 리스트}로 정규화합니다. 비어 있으면 None.
+
+    Raises:
+        ValueError: 지원하지 않는 필드가 포함된 경우.
+    """
+    if not metadata_filter:
+        return None
+    normalized = {}
+    for field, value in metadata_filter.items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"지원하지 않는 필터 필드입니다: {field} (지원: {', '.join(FILTER_FIELDS)})")
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        normalized[field] = [str(v) for v in values]
+    return normalized or None
+
+
+def matches_filter(metadata: Dict[str, Any], metadata_filter: Optional[Dict[str, Any]]) -> bool:
+    """단일 메타데이터가 필터를 만족하는지 확인합니다. (필터가 없으면 항상 True)"""
+    normalized = normalize_filter(metadata_filter)
+    if normalized is None:
+        return True
+    return all(
+        metadata.get(field) is not None and str(metadata[field]) in allowed
+        for field, allowed in normalized.items()
+    )
+
+
+def to_chroma_where(metadata_filter: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """필터를 Chroma where 절로 변환합니다."""
+    normalized = normalize_filter(metadata_filter)
+    if normalized is None:
+        return None
+    conditions = [{field: {"$in": allowed}} for field, allowed in normalized.items()]
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def encode_filter_columns(metadatas: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, np.ndarray], Dict[str, List[str]]]:
+    """
+    행별 메타데이터에서 필터 필드를 정수 코드 배열로 인코딩합니다. (값이 없으면 -1)
+
+    Returns:
+        ({필드: int32 코드 배열}, {필드: 코드 → 값 리스트}).
+    """
+    vocabularies: Dict[str, Dict[str, int]] = {field: {} for field in FILTER_FIELDS}
+    columns: Dict[str, List[int]] = {field: [] for field in FILTER_FIELDS}
+    for metadata in metadatas:
+        for field in FILTER_FIELDS:
+            value = metadata.get(field)
+            if value is None:
+                columns[field].append(-1)
+            else:
+                columns[field].append(vocabularies[field].setdefault(str(value), len(vocabularies[field])))
+    codes = {field: np.asarray(column, dtype=np.int32) for field, column in columns.items()}
+    values = {field: list(vocabulary) for field, vocabulary in vocabularies.items()}
+    return codes, values
+
+
+def build_row_mask(
+    codes: Dict[str, np.ndarray],
+    values: Dict[str, List[str]],
+    num_rows: int,
+    metadata_filter: Optional[Dict[str, Any]]
+) -> Optional[np.ndarray]:
+    """
+    인코딩된 필터 열로 필터를 만족하는 행의 불리언 마스크를 계산합니다.
+    필터가 없으면 None, 필터 열이 없는 (이전 버전) 인덱스면 모든 행이 False인 마스크를 반환합니다.
+    """
+    normalized = normalize_filter(metadata_filter)
+    if normalized is None:
+        return None
+    mask = np.ones(num_rows, dtype=bool)
+    for field, allowed in normalized.items():
+        column, vocabulary = codes.get(field), values.get(field)
+        if column is None or vocabulary is None:
+            return np.zeros(num_rows, dtype=bool)
+        allowed_set = set(allowed)
+        allowed_codes = [code for code, value in enumerate(vocabulary) if value in allowed_set]
+        mask &= np.isin(column, allowed_codes)
+    return mask
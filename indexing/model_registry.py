@@ -0,0 +1,103 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 프로세스 전역 임베딩 모델 / 리트리버 레지스트리
+내용 : sentence-transformers 모델 로드는 실행마다 수 초가 걸리므로, 임베딩 모델은 (모델 이름, 디바이스) 기준으로
+       프로세스당 한 번만 로드하여 인덱서, 리트리버, 여러 서비스 진단이 함께 사용합니다.
+       컬렉션별 리트리버는 (모델 이름, 디바이스, 컬렉션 경로, 검색 설정, 인덱스 버전) 기준으로 재사용하므로
+       같은 프로세스에서 여러 서비스를 진단해도 공유 가이드라인 컬렉션은 한 번만 로드되고, 재인덱싱되면 새로 구성됩니다.
+       warm_up()으로 첫 요청 전에 모델을 미리 로드하고 한 번 추론해 둘 수 있습니다.
+       LazyEmbeddings는 첫 임베딩 계산 시점에 모델을 로드하므로, 검색이 모두 캐시에서 처리되는 실행은 모델을 로드하지 않습니다.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+DEFAULT_EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+WARM_UP_TEXT = "warm-up"
+
+_lock = threading.RLock()
+_embedding_models: Dict[Tuple[str, str], Any] = {}
+_retrievers: Dict[Hashable, Any] = {}
+
+
+def resolve_device(device: Optional[str] = None) -> str:
+    """디바이스를 결정합니다. 지정하지 않으면 CUDA → MPS → CPU 순으로 사용 가능한 것을 고릅니다."""
+    if device:
+        return device
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL_NAME, device: Optional[str] = None) -> Any:
+    """
+    (모델 이름, 디바이스)별로 프로세스당 한 번만 로드한 HuggingFaceEmbeddings를 반환합니다.
+
+    Raises:
+        모델 로드 실패 시 발생한 예외 (실패한 모델은 등록되지 않으므로 다음 호출에서 다시 시도합니다).
+    """
+    key = (model_name, resolve_device(device))
+    with _lock:
+        embedding_model = _embedding_models.get(key)
+        if embedding_model is None:
+            from langchain_huggingface import HuggingFaceEmbeddings # LangChain 0.2.2+
+
+            print(f"🧠 HuggingFace 임베딩 로딩 (모델: {model_name}, 디바이스: {key[1]})...")
+            embedding_model = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": key[1]})
+            _embedding_models[key] = embedding_model
+        return embedding_model
+
+
+class LazyEmbeddings:
+    """처음 임베딩을 계산할 때 레지스트리에서 모델을 가져오는 임베딩 프록시 (LangChain Embeddings 인터페이스)"""
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL_NAME, device: Optional[str] = None):
+        self.model_name = model_name
+        self.device = device
+
+    def _model(self) -> Any:
+        return get_embedding_model(self.model_name, self.device)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._model().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._model().embed_query(text)
+
+
+def get_or_build_retriever(key: Hashable, factory: Callable[[], Optional[Any]]) -> Optional[Any]:
+    """
+    key로 등록된 리트리버를 반환하고, 없으면 factory()로 구성하여 등록합니다.
+    factory가 None을 반환하면(구성 실패) 등록하지 않습니다.
+    """
+    with _lock:
+        retriever = _retrievers.get(key)
+        if retriever is None:
+            retriever = factory()
+            if retriever is not None:
+                _retrievers[key] = retriever
+        return retriever
+
+
+def warm_up(model_names: Iterable[str] = (DEFAULT_EMBEDDING_MODEL_NAME,), device: Optional[str] = None) -> None:
+    """모델을 미리 로드하고 한 번 추론하여 첫 요청의 지연(가중치 로드, 커널 초기화)을 없앱니다."""
+    for model_name in model_names:
+        try:
+            get_embedding_model(model_name, device).embed_query(WARM_UP_TEXT)
+            print(f"🔥 임베딩 모델 워밍업 완료: {model_name}")
+        except Exception as e:
+            print(f"⚠️  경고: 임베딩 모델 '{model_name}' 워밍업 실패: {e}")
+
+
+def clear_registry() -> None:
+    """등록된 모델과 리트리버를 모두 해제합니다. (메모리 회수 또는 테스트용)"""
+    with _lock:
+        _embedding_models.clear()
+        _retrievers.clear()
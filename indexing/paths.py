@@ -0,0 +1,42 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 벡터 저장소 경로 규칙
+내용 : 서비스별 컬렉션과 공유 가이드라인 컬렉션의 기본 경로를 한 곳에서 정의합니다.
+       무거운 의존성이 없으므로 app.py가 인자 파싱 단계에서 인덱서를 임포트하지 않고도 기본값을 사용할 수 있습니다.
+       인덱스 디렉토리(flat 벡터, BM25 역색인)를 새로 쓴 임시 디렉토리로 중단에 안전하게 교체하는 함수도 함께 둡니다.
+"""
+
+import os
+import shutil
+
+VECTORSTORE_DIR = "./vectorstore" # 모든 컬렉션의 상위 디렉토리
+GUIDELINE_DIR = "./guidelines" # 모든 서비스가 공유하는 윤리 가이드라인 문서 폴더
+GUIDELINE_PERSIST_DIR = os.path.join(VECTORSTORE_DIR, "guidelines") # 공유 가이드라인 컬렉션 경로
+
+
+def get_service_persist_dir(service_data_dir: str) -> str:
+    """서비스 문서 폴더에 대응하는 컬렉션 경로 (./vectorstore/chroma_<서비스 폴더명>)"""
+    service_name = os.path.basename(os.path.normpath(service_data_dir))
+    return os.path.join(VECTORSTORE_DIR, f"chroma_{service_name}")
+
+
+def restore_interrupted_replace(target_dir: str) -> None:
+    """replace_directory() 도중 중단되어 새 디렉토리 없이 이전 디렉토리(.old)만 남았다면 이전 디렉토리를 되살립니다."""
+    old_dir = target_dir + ".old"
+    if os.path.exists(old_dir) and not os.path.exists(target_dir):
+        os.replace(old_dir, target_dir)
+
+
+def replace_directory(tmp_dir: str, target_dir: str) -> None:
+    """
+    완성된 tmp_dir로 target_dir를 교체합니다.
+    기존 디렉토리를 옆(.old)으로 옮긴 뒤 새 디렉토리로 교체하고 나서 삭제하므로, 어느 시점에 중단되어도 한쪽은 온전히 남습니다.
+    """
+    old_dir = target_dir + ".old"
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    if os.path.exists(target_dir):
+        os.replace(target_dir, old_dir)
+    os.replace(tmp_dir, target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
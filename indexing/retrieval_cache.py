@@ -0,0 +1,170 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 파이프라인 실행 간에 유지되는 검색 결과 캐시
+내용 : 에이전트의 RAG 쿼리는 정해진 템플릿으로 만들어지므로 같은 코퍼스를 다시 진단하면 같은 검색이 반복됩니다.
+       (쿼리, 메타데이터 필터, k, 가중치 등 검색 설정)을 키로 검색 결과 Document 리스트를 컬렉션 디렉토리의 SQLite 파일에 저장하고,
+       최대 항목 수를 넘으면 가장 오래 사용되지 않은 항목부터 제거(LRU)합니다.
+       각 항목에는 저장 시점의 인덱스 버전(매니페스트 해시)이 기록되며, 재인덱싱으로 버전이 바뀌면 이전 항목은 모두 무효화됩니다.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from indexing.metadata_filter import normalize_filter
+
+RETRIEVAL_CACHE_FILE_NAME = "retrieval_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 20_000
+
+
+def get_retrieval_cache_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, RETRIEVAL_CACHE_FILE_NAME)
+
+
+def _documents_to_json(docs: List[Document]) -> str:
+    return json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs], ensure_ascii=False)
+
+
+def _documents_from_json(value: str) -> List[Document]:
+    return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in json.loads(value)]
+
+
+class RetrievalCache:
+    """인덱스 버전별로 무효화되는 크기 제한 SQLite 검색 결과 캐시 (스레드 간 공유 가능)"""
+
+    def __init__(
+        self,
+        db_path: str,
+        index_version: str,
+        search_settings: Dict[str, Any],
+        max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.db_path = db_path
+        self.index_version = index_version
+        self.settings_key = json.dumps(search_settings, sort_keys=True, ensure_ascii=False)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, index_version TEXT NOT NULL, value TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            invalidated = self._conn.execute(
+                "DELETE FROM results WHERE index_version != ?", (self.index_version,)
+            ).rowcount
+        if invalidated:
+            print(f"🧹 검색 캐시: 인덱스가 변경되어 이전 항목 {invalidated}개를 무효화했습니다.")
+
+    def make_key(self, query: str, metadata_filter: Optional[Dict[str, Any]] = None, keyword_query: Optional[str] = None) -> str:
+        filter_key = json.dumps(normalize_filter(metadata_filter), sort_keys=True, ensure_ascii=False)
+        key_source = f"{self.settings_key}\n{filter_key}\n{query}"
+        if keyword_query is not None and keyword_query != query: # 키워드 쿼리를 따로 쓰는 경우에만 키에 포함 (기존 항목 유지)
+            key_source += f"\n{keyword_query}"
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[Document]]:
+        """캐시에 있는 키의 결과만 {키: Document 리스트}로 반환하고 사용 시점을 갱신합니다."""
+        key_list = list(dict.fromkeys(keys))
+        if not key_list:
+            return {}
+        found: Dict[str, List[Document]] = {}
+        with self._lock, self._conn:
+            for start in range(0, len(key_list), 500): # SQLite 파라미터 수 제한
+                part = key_list[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM results WHERE index_version = ? AND key IN ({','.join('?' * len(part))})",
+                    [self.index_version, *part]
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = _documents_from_json(value)
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE results SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found]
+            )
+        return found
+
+    def put_many(self, results: Dict[str, List[Document]]) -> None:
+        """검색 결과를 저장하고, 최대 항목 수를 넘으면 가장 오래 사용되지 않은 항목부터 제거합니다."""
+        if not results:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (key, index_version, value, last_used) VALUES (?, ?, ?, ?)",
+                [(key, self.index_version, _documents_to_json(docs), now) for key, docs in results.items()]
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    검색 결과 캐시를 앞에 둔 리트리버 래퍼. 캐시에 없는 쿼리만 기반 리트리버로 검색합니다.
+    기반 리트리버가 batch_retrieve를 지원하면 캐시 미스 쿼리들을 한 번의 배치 검색으로 처리합니다.
+    """
+
+    base_retriever: Any
+    cache: Any # RetrievalCache
+
+    def batch_retrieve(
+        self,
+        queries: List[str],
+        metadata_filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+        keyword_queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        if not queries:
+            return []
+        metadata_filters = metadata_filters or [None] * len(queries)
+        keyword_list = keyword_queries or [None] * len(queries)
+        keys = [
+            self.cache.make_key(query, metadata_filter, keyword_query)
+            for query, metadata_filter, keyword_query in zip(queries, metadata_filters, keyword_list)
+        ]
+        cached = self.cache.get_many(keys)
+
+        miss_positions = {}
+        for position, key in enumerate(keys):
+            if key not in cached and key not in miss_positions:
+                miss_positions[key] = position
+        if miss_positions:
+            miss_queries = [queries[position] for position in miss_positions.values()]
+            miss_filters = [metadata_filters[position] for position in miss_positions.values()]
+            if hasattr(self.base_retriever, "batch_retrieve"):
+                fresh_results = self.base_retriever.batch_retrieve(
+                    miss_queries, miss_filters,
+                    keyword_queries=[keyword_queries[position] for position in miss_positions.values()] if keyword_queries else None
+                )
+            else:
+                fresh_results = [self.base_retriever.invoke(query) for query in miss_queries]
+            fresh = dict(zip(miss_positions, fresh_results))
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+
+        self.cache.hits += len(queries) - len(miss_positions)
+        self.cache.misses += len(miss_positions)
+        if len(queries) > 1:
+            print(f"💾 검색 캐시: {len(queries)}개 쿼리 중 {len(queries) - len(miss_positions)}개 적중")
+        return [cached[key] for key in keys]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        return self.batch_retrieve([query])[0]
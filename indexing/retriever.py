@@ -1,69 +1,155 @@
 """
 작성자 : kp
-작성일 : 2025-05-18 (수정: 2025-05-20)
-목적 : Chroma + BM25 기반의 EnsembleRetriever 구성 및 검색 결과 출처 표기
-내용 : 지정된 PDF 디렉토리와 Chroma DB 경로를 사용하여 EnsembleRetriever를 생성.
+작성일 : 2025-05-18 (수정: 2025-05-21)
+목적 : 벡터(Chroma 또는 flat) + BM25 기반의 하이브리드 리트리버 구성 및 검색 결과 출처 표기
+내용 : 지정된 벡터 DB 경로와 인덱서가 저장한 청크 저장소를 사용하여 HybridRetriever를 생성.
+       (EnsembleRetriever와 같은 가중 RRF 결합에 더해 여러 쿼리를 한 번에 처리하는 batch_retrieve 제공)
        HuggingFaceEmbeddings 임포트 경로를 LangChain 0.2.2+ 권장 사항에 맞게 수정.
+       임베딩 모델과 컬렉션별 리트리버는 프로세스 전역 레지스트리(model_registry)에서 재사용합니다.
+       임베딩 모델은 첫 검색(캐시 미스) 시점에 로드되므로 검색 결과 캐시만으로 처리되는 실행은 모델 로드 비용이 없습니다.
 """
 
 import os
-import glob
-from typing import List, Optional
-
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings # LangChain 0.2.2+
-from langchain.retrievers import BM25Retriever, EnsembleRetriever
-from langchain_core.documents import Document
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import Any, Optional
+
+from langchain_core.retrievers import BaseRetriever
 from dotenv import load_dotenv
 
+from indexing.bm25_index import BM25Index, BM25IndexRetriever, bm25_index_exists, get_bm25_index_dir
+from indexing.chunk_store import load_chunk_documents, get_chunk_store_path
+from indexing.hybrid_retriever import HybridRetriever, MultiCollectionRetriever
+from indexing.manifest import compute_index_version
+from indexing.metadata_filter import DOC_TYPE_GUIDELINE
+from indexing.model_registry import LazyEmbeddings, get_or_build_retriever
+from indexing.retrieval_cache import CachedRetriever, RetrievalCache, get_retrieval_cache_path, DEFAULT_MAX_ENTRIES
+from indexing.vector_store import open_vector_store, detect_vector_backend
+
 load_dotenv()
 
 # 기본 설정값 (주로 직접 실행 시 또는 기본값으로 사용)
 DEFAULT_EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-DEFAULT_CHUNK_SIZE = 500
-DEFAULT_CHUNK_OVERLAP = 100
 
-def load_and_split_documents_for_bm25(
+
+def _get_collection_retriever(
     pdf_dir: str,
-    chunk_size: int = DEFAULT_CHUNK_SIZE,
-    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
-) -> List[Document]:
-    """BM25 Retriever를 위한 문서를 로드하고 청킹합니다."""
-    docs_for_bm25 = []
-    if not os.path.exists(pdf_dir) or not os.path.isdir(pdf_dir):
-        print(f"⚠️  경고 (BM25): PDF 디렉토리 '{pdf_dir}'를 찾을 수 없습니다.")
-        return docs_for_bm25
-        
-    pdf_files = glob.glob(os.path.join(pdf_dir, "*.pdf"))
-    if not pdf_files:
-        print(f"ℹ️  정보 (BM25): PDF 디렉토리 '{pdf_dir}' 내에 PDF 파일이 없습니다.")
-        return docs_for_bm25
-
-    raw_docs = []
-    print(f"📄 (BM25용) '{pdf_dir}'에서 총 {len(pdf_files)}개 PDF 파일 로드 중...")
-    for pdf_path in pdf_files:
+    chroma_persist_dir: str,
+    vector_backend: Optional[str],
+    device: Optional[str],
+    **collection_settings: Any
+) -> Optional[BaseRetriever]:
+    """
+    프로세스 전역 레지스트리에서 컬렉션 리트리버를 가져오고, 없으면 구성하여 등록합니다.
+    키에 인덱스 버전(매니페스트 해시)이 포함되므로 재인덱싱된 컬렉션은 새로 구성됩니다.
+    """
+    if os.path.isdir(chroma_persist_dir) and os.listdir(chroma_persist_dir):
+        vector_backend = vector_backend or detect_vector_backend(chroma_persist_dir)
+    registry_key = (
+        "collection",
+        collection_settings["embedding_model_name"],
+        device or "auto",
+        os.path.abspath(chroma_persist_dir),
+        vector_backend,
+        compute_index_version(chroma_persist_dir),
+        collection_settings["k_results"],
+        collection_settings["bm25_weight"],
+        collection_settings["chroma_weight"],
+        collection_settings["use_retrieval_cache"],
+        collection_settings["retrieval_cache_max_entries"],
+    )
+    return get_or_build_retriever(
+        registry_key,
+        lambda: _build_collection_retriever(pdf_dir, chroma_persist_dir, vector_backend=vector_backend, **collection_settings)
+    )
+
+def _build_collection_retriever(
+    pdf_dir: str,
+    chroma_persist_dir: str,
+    embedding_model: Any,
+    embedding_model_name: str,
+    k_results: int,
+    bm25_weight: float,
+    chroma_weight: float,
+    use_retrieval_cache: bool,
+    retrieval_cache_max_entries: int,
+    vector_backend: Optional[str]
+) -> Optional[BaseRetriever]:
+    """하나의 컬렉션(벡터 저장소 + BM25 + 검색 결과 캐시)에 대한 리트리버를 구성합니다. 인자는 build_ensemble_retriever와 동일."""
+    if not os.path.exists(chroma_persist_dir) or not os.listdir(chroma_persist_dir):
+        print(f"❌ 에러: 벡터 DB 디렉토리 '{chroma_persist_dir}'가 비어 있거나 존재하지 않습니다.")
+        print(f"   먼저 '{pdf_dir}'의 문서를 해당 경로로 인덱싱해야 합니다.")
+        return None
+
+    vector_backend = vector_backend or detect_vector_backend(chroma_persist_dir)
+    print(f"🔍 벡터 저장소 로딩 중 (백엔드: {vector_backend}, 경로: {chroma_persist_dir})...")
+    try:
+        vector_store = open_vector_store(chroma_persist_dir, vector_backend, embedding=embedding_model)
+    except Exception as e:
+        print(f"❌ 에러: 벡터 DB ('{chroma_persist_dir}') 로드 중 오류 발생: {e}")
+        return None
+
+    print("  벡터 저장소 준비 완료.")
+
+    lexical_retriever = None
+    if bm25_index_exists(chroma_persist_dir):
+        print(f"📄 사전 구축된 BM25 역색인 로딩 중 (메모리 매핑, 경로: {get_bm25_index_dir(chroma_persist_dir)})...")
         try:
-            loader = PyMuPDFLoader(pdf_path)
-            raw_docs.extend(loader.load())
+            lexical_retriever = BM25IndexRetriever(index=BM25Index(chroma_persist_dir), k=k_results)
+            print("  BM25 리트리버 준비 완료.")
         except Exception as e:
-            print(f"❌ 에러 (BM25): '{os.path.basename(pdf_path)}' 로드 중 오류 발생: {e}")
+            print(f"❌ 에러: BM25 역색인 로드 중 오류 발생: {e}")
+    else:
+        # 역색인이 없는 이전 버전 인덱스: 청크 저장소로부터 메모리 내 BM25를 구성
+        print(f"📄 BM25 리트리버용 청크 저장소 로딩 및 구축 중 (소스: {get_chunk_store_path(chroma_persist_dir)})...")
+        bm25_docs = load_chunk_documents(chroma_persist_dir)
+        if not bm25_docs:
+            print("⚠️  경고: 청크 저장소가 없거나 비어 있어 BM25는 제외하고 벡터 검색만 사용합니다.")
+            print(f"   (HINT: python -m indexing.indexer --service_data_dir {pdf_dir} 를 실행하여 청크 저장소를 생성하세요.)")
+        else:
+            try:
+                from langchain.retrievers import BM25Retriever
 
-    if not raw_docs:
-        return docs_for_bm25
+                lexical_retriever = BM25Retriever.from_documents(bm25_docs)
+                lexical_retriever.k = k_results
+                print("  BM25 리트리버 준비 완료. (HINT: 인덱서를 다시 실행하면 사전 구축된 BM25 역색인을 사용합니다.)")
+            except Exception as e:
+                print(f"❌ 에러: BM25 리트리버 생성 중 오류 발생: {e}")
 
-    print(f"✂️  (BM25용) 문서 청크 분할 중 (크기: {chunk_size}, 중첩: {chunk_overlap})...")
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ". ", " ", ""], # 다양한 구분자 사용
-        length_function=len,
+    if lexical_retriever:
+        print(f"🔗 하이브리드 리트리버 구성 중 ({vector_backend} + BM25, 가중 RRF)...")
+    else:
+        print("🔗 벡터 검색만 사용 (BM25 생성 실패 또는 문서 없음).")
+    ensemble_retriever = HybridRetriever(
+        vectorstore=vector_store,
+        embedding=embedding_model,
+        lexical_retriever=lexical_retriever,
+        k=k_results,
+        weights=[chroma_weight, bm25_weight],
     )
-    docs_for_bm25 = splitter.split_documents(raw_docs)
-    print(f"  (BM25용) {len(docs_for_bm25)}개 청크 생성 완료.")
-    return docs_for_bm25
 
+    if use_retrieval_cache:
+        index_version = compute_index_version(chroma_persist_dir)
+        if index_version is None:
+            print("⚠️  경고: 인덱스 매니페스트가 없어 인덱스 버전을 알 수 없으므로 검색 결과 캐시를 사용하지 않습니다.")
+        else:
+            try:
+                retrieval_cache = RetrievalCache(
+                    get_retrieval_cache_path(chroma_persist_dir),
+                    index_version=index_version,
+                    search_settings={
+                        "k": k_results,
+                        "weights": [chroma_weight, bm25_weight],
+                        "embedding_model": embedding_model_name,
+                        "vector_backend": vector_backend,
+                        "lexical": type(lexical_retriever).__name__ if lexical_retriever else None,
+                    },
+                    max_entries=retrieval_cache_max_entries,
+                )
+                ensemble_retriever = CachedRetriever(base_retriever=ensemble_retriever, cache=retrieval_cache)
+                print(f"💾 검색 결과 캐시 사용 (경로: {retrieval_cache.db_path}, 인덱스 버전: {index_version[:12]})")
+            except Exception as e:
+                print(f"⚠️  경고: 검색 결과 캐시 초기화 실패 ({e}). 캐시 없이 진행합니다.")
+
+    return ensemble_retriever
 
 def build_ensemble_retriever(
     pdf_dir: str, # RAG 대상 문서가 있는 디렉토리
@@ -72,88 +158,74 @@ def build_ensemble_retriever(
     bm25_weight: float = 0.4, # BM25 가중치
     chroma_weight: float = 0.6, # Chroma 가중치
     embedding_model_name: str = DEFAULT_EMBEDDING_MODEL_NAME,
-    chunk_size_for_bm25: int = DEFAULT_CHUNK_SIZE,
-    chunk_overlap_for_bm25: int = DEFAULT_CHUNK_OVERLAP
-) -> Optional[EnsembleRetriever]:
+    use_retrieval_cache: bool = True, # 실행 간 검색 결과 캐시 사용 여부
+    retrieval_cache_max_entries: int = DEFAULT_MAX_ENTRIES,
+    vector_backend: Optional[str] = None, # "chroma" 또는 "flat" (None이면 인덱스 매니페스트에서 자동 선택)
+    guideline_persist_dir: Optional[str] = None, # 공유 가이드라인 컬렉션 경로 (None이면 서비스 컬렉션만 검색)
+    device: Optional[str] = None # 임베딩 디바이스 (None이면 자동 선택)
+) -> Optional[BaseRetriever]:
     """
-    지정된 경로의 문서와 ChromaDB를 사용하여 EnsembleRetriever를 생성합니다.
+    지정된 경로의 ChromaDB와 인덱서가 저장한 청크 저장소(chunks.jsonl)를 사용하여 하이브리드 리트리버를 생성합니다.
+    BM25 인덱스는 Chroma와 동일한 청크로 구성되며, 이 과정에서 PDF를 다시 파싱하지 않습니다.
+    guideline_persist_dir가 주어지면 공유 가이드라인 컬렉션도 함께 검색하는 MultiCollectionRetriever를 반환합니다.
+    임베딩 모델과 컬렉션 리트리버는 프로세스 전역 레지스트리에서 재사용되므로, 같은 프로세스의 두 번째 호출부터는 모델을 다시 로드하지 않습니다.
 
     Args:
-        pdf_dir: BM25 및 원문 참조를 위한 PDF 문서가 있는 디렉토리.
-        chroma_persist_dir: ChromaDB 데이터가 저장된/저장될 디렉토리.
+        pdf_dir: 인덱싱 대상 PDF 문서가 있는 디렉토리 (안내 메시지용).
+        chroma_persist_dir: 벡터 DB(Chroma 또는 flat) 데이터와 청크 저장소가 저장된 디렉토리.
         k_results: 검색 시 반환할 결과의 수.
-        bm25_weight: EnsembleRetriever에서 BM25 결과의 가중치.
-        chroma_weight: EnsembleRetriever에서 Chroma 결과의 가중치.
+        bm25_weight: RRF 결합 시 BM25 결과의 가중치.
+        chroma_weight: RRF 결합 시 벡터 검색 결과의 가중치.
         embedding_model_name: 사용할 임베딩 모델 이름.
-        chunk_size_for_bm25: BM25용 문서 청킹 시 크기.
-        chunk_overlap_for_bm25: BM25용 문서 청킹 시 중첩 크기.
+        use_retrieval_cache: True이면 컬렉션 디렉토리의 검색 결과 캐시를 앞에 둡니다. (인덱스 변경 시 자동 무효화)
+        retrieval_cache_max_entries: 검색 결과 캐시의 최대 항목 수 (LRU).
+        vector_backend: 벡터 저장소 백엔드. None이면 인덱서가 매니페스트에 기록한 백엔드를 사용합니다.
+        guideline_persist_dir: 공유 가이드라인 컬렉션 경로 (python -m indexing.indexer --guidelines 로 생성).
+            컬렉션이 없으면 경고 후 서비스 컬렉션만 사용합니다.
+        device: 임베딩 모델을 올릴 디바이스 ("cpu", "cuda" 등). None이면 사용 가능한 디바이스를 자동 선택합니다.
 
     Returns:
-        구성된 EnsembleRetriever 객체 또는 실패 시 None.
+        구성된 리트리버 (HybridRetriever, 이를 감싼 CachedRetriever 또는 MultiCollectionRetriever, invoke 및 batch_retrieve 지원) 또는 실패 시 None.
     """
-    print(f"🧠 HuggingFace 임베딩 로딩 (모델: {embedding_model_name})...")
-    try:
-        embedding_model = HuggingFaceEmbeddings(model_name=embedding_model_name)
-    except Exception as e:
-        print(f"❌ 에러: 임베딩 모델 '{embedding_model_name}' 로드 중 오류 발생: {e}")
-        print("   (HINT: `pip install -U langchain-huggingface`를 실행했는지 확인하세요.)")
-        return None
+    embedding_model = LazyEmbeddings(embedding_model_name, device) # 첫 캐시 미스 검색 시 로드 (미리 로드하려면 model_registry.warm_up)
 
-    print(f"🔍 Chroma 벡터 저장소 로딩 중 (경로: {chroma_persist_dir})...")
-    if not os.path.exists(chroma_persist_dir) or not os.listdir(chroma_persist_dir):
-        print(f"❌ 에러: Chroma DB 디렉토리 '{chroma_persist_dir}'가 비어 있거나 존재하지 않습니다.")
-        print(f"   먼저 '{pdf_dir}'의 문서를 해당 Chroma 경로로 인덱싱해야 합니다.")
-        return None
-        
-    try:
-        chroma_vectorstore = Chroma(
-            persist_directory=chroma_persist_dir,
-            embedding_function=embedding_model,
-        )
-    except Exception as e:
-        print(f"❌ 에러: Chroma DB ('{chroma_persist_dir}') 로드 중 오류 발생: {e}")
+    collection_settings = dict(
+        embedding_model=embedding_model,
+        embedding_model_name=embedding_model_name,
+        k_results=k_results,
+        bm25_weight=bm25_weight,
+        chroma_weight=chroma_weight,
+        use_retrieval_cache=use_retrieval_cache,
+        retrieval_cache_max_entries=retrieval_cache_max_entries,
+    )
+    service_retriever = _get_collection_retriever(
+        pdf_dir, chroma_persist_dir, vector_backend, device, **collection_settings
+    )
+    if service_retriever is None:
         return None
 
-    semantic_retriever = chroma_vectorstore.as_retriever(search_kwargs={"k": k_results})
-    print("  Chroma 리트리버 준비 완료.")
+    if guideline_persist_dir is None:
+        print("✅ 리트리버 구성 완료.")
+        return service_retriever
 
-    print(f"📄 BM25 리트리버용 원문 로딩 및 구축 중 (소스: {pdf_dir})...")
-    bm25_docs = load_and_split_documents_for_bm25(
-        pdf_dir,
-        chunk_size=chunk_size_for_bm25,
-        chunk_overlap=chunk_overlap_for_bm25
+    print(f"📚 공유 가이드라인 컬렉션 로딩 중 (경로: {guideline_persist_dir})...")
+    guideline_retriever = _get_collection_retriever(
+        "공유 가이드라인 폴더", guideline_persist_dir, None, device, **collection_settings
     )
-    
-    lexical_retriever = None
-    if not bm25_docs:
-        print("⚠️  경고: BM25 리트리버를 위한 문서가 없어 BM25는 제외하고 Chroma 리트리버만 사용합니다.")
-    else:
-        try:
-            lexical_retriever = BM25Retriever.from_documents(bm25_docs)
-            lexical_retriever.k = k_results
-            print("  BM25 리트리버 준비 완료.")
-        except Exception as e:
-            print(f"❌ 에러: BM25 리트리버 생성 중 오류 발생: {e}")
-
-    if lexical_retriever and semantic_retriever:
-        print("🔗 EnsembleRetriever 구성 중 (Chroma + BM25)...")
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[semantic_retriever, lexical_retriever],
-            weights=[chroma_weight, bm25_weight],
-        )
-    elif semantic_retriever:
-        print("🔗 Chroma 리트리버만 사용 (BM25 생성 실패 또는 문서 없음).")
-        ensemble_retriever = semantic_retriever # BM25가 없으면 Chroma만 사용
-    else:
-        print("❌ 에러: Semantic retriever (Chroma)도 준비되지 않았습니다. Retriever를 구성할 수 없습니다.")
-        return None
+    if guideline_retriever is None:
+        print("⚠️  경고: 공유 가이드라인 컬렉션을 사용할 수 없어 서비스 컬렉션만 검색합니다.")
+        print("   (HINT: python -m indexing.indexer --guidelines 를 실행하여 가이드라인 컬렉션을 생성하세요.)")
+        print("✅ 리트리버 구성 완료.")
+        return service_retriever
 
-
-    print("✅ 리트리버 구성 완료.")
-    return ensemble_retriever
+    print("✅ 리트리버 구성 완료 (서비스 컬렉션 + 공유 가이드라인 컬렉션).")
+    return MultiCollectionRetriever(
+        retrievers=[service_retriever, guideline_retriever],
+        collection_doc_types=[None, [DOC_TYPE_GUIDELINE]],
+    )
 
 if __name__ == "__main__":
-    print("--- Ensemble Retriever 직접 실행 테스트 ---")
+    print("--- Hybrid Retriever 직접 실행 테스트 ---")
     
     # 이 테스트는 특정 서비스의 데이터 디렉토리와 Chroma DB 경로를 지정해야 합니다.
     # 예: test_pdf_dir = "./data/daglo"
@@ -171,7 +243,7 @@ if __name__ == "__main__":
         print(f"\n🚫 테스트 중단: 테스트를 위한 PDF 폴더 또는 Chroma DB가 준비되지 않았습니다.")
         print(f"   '{test_pdf_dir}'에 PDF 파일이 있는지,")
         print(f"   '{test_chroma_dir}'에 해당 PDF에 대한 인덱싱된 Chroma DB가 있는지 확인하세요.")
-        print(f"   (HINT: python indexing/indexer.py --service_data_dir {test_pdf_dir} 와 같이 실행하여 먼저 인덱싱하세요.)")
+        print(f"   (HINT: python -m indexing.indexer --service_data_dir {test_pdf_dir} 와 같이 실행하여 먼저 인덱싱하세요.)")
     else:
         retriever = build_ensemble_retriever(
             pdf_dir=test_pdf_dir,
@@ -0,0 +1,293 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 인덱서와 리트리버가 공통으로 사용하는 교체 가능한 벡터 저장소 백엔드
+내용 : 모든 백엔드는 upsert / delete / query / persist 인터페이스를 제공합니다.
+       - chroma : 기존 Chroma 컬렉션 (SQLite + HNSW)
+       - flat   : 정규화된 임베딩을 float16/int8 행렬(.npy)로 저장하고 메모리 매핑으로 로드하여
+                  배치 내적으로 정확한(exact) 검색을 수행. 청크 수천 개 규모의 서비스별 코퍼스에서는
+                  Chroma 로드보다 빠르고, 시작 비용은 행렬 파일 하나의 메모리 매핑뿐입니다.
+       사용 중인 백엔드는 매니페스트 설정(vector_backend)에 기록되어 리트리버가 자동으로 선택합니다.
+       query()는 메타데이터 필터를 받아 점수 계산 전에 적용합니다. (chroma: where 절, flat: 필터 열 행 마스크)
+"""
+
+import os
+import json
+import shutil
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from indexing.manifest import load_manifest
+from indexing.metadata_filter import FILTER_FIELDS, build_row_mask, encode_filter_columns, to_chroma_where
+from indexing.paths import replace_directory, restore_interrupted_replace
+
+VECTOR_BACKENDS = ("chroma", "flat")
+DEFAULT_VECTOR_BACKEND = "chroma"
+FLAT_DIR_NAME = "flat_vectors"
+FLAT_DTYPES = ("float16", "int8")
+INT8_SCALE = 127.0 # 정규화된 벡터의 각 성분([-1, 1])을 int8로 양자화할 때의 배율
+QUERY_BLOCK_ROWS = 65536 # 검색 시 한 번에 float32로 변환하여 내적할 행 수
+
+
+def get_flat_index_dir(persist_dir: str) -> str:
+    return os.path.join(persist_dir, FLAT_DIR_NAME)
+
+
+def detect_vector_backend(persist_dir: str) -> str:
+    """매니페스트 설정에 기록된 백엔드를 반환합니다. 기록이 없으면 flat 인덱스 존재 여부로 판단합니다."""
+    manifest = load_manifest(persist_dir)
+    backend = (manifest or {}).get("settings", {}).get("vector_backend")
+    if backend in VECTOR_BACKENDS:
+        return backend
+    restore_interrupted_replace(get_flat_index_dir(persist_dir))
+    if os.path.exists(os.path.join(get_flat_index_dir(persist_dir), "meta.json")):
+        return "flat"
+    return DEFAULT_VECTOR_BACKEND
+
+
+class ChromaVectorStore:
+    """Chroma 컬렉션 백엔드 (임베딩은 호출 측에서 계산하여 전달)"""
+
+    def __init__(self, persist_dir: str, embedding: Any = None):
+        self.persist_dir = persist_dir
+        self.embedding = embedding
+        self._vectorstore = None
+
+    @property
+    def vectorstore(self):
+        """Chroma 클라이언트는 처음 사용할 때 연결합니다. (검색이 모두 캐시에서 처리되면 chromadb를 임포트하지 않음)"""
+        if self._vectorstore is None:
+            from langchain_community.vectorstores import Chroma
+
+            self._vectorstore = Chroma(persist_directory=self.persist_dir, embedding_function=self.embedding)
+        return self._vectorstore
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        self.vectorstore._collection.upsert(
+            ids=ids,
+            embeddings=np.asarray(embeddings, dtype=np.float32).tolist(),
+            documents=documents,
+            metadatas=metadatas,
+        )
+
+    def delete(self, ids: List[str]) -> None:
+        self.vectorstore.delete(ids=ids)
+
+    def query(self, query_embeddings: np.ndarray, k: int, metadata_filter: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        """여러 쿼리 벡터를 한 번의 행렬 질의로 검색합니다. 필터는 Chroma where 절로 전달됩니다."""
+        query_kwargs: Dict[str, Any] = {}
+        where = to_chroma_where(metadata_filter)
+        if where is not None:
+            query_kwargs["where"] = where
+        result = self.vectorstore._collection.query(
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32).tolist(),
+            n_results=k,
+            include=["documents", "metadatas", "distances"],
+            **query_kwargs,
+        )
+        batch_docs = []
+        for texts, metadatas in zip(result.get("documents") or [], result.get("metadatas") or []):
+            batch_docs.append([
+                Document(page_content=text or "", metadata=dict(metadata or {}))
+                for text, metadata in zip(texts, metadatas)
+            ])
+        return batch_docs
+
+    def persist(self) -> None:
+        if hasattr(self.vectorstore, "persist"):
+            self.vectorstore.persist() # 변경사항 디스크에 즉시 저장 (Chroma 0.4 미만)
+
+
+class FlatVectorStore:
+    """
+    메모리 매핑된 float16/int8 행렬 + 문서 사이드카(docs.jsonl) 기반의 정확 검색 백엔드.
+    벡터는 L2 정규화되어 있다고 가정하며 점수는 내적(= 코사인 유사도)입니다.
+    upsert/delete는 메모리에 모아 두었다가 persist() 시 디렉토리를 새로 써서 원자적으로 교체합니다. (단일 작성자 가정)
+    """
+
+    def __init__(self, persist_dir: str, dtype: Optional[str] = None):
+        if dtype is not None and dtype not in FLAT_DTYPES:
+            raise ValueError(f"지원하지 않는 flat 벡터 dtype입니다: {dtype} (지원: {', '.join(FLAT_DTYPES)})")
+        self.persist_dir = persist_dir
+        self.index_dir = get_flat_index_dir(persist_dir)
+        self.dtype = dtype or FLAT_DTYPES[0]
+        self.num_rows = 0
+        self.vectors: Optional[np.ndarray] = None
+        self.doc_offsets: Optional[np.ndarray] = None
+        self.filter_codes: Dict[str, np.ndarray] = {}
+        self.filter_values: Dict[str, List[str]] = {}
+        self._pending_upserts: Dict[str, tuple] = {} # ID → (벡터, 텍스트, 메타데이터)
+        self._pending_deletes: set = set()
+        self._force_rewrite = False
+
+        restore_interrupted_replace(self.index_dir)
+        meta_path = os.path.join(self.index_dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.num_rows = meta["num_rows"]
+            self.filter_values = meta.get("filter_values", {})
+            self._load_arrays()
+            if dtype is not None and dtype != meta["dtype"]:
+                print(f"ℹ️  정보: flat 인덱스가 {meta['dtype']}로 저장되어 있어 다음 저장 시 {dtype}로 변환합니다.")
+                self._force_rewrite = True
+            else:
+                self.dtype = meta["dtype"] # dtype을 지정하지 않으면 저장된 인덱스의 dtype을 따름
+
+    def _load_arrays(self) -> None:
+        """벡터 행렬, 문서 오프셋, 필터 열을 메모리 매핑으로 엽니다."""
+        if not self.num_rows:
+            return
+        self.vectors = np.load(os.path.join(self.index_dir, "vectors.npy"), mmap_mode="r")
+        self.doc_offsets = np.load(os.path.join(self.index_dir, "doc_offsets.npy"), mmap_mode="r")
+        self.filter_codes = {
+            field: np.load(os.path.join(self.index_dir, f"filter_{field}.npy"), mmap_mode="r")
+            for field in self.filter_values
+            if os.path.exists(os.path.join(self.index_dir, f"filter_{field}.npy"))
+        }
+
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dtype == "int8":
+            return np.clip(np.round(vectors * INT8_SCALE), -INT8_SCALE, INT8_SCALE).astype(np.int8)
+        return vectors.astype(np.float16)
+
+    def _iter_stored_records(self):
+        """저장된 (행 번호, 레코드 원문 줄)을 파일 순서대로 읽습니다."""
+        docs_path = os.path.join(self.index_dir, "docs.jsonl")
+        if not self.num_rows or not os.path.exists(docs_path):
+            return
+        with open(docs_path, "rb") as f:
+            for row, raw_line in enumerate(iter(f.readline, b"")):
+                yield row, raw_line
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        for chunk_id, vector, text, metadata in zip(ids, np.asarray(embeddings, dtype=np.float32), documents, metadatas):
+            self._pending_deletes.discard(chunk_id)
+            self._pending_upserts[chunk_id] = (vector, text, metadata)
+
+    def delete(self, ids: List[str]) -> None:
+        for chunk_id in ids:
+            self._pending_upserts.pop(chunk_id, None)
+            self._pending_deletes.add(chunk_id)
+
+    def persist(self) -> None:
+        """보류 중인 변경을 반영하여 인덱스 디렉토리를 새로 쓰고 교체합니다."""
+        if not self._pending_upserts and not self._pending_deletes and not self._force_rewrite:
+            return
+        replaced = self._pending_deletes | set(self._pending_upserts)
+        tmp_dir = self.index_dir + ".tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+
+        kept_rows: List[int] = []
+        doc_offsets: List[int] = []
+        row_metadatas: List[Dict[str, Any]] = [] # 필터 열 인코딩용
+        with open(os.path.join(tmp_dir, "docs.jsonl"), "wb") as docs_file:
+            for row, raw_line in self._iter_stored_records():
+                record = json.loads(raw_line)
+                if record.get("id") in replaced:
+                    continue
+                kept_rows.append(row)
+                doc_offsets.append(docs_file.tell())
+                row_metadatas.append(record.get("metadata") or {})
+                docs_file.write(raw_line)
+            for chunk_id, (_, text, metadata) in self._pending_upserts.items():
+                doc_offsets.append(docs_file.tell())
+                row_metadatas.append(metadata)
+                record = {"id": chunk_id, "text": text, "metadata": metadata}
+                docs_file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        parts = []
+        if kept_rows:
+            kept = np.asarray(self.vectors[kept_rows])
+            if kept.dtype != np.dtype(self.dtype): # dtype 변경 시 float32로 복원 후 다시 양자화
+                kept = self._quantize(kept.astype(np.float32) / (INT8_SCALE if kept.dtype == np.int8 else 1.0))
+            parts.append(kept)
+        if self._pending_upserts:
+            parts.append(self._quantize(np.stack([item[0] for item in self._pending_upserts.values()])))
+        vectors = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=self.dtype)
+
+        np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+        np.save(os.path.join(tmp_dir, "doc_offsets.npy"), np.asarray(doc_offsets, dtype=np.int64))
+        filter_codes, filter_values = encode_filter_columns(
+            {field: metadata.get(field) for field in FILTER_FIELDS} for metadata in row_metadatas
+        )
+        for field, column in filter_codes.items():
+            np.save(os.path.join(tmp_dir, f"filter_{field}.npy"), column)
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "dtype": self.dtype,
+                "num_rows": len(doc_offsets),
+                "dim": int(vectors.shape[1]) if len(vectors) else 0,
+                "filter_values": filter_values,
+            }, f, ensure_ascii=False)
+
+        self.vectors = self.doc_offsets = None # 교체 전 기존 메모리 매핑 해제
+        self.filter_codes = {}
+        replace_directory(tmp_dir, self.index_dir)
+
+        self._pending_upserts, self._pending_deletes, self._force_rewrite = {}, set(), False
+        self.num_rows = len(doc_offsets)
+        self.filter_values = filter_values
+        self._load_arrays()
+
+    def _get_document(self, docs_file, row: int) -> Document:
+        docs_file.seek(int(self.doc_offsets[row]))
+        record = json.loads(docs_file.readline())
+        metadata = dict(record.get("metadata") or {})
+        metadata.setdefault("chunk_id", record.get("id"))
+        return Document(page_content=record.get("text", ""), metadata=metadata)
+
+    def query(self, query_embeddings: np.ndarray, k: int, metadata_filter: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        """
+        모든 쿼리 벡터와 저장된 행렬의 내적을 블록 단위로 계산하여 쿼리별 상위 k개 문서를 반환합니다.
+        필터가 주어지면 필터를 만족하는 행만 읽어 내적을 계산합니다.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if self.num_rows == 0 or self.vectors is None:
+            return [[] for _ in range(len(queries))]
+
+        row_mask = build_row_mask(self.filter_codes, self.filter_values, self.num_rows, metadata_filter)
+        candidate_rows = np.arange(self.num_rows) if row_mask is None else np.flatnonzero(row_mask)
+        if len(candidate_rows) == 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = np.empty((len(queries), len(candidate_rows)), dtype=np.float32)
+        for start in range(0, len(candidate_rows), QUERY_BLOCK_ROWS):
+            block_rows = candidate_rows[start:start + QUERY_BLOCK_ROWS]
+            if row_mask is None: # 필터가 없으면 연속 구간을 그대로 읽음
+                block = np.asarray(self.vectors[block_rows[0]:block_rows[-1] + 1], dtype=np.float32)
+            else:
+                block = np.asarray(self.vectors[block_rows], dtype=np.float32)
+            scores[:, start:start + len(block_rows)] = queries @ block.T
+        if self.dtype == "int8":
+            scores /= INT8_SCALE
+
+        k = min(k, len(candidate_rows))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        with open(os.path.join(self.index_dir, "docs.jsonl"), "rb") as docs_file:
+            for query_index, columns in enumerate(top):
+                ordered = columns[np.argsort(-scores[query_index, columns], kind="stable")]
+                results.append([self._get_document(docs_file, int(candidate_rows[column])) for column in ordered])
+        return results
+
+
+def open_vector_store(persist_dir: str, backend: Optional[str] = None, embedding: Any = None, flat_dtype: Optional[str] = None):
+    """
+    백엔드 이름에 맞는 벡터 저장소를 엽니다. backend가 None이면 detect_vector_backend로 자동 선택합니다.
+    flat_dtype이 None이면 기존 flat 인덱스의 dtype(없으면 float16)을 사용합니다.
+
+    Returns:
+        ChromaVectorStore 또는 FlatVectorStore.
+    """
+    backend = backend or detect_vector_backend(persist_dir)
+    if backend == "flat":
+        return FlatVectorStore(persist_dir, dtype=flat_dtype)
+    if backend == "chroma":
+        return ChromaVectorStore(persist_dir, embedding=embedding)
+    raise ValueError(f"지원하지 않는 벡터 백엔드입니다: {backend} (지원: {', '.join(VECTOR_BACKENDS)})")
@@ -0,0 +1,46 @@
+import re
+from typing import List, Tuple
+
+# (조항 유형, 패턴) - 독소조항 전수 검사 시 LLM에 보낼 청크를 고르는 저비용 어휘 필터 (한국어/영어 약관 문구)
+# PDF 청크는 문장 중간에 줄바꿈이 있으므로 DOTALL로 줄바꿈을 사이에 둔 표현도 일치시킴
+CLAUSE_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("면책/책임 제한", re.compile(
+        r"면책|책임을?\s*지지\s*않|책임이\s*없|책임을?\s*부담하지|손해배상.{0,20}(제한|한도|배제)|보증하지\s*않|"
+        r"(not|never)\s+(be\s+)?(held\s+)?liable|not\s+responsible|at\s+your\s+own\s+risk|reliance\s+on|not\s+rely|error[\s-]free|in\s+no\s+event|fullest\s+extent|limitation\s+of\s+liability|disclaim|\bas[\s-]is\b|without\s+warrant|indemnif",
+        re.IGNORECASE | re.DOTALL)),
+    ("일방적 변경/중단", re.compile(
+        r"(약관|정책|서비스|요금|내용).{0,20}(변경|수정|개정|중단|종료)할\s*수\s*있|사전\s*(통지|고지)\s*없이|"
+        r"동의한\s*것으로\s*(간주|봅니다|본다)|(단독|자체|임의)\s*(재량|판단)|권리를\s*보유|"
+        r"(modify|change|amend|update|suspend|discontinue).{0,40}(at\s+any\s+time|sole\s+discretion|without\s+(prior\s+)?notice)|"
+        r"reserve\s+the\s+right|sole\s+discretion|continued\s+use.{0,40}(constitutes|means).{0,20}accept",
+        re.IGNORECASE | re.DOTALL)),
+    ("데이터 제공/공유", re.compile(
+        r"제3자.{0,20}(제공|공유|위탁)|(개인정보|데이터|정보).{0,20}(공유|제공|이전|판매)|국외\s*이전|처리\s*위탁|"
+        r"수사기관|law\s+enforcement|(share|disclose|sell|transfer).{0,40}(third[\s-]part|affiliate|partner|service\s+provider)",
+        re.IGNORECASE | re.DOTALL)),
+    ("데이터 수집/이용/보유", re.compile(
+        r"(자동|광범위|포괄).{0,10}수집|수집.{0,20}(항목|목적)|보유\s*(및\s*이용\s*)?기간|파기|(모델|서비스).{0,20}(학습|개선).{0,10}(이용|활용|사용)|"
+        r"(collect|retain|use).{0,40}(personal\s+(data|information)|your\s+(content|data))|train(ing)?\s+(our\s+)?models?|retention",
+        re.IGNORECASE | re.DOTALL)),
+    ("콘텐츠 권리", re.compile(
+        r"(콘텐츠|게시물|입력|출력|저작물).{0,30}(권리|라이선스|이용\s*허락|저작권)|무상으로.{0,20}(이용|사용)|"
+        r"(worldwide|perpetual|irrevocable|royalty[\s-]free).{0,40}licen[cs]e|grant\s+(us|the\s+company)",
+        re.IGNORECASE | re.DOTALL)),
+    ("계정 정지/해지", re.compile(
+        r"(이용|계정|서비스).{0,20}(정지|제한|해지|삭제|박탈)|즉시\s*(해지|중단|정지)|"
+        r"(terminate|suspend|discontinue).{0,40}(account|access|service)|termination",
+        re.IGNORECASE | re.DOTALL)),
+    ("분쟁 해결/관할", re.compile(
+        r"중재|관할\s*(법원|법)|준거법|집단\s*소송|소송.{0,20}(포기|제기할\s*수\s*없)|"
+        r"arbitration|class\s+action|jury\s+trial|governing\s+law|jurisdiction|venue",
+        re.IGNORECASE | re.DOTALL)),
+    ("요금/환불/자동갱신", re.compile(
+        r"자동\s*(갱신|결제|연장)|환불.{0,20}(불가|하지\s*않|제한)|위약금|손해배상\s*예정|"
+        r"auto(matic(ally)?)?[\s-]*renew|renewal\s+term|(subscription|additional)\s+fees?|non[\s-]?refundable|no\s+refunds?",
+        re.IGNORECASE | re.DOTALL)),
+]
+
+
+def match_clause_categories(text: str) -> List[str]:
+    """텍스트에 나타나는 독소조항 후보 유형 목록 (패턴 순서, 없으면 빈 리스트)"""
+    return [category for category, pattern in CLAUSE_PATTERNS if pattern.search(text or "")]
@@ -0,0 +1,172 @@
+import re
+import hashlib
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+from indexing.hybrid_retriever import RRF_C
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 6000 # 에이전트 한 번의 프롬프트에 넣을 RAG 컨텍스트 최대 토큰 수
+CONTENT_PREVIEW_CHARS = 300 # 청크별 본문 미리보기 길이 (기존 에이전트 포맷과 동일)
+MAX_LISTED_REFERENCES = 4 # 청크별로 나열할 관련 검색(항목/측면) 라벨 수
+TOKENIZER_ENCODING = "o200k_base" # gpt-4o 계열 토크나이저
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_HANGUL_PATTERN = re.compile(r"[가-힣]")
+_encoding = None
+_encoding_loaded = False
+
+
+def approximate_tokens(text: str) -> int:
+    """토크나이저 없이 토큰 수를 추정합니다. (한글 1자 = 1토큰, 그 외 4자 = 1토큰)"""
+    hangul_count = len(_HANGUL_PATTERN.findall(text or ""))
+    return hangul_count + (len(text or "") - hangul_count + 3) // 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    텍스트의 프롬프트 토큰 수를 계산합니다.
+    tiktoken 인코딩을 사용할 수 없으면(미설치, 오프라인에서 BPE 파일 다운로드 실패) approximate_tokens()로 추정합니다.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True # 로드 실패 시 매 호출마다 다시 시도하지 않음
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            print(f"정보(context_packer): tiktoken 인코딩을 사용할 수 없어 토큰 수를 추정합니다. ({type(e).__name__})")
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return approximate_tokens(text)
+
+
+def _content_preview(doc: Document, preview_chars: int) -> str:
+    return doc.page_content.replace(chr(0), '').strip()[:preview_chars] # NULL 바이트 제거
+
+
+def _format_context(doc: Document, preview: str, label: str, references: str = "") -> str:
+    source_file = doc.metadata.get('source_file', doc.metadata.get('source', 'N/A'))
+    page_num = doc.metadata.get('page', 'N/A')
+    section_title = doc.metadata.get('section_title', 'N/A')
+    references = f" [관련 검색: {references}]" if references else ""
+    return (
+        f"  --- {label} (출처: {source_file}, 페이지: {page_num}, 섹션: {section_title}){references} ---\n"
+        f"  {preview}...\n"
+    )
+
+
+def _dedupe_key(preview: str) -> str:
+    """
+    같은 청크를 식별하는 키. 청크 ID가 없거나 서로 다른 청크라도 공백/대소문자만 다른 같은 본문(프롬프트에 들어가는 미리보기 기준)이면
+    거의 중복으로 보고 한 번만 넣습니다.
+    """
+    normalized = _WHITESPACE_PATTERN.sub(" ", preview).strip().lower()
+    return "text:" + hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class PackedContext(NamedTuple):
+    """컨텍스트 조립 결과"""
+    text: str
+    raw_tokens: int # 검색 결과를 쿼리별로 모두 나열했을 때의 토큰 수 (기존 방식)
+    packed_tokens: int # 중복 제거 및 예산 적용 후 토큰 수
+    hit_count: int # 모든 쿼리의 검색 결과 수 (중복 포함)
+    unique_count: int # 중복 제거 후 청크 수
+    packed_count: int # 예산 안에 들어간 청크 수
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.raw_tokens - self.packed_tokens, 0)
+
+    def summary(self) -> str:
+        return (
+            f"컨텍스트 토큰 {self.raw_tokens} → {self.packed_tokens} ({self.saved_tokens} 절감), "
+            f"검색 결과 {self.hit_count}개 → 고유 청크 {self.unique_count}개 중 {self.packed_count}개 포함"
+        )
+
+
+def pack_contexts(
+    labeled_results: List[Tuple[str, Union[List[Document], Exception]]],
+    token_budget: Optional[int] = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    header: str = "",
+    preview_chars: int = CONTENT_PREVIEW_CHARS
+) -> PackedContext:
+    """
+    에이전트의 모든 쿼리 검색 결과를 하나의 컨텍스트로 조립합니다.
+    같은 청크(청크 ID 또는 같은 본문)는 한 번만 넣고 그 청크를 찾은 쿼리 라벨을 모아 표시하며,
+    결합 점수(fused_score, 여러 쿼리에서 찾은 경우 최댓값) 순으로 토큰 예산 안에 들어가는 청크까지 채웁니다.
+
+    Args:
+        labeled_results: (쿼리 라벨, 검색 결과 또는 검색 오류) 리스트. 라벨은 예: "편향성 리스크 / 데이터 수집 및 처리의 적절성".
+        token_budget: 컨텍스트 최대 토큰 수 (None 또는 0 이하면 제한 없음).
+        header: 컨텍스트 맨 앞에 붙일 제목 (예산에 포함).
+        preview_chars: 청크별 본문 미리보기 길이.
+    """
+    chunks_by_key: Dict[str, Dict] = {}
+    unique_chunks: List[Dict] = []
+    raw_parts = [header]
+    empty_labels: List[str] = []
+    error_labels: List[str] = []
+    hit_count = 0
+
+    for label, docs in labeled_results:
+        raw_parts.append(f"\n### '{label}' 관련 내용:\n") # 기존 에이전트의 쿼리별 소제목
+        if isinstance(docs, Exception):
+            error_labels.append(f"{label} ({docs})")
+            continue
+        if not docs:
+            empty_labels.append(label)
+            continue
+        for rank, doc in enumerate(docs):
+            hit_count += 1
+            preview = _content_preview(doc, preview_chars)
+            raw_parts.append(_format_context(doc, preview, f"컨텍스트 {rank + 1}"))
+            score = doc.metadata.get("fused_score", 1.0 / (rank + RRF_C)) # 결합 점수가 없는 리트리버는 순위로 대신함
+            keys = [key for key in (doc.metadata.get("chunk_id"), _dedupe_key(preview)) if key]
+            chunk = next((chunks_by_key[key] for key in keys if key in chunks_by_key), None)
+            if chunk is None:
+                chunk = {"doc": doc, "preview": preview, "score": score, "labels": [label]}
+                unique_chunks.append(chunk)
+            else:
+                chunk["score"] = max(chunk["score"], score)
+                if label not in chunk["labels"]:
+                    chunk["labels"].append(label)
+            for key in keys: # 청크 ID와 본문 키 모두로 찾을 수 있도록 등록
+                chunks_by_key[key] = chunk
+
+    footer_parts = []
+    if empty_labels:
+        footer_parts.append("\n### 관련 내용을 찾지 못한 검색:\n" + "".join(f"  - {label}\n" for label in empty_labels))
+    if error_labels:
+        footer_parts.append("\n### 검색 중 오류가 발생한 검색:\n" + "".join(f"  - {label}\n" for label in error_labels))
+    footer = "".join(footer_parts)
+
+    unlimited = token_budget is None or token_budget <= 0
+    used_tokens = estimate_tokens(header) + estimate_tokens(footer)
+    packed_parts = []
+    ranked_chunks = sorted(unique_chunks, key=lambda chunk: -chunk["score"]) # 안정 정렬: 동점이면 먼저 찾은 청크 우선
+    for chunk in ranked_chunks:
+        labels = chunk["labels"]
+        references = "; ".join(labels[:MAX_LISTED_REFERENCES])
+        if len(labels) > MAX_LISTED_REFERENCES:
+            references += f" 외 {len(labels) - MAX_LISTED_REFERENCES}개"
+        entry = _format_context(chunk["doc"], chunk["preview"], f"컨텍스트 {len(packed_parts) + 1}", references)
+        entry_tokens = estimate_tokens(entry)
+        if not unlimited and used_tokens + entry_tokens > token_budget:
+            continue # 더 짧은 다음 청크는 남은 예산에 들어갈 수 있음
+        packed_parts.append(entry)
+        used_tokens += entry_tokens
+
+    if not unique_chunks:
+        packed_parts.append("  모든 검색에서 관련된 내용을 문서에서 찾을 수 없었습니다.\n")
+    text = header + "".join(packed_parts) + footer + "\n"
+    return PackedContext(
+        text=text,
+        raw_tokens=estimate_tokens("".join(raw_parts) + "\n"),
+        packed_tokens=estimate_tokens(text),
+        hit_count=hit_count,
+        unique_count=len(unique_chunks),
+        packed_count=len(packed_parts) if unique_chunks else 0
+    )
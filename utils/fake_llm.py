@@ -0,0 +1,170 @@
+import re
+import json
+import time
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from utils.context_packer import approximate_tokens
+
+FAKE_MODEL_NAME = "fake-gpt-4o"
+DEFAULT_FAKE_OUTPUT_TOKENS = 300 # 응답 본문(근거/설명 필드)을 채울 목표 토큰 수
+RISK_LEVELS = ["낮음", "중간", "높음"]
+RISK_KEYS = ["bias_risk", "privacy_risk", "explainability_risk", "automation_risk"]
+FILLER_SENTENCE = "제공된 문서 컨텍스트를 근거로 한 오프라인 모의 평가 문장입니다. "
+
+PROMPT_KIND_SERVICE_ANALYSIS = "service_analysis"
+PROMPT_KIND_ETHICAL_RISK = "ethical_risk"
+PROMPT_KIND_ETHICAL_RISK_ITEM = "ethical_risk_item"
+PROMPT_KIND_TOXIC_CLAUSE = "toxic_clause"
+PROMPT_KIND_TOXIC_CLAUSE_MAP = "toxic_clause_map"
+PROMPT_KIND_IMPROVEMENT = "improvement"
+PROMPT_KIND_REPORT = "report"
+
+_SOURCE_PATTERN = re.compile(r"출처: ([^,\n]+), 페이지: ([^,\n]+)")
+_SERVICE_NAME_PATTERN = re.compile(r'"service_name":\s*"([^"]*)"|서비스 이름: (.+)')
+
+
+def detect_prompt_kind(system_prompt: str) -> str:
+    """시스템 프롬프트의 출력 형식(JSON 필드, SUMMARY 섹션)으로 어느 에이전트의 프롬프트인지 판별합니다."""
+    if '"recommendations"' in system_prompt:
+        return PROMPT_KIND_IMPROVEMENT
+    if '"overall_clause_risk"' in system_prompt:
+        return PROMPT_KIND_TOXIC_CLAUSE
+    if '"severity"' in system_prompt:
+        return PROMPT_KIND_TOXIC_CLAUSE_MAP
+    if '"service_url_status"' in system_prompt:
+        return PROMPT_KIND_SERVICE_ANALYSIS
+    if '"risk_level"' in system_prompt:
+        return PROMPT_KIND_ETHICAL_RISK_ITEM
+    if '"justification"' in system_prompt:
+        return PROMPT_KIND_ETHICAL_RISK
+    return PROMPT_KIND_REPORT
+
+
+class FakeChatModel(Runnable):
+    """
+    OpenAI 없이 그래프 전체를 실행하기 위한 결정적 로컬 LLM (ChatOpenAI의 invoke 인터페이스 대체).
+    에이전트별 출력 형식에 맞는 ```json 블록(서비스 분석, 윤리 리스크(단일/항목별), 독소조항(키워드/전수 검사 map), 개선안)과 SUMMARY 줄이 있는 Markdown 보고서를 반환하며,
+    같은 프롬프트에는 항상 같은 응답을 돌려줍니다. latency_seconds + 출력 토큰당 latency_per_token 만큼 대기하여 응답 지연을 흉내 냅니다.
+    """
+
+    def __init__(
+        self,
+        latency_seconds: float = 0.0,
+        latency_per_token: float = 0.0,
+        output_tokens: int = DEFAULT_FAKE_OUTPUT_TOKENS,
+        model_name: str = FAKE_MODEL_NAME,
+        temperature: float = 0.0
+    ):
+        self.latency_seconds = latency_seconds
+        self.latency_per_token = latency_per_token
+        self.output_tokens = output_tokens
+        self.model_name = model_name
+        self.temperature = temperature
+        self.calls = 0
+
+    def _filler(self, seed: int, share: int) -> str:
+        """목표 토큰 수(output_tokens)를 필드 share개로 나눈 분량의 설명 문장"""
+        target = max(self.output_tokens // max(share, 1), 1)
+        sentence = f"[{seed % 1000:03d}] {FILLER_SENTENCE}"
+        return (sentence * (target // approximate_tokens(sentence) + 1)).strip()
+
+    def _respond(self, kind: str, human_prompt: str, seed: int) -> str:
+        sources = [f"{name.strip()}, 페이지 {page.strip()}" for name, page in _SOURCE_PATTERN.findall(human_prompt)[:4]] or ["제공된 문서 없음"]
+        name_match = _SERVICE_NAME_PATTERN.search(human_prompt) # 서비스 분석 이후 단계의 프롬프트에는 서비스 이름이 들어 있음
+        service_name = next((group for group in (name_match.groups() if name_match else ()) if group), "모의 AI 서비스").strip()
+        level = lambda offset: RISK_LEVELS[(seed >> offset) % len(RISK_LEVELS)]
+
+        if kind == PROMPT_KIND_SERVICE_ANALYSIS:
+            payload: Dict[str, Any] = {
+                "service_name": "모의 AI 서비스",
+                "description": self._filler(seed, 2),
+                "core_features": ["문서 요약", "대화형 질의응답"],
+                "target_users": ["일반 사용자", "기업 고객"],
+                "collected_data_types": ["계정 정보", "입력 콘텐츠", "사용 기록"],
+                "service_url_status": "확인 불가 (오프라인 모의 응답)",
+                "key_information_source": "; ".join(sources),
+            }
+        elif kind == PROMPT_KIND_ETHICAL_RISK:
+            payload = {key: level(index * 2) for index, key in enumerate(RISK_KEYS)}
+            payload["justification"] = {key: self._filler(seed + index, len(RISK_KEYS)) for index, key in enumerate(RISK_KEYS)}
+            payload["source_document_reference"] = {
+                f"{key}_reference": sources[index % len(sources)] for index, key in enumerate(RISK_KEYS)
+            }
+        elif kind == PROMPT_KIND_ETHICAL_RISK_ITEM:
+            payload = {
+                "risk_level": level(0),
+                "justification": self._filler(seed, 1),
+                "source_document_reference": sources[0],
+            }
+        elif kind == PROMPT_KIND_TOXIC_CLAUSE:
+            payload = {
+                "toxic_clauses": [
+                    {
+                        "clause": f"{source}의 면책 및 서비스 변경 관련 조항",
+                        "risk_reason": self._filler(seed + index, 2 * min(len(sources), 2)),
+                        "potential_impact": "사용자가 사전 고지 없이 불리한 변경을 적용받을 수 있습니다.",
+                        "source_document_reference": source,
+                    }
+                    for index, source in enumerate(sources[:2])
+                ],
+                "overall_clause_risk": level(0),
+            }
+        elif kind == PROMPT_KIND_TOXIC_CLAUSE_MAP:
+            payload = {
+                "toxic_clauses": [
+                    {
+                        "clause": f"{source}의 조항 후보 {index + 1}",
+                        "risk_reason": self._filler(seed + index, 2 * min(len(sources), 2)),
+                        "potential_impact": "사용자가 사전 고지 없이 불리한 변경을 적용받을 수 있습니다.",
+                        "source_document_reference": source,
+                        "severity": level(index * 2),
+                    }
+                    for index, source in enumerate(sources[:2])
+                ]
+            }
+        elif kind == PROMPT_KIND_IMPROVEMENT:
+            payload = {
+                "recommendations": {
+                    key: self._filler(seed + index, len(RISK_KEYS) + 1)
+                    for index, key in enumerate([*RISK_KEYS, "toxic_clauses"])
+                }
+            }
+        else:
+            return (
+                f"# AI 윤리성 리스크 진단 : {service_name}\n\n"
+                f"작성일자: 2025.05.20\n\n"
+                f"SUMMARY: {self._filler(seed, 2)}\n\n"
+                f"## 상세 분석\n\n{self._filler(seed + 1, 2)}\n\n"
+                f"이보고서는 AI에 의해 작성 되었습니다.\n"
+            )
+        return f"```json\n{json.dumps(payload, ensure_ascii=False, indent=2)}\n```"
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        if isinstance(input, str):
+            messages: List[BaseMessage] = [HumanMessage(content=input)]
+        elif hasattr(input, "to_messages"):
+            messages = input.to_messages()
+        else:
+            messages = list(input)
+        system_prompt = "\n".join(str(message.content) for message in messages if message.type == "system")
+        human_prompt = "\n".join(str(message.content) for message in messages if message.type != "system")
+        prompt = f"{system_prompt}\n{human_prompt}"
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+
+        content = self._respond(detect_prompt_kind(system_prompt), human_prompt, seed)
+        input_tokens = approximate_tokens(prompt)
+        output_tokens = approximate_tokens(content)
+        delay = self.latency_seconds + self.latency_per_token * output_tokens
+        if delay > 0:
+            time.sleep(delay)
+        self.calls += 1
+        token_usage = {"prompt_tokens": input_tokens, "completion_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        return AIMessage(
+            content=content,
+            response_metadata={"model_name": self.model_name, "token_usage": token_usage, "finish_reason": "stop"},
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        )
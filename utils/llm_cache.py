@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, message_to_dict, messages_from_dict
+from langchain_core.runnables import Runnable, RunnableConfig
+
+LLM_CACHE_MODE_OFF = "off"
+LLM_CACHE_MODE_READ_WRITE = "read-write"
+LLM_CACHE_MODE_REPLAY_ONLY = "replay-only"
+LLM_CACHE_MODES = (LLM_CACHE_MODE_OFF, LLM_CACHE_MODE_READ_WRITE, LLM_CACHE_MODE_REPLAY_ONLY)
+DEFAULT_LLM_CACHE_PATH = "./cache/llm_responses.sqlite"
+
+
+class LLMCacheMissError(RuntimeError):
+    """replay-only 모드에서 캐시에 없는 프롬프트로 LLM을 호출하려 할 때 발생합니다."""
+
+
+def _to_messages(input: Any) -> List[BaseMessage]:
+    if isinstance(input, str):
+        return [HumanMessage(content=input)]
+    if hasattr(input, "to_messages"): # PromptValue
+        return input.to_messages()
+    return list(input)
+
+
+def _llm_settings(llm: Any) -> Dict[str, Any]:
+    """캐시 키에 들어갈 모델 설정 (ChatOpenAI는 model_name, 다른 채팅 모델은 model 속성 사용)"""
+    return {
+        "model": getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__,
+        "temperature": getattr(llm, "temperature", None),
+    }
+
+
+class LLMResponseCache:
+    """(모델, temperature, 메시지 해시)를 키로 LLM 응답 메시지를 저장하는 SQLite 캐시 (스레드 간 공유 가능)"""
+
+    def __init__(self, db_path: str = DEFAULT_LLM_CACHE_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def make_key(settings: Dict[str, Any], messages: List[BaseMessage], invoke_kwargs: Optional[Dict[str, Any]] = None) -> str:
+        payload = {
+            "settings": settings,
+            "messages": [[message.type, message.content] for message in messages],
+            "kwargs": invoke_kwargs or {},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[BaseMessage]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        return messages_from_dict([json.loads(row[0])])[0] if row else None
+
+    def put(self, key: str, model: str, message: BaseMessage) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, created_at) VALUES (?, ?, ?, ?)",
+                (key, model, json.dumps(message_to_dict(message), ensure_ascii=False), time.time())
+            )
+
+
+class CachedChatModel(Runnable):
+    """
+    에이전트에 전달되는 LLM 앞에 디스크 캐시를 둔 Runnable 래퍼.
+    mode가 read-write이면 같은 프롬프트의 응답을 재사용하고 새 응답을 저장하며,
+    replay-only이면 저장된 응답만 사용하고 캐시에 없는 프롬프트는 LLMCacheMissError로 즉시 실패합니다(네트워크 호출 없음).
+    """
+
+    def __init__(self, llm: Any, cache: LLMResponseCache, mode: str = LLM_CACHE_MODE_READ_WRITE):
+        if mode not in (LLM_CACHE_MODE_READ_WRITE, LLM_CACHE_MODE_REPLAY_ONLY):
+            raise ValueError(f"지원하지 않는 LLM 캐시 모드입니다: {mode} (read-write 또는 replay-only)")
+        self.llm = llm
+        self.cache = cache
+        self.mode = mode
+        self.settings = _llm_settings(llm)
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name: str) -> Any:
+        # model_name, temperature 등 원래 LLM 속성 조회는 그대로 전달
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        messages = _to_messages(input)
+        key = self.cache.make_key(self.settings, messages, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            print(f"💾 LLM 캐시 적중 (모델: {self.settings['model']}, 키: {key[:12]})")
+            return cached
+
+        self.misses += 1
+        if self.mode == LLM_CACHE_MODE_REPLAY_ONLY:
+            raise LLMCacheMissError(
+                f"LLM 캐시 미스 (replay-only 모드, 모델: {self.settings['model']}, 키: {key[:12]}): "
+                f"캐시 '{self.cache.db_path}'에 이 프롬프트의 응답이 없습니다. read-write 모드로 한 번 실행하여 응답을 기록하세요."
+            )
+        response = self.llm.invoke(messages, config, **kwargs)
+        self.cache.put(key, self.settings["model"], response)
+        return response
+
+    def summary(self) -> str:
+        return f"LLM 캐시({self.mode}): 호출 {self.hits + self.misses}회 중 {self.hits}회 적중"
+
+
+def wrap_llm_with_cache(llm: Any, mode: str = LLM_CACHE_MODE_OFF, cache_path: str = DEFAULT_LLM_CACHE_PATH) -> Any:
+    """mode에 따라 LLM을 CachedChatModel로 감쌉니다. off이면 llm을 그대로 반환합니다."""
+    if mode == LLM_CACHE_MODE_OFF:
+        return llm
+    print(f"💾 LLM 응답 캐시 사용 (모드: {mode}, 경로: {cache_path})")
+    return CachedChatModel(llm, LLMResponseCache(cache_path), mode)
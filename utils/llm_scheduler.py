@@ -0,0 +1,204 @@
+import time
+import heapq
+import random
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from utils.context_packer import approximate_tokens
+
+PRIORITY_HIGH = 0 # 파이프라인 후반 단계 (개선안, 보고서) - 진행 중인 진단을 먼저 끝내도록 우선 처리
+PRIORITY_NORMAL = 10
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_EXPECTED_OUTPUT_TOKENS = 1000 # 토큰 한도 예약 시 응답 토큰 추정치 (응답 후 실제 사용량으로 보정)
+RATE_WINDOW_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = ("RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError", "ServiceUnavailableError")
+
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    """이 블록 안에서 호출되는 LLM 요청의 스케줄링 우선순위를 지정합니다. (값이 작을수록 먼저 처리)"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """429(요청 한도 초과), 5xx, 연결/타임아웃 오류는 재시도 대상입니다."""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES or isinstance(error, (TimeoutError, ConnectionError))
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after")) if headers.get("retry-after") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler(Runnable):
+    """
+    여러 에이전트(및 동시에 실행 중인 여러 진단)가 공유하는 LLM 요청 스케줄러 Runnable.
+    동시 요청 수, 분당 요청 수/토큰 수 한도를 지키며 대기 중인 요청은 우선순위(llm_priority) → 도착 순으로 처리하고,
+    429/5xx/연결 오류는 지터를 준 지수 백오프로 재시도합니다. 대기 시간 등 지표는 metrics()로 확인할 수 있습니다.
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 30.0,
+        expected_output_tokens: int = DEFAULT_EXPECTED_OUTPUT_TOKENS
+    ):
+        self.llm = llm
+        self.max_concurrency = max(max_concurrency, 1)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.expected_output_tokens = expected_output_tokens
+
+        self._condition = threading.Condition()
+        self._waiting: List[Tuple[int, int]] = [] # (우선순위, 도착 순번) 힙
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._window: Deque[List[float]] = deque() # [요청 시각, 예약 토큰 수] (최근 60초)
+        self._metrics: Dict[str, float] = {
+            "requests": 0, "retries": 0, "failures": 0, "tokens": 0,
+            "queue_wait_total": 0.0, "queue_wait_max": 0.0, "max_in_flight": 0, "max_queue_length": 0,
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        # model_name, temperature 등 원래 LLM 속성 조회는 그대로 전달 (LLM 캐시 키 생성 등)
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _rate_limit_delay(self, now: float, tokens: int) -> float:
+        """지금 요청을 보내면 분당 한도를 넘는 경우 기다려야 할 시간(초). 보낼 수 있으면 0."""
+        while self._window and now - self._window[0][0] >= RATE_WINDOW_SECONDS:
+            self._window.popleft()
+        delays = [0.0]
+        if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+            delays.append(self._window[0][0] + RATE_WINDOW_SECONDS - now)
+        if self.tokens_per_minute and self._window:
+            used = sum(entry[1] for entry in self._window)
+            if used + tokens > self.tokens_per_minute: # 한도를 넘는 만큼의 오래된 예약이 만료될 때까지
+                excess = used + tokens - self.tokens_per_minute
+                for started_at, reserved in self._window:
+                    excess -= reserved
+                    if excess <= 0:
+                        delays.append(started_at + RATE_WINDOW_SECONDS - now)
+                        break
+        return max(delays)
+
+    def _acquire(self, priority: int, tokens: int) -> Tuple[List[float], float]:
+        ticket = (priority, next(self._sequence))
+        queued_at = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            self._metrics["max_queue_length"] = max(self._metrics["max_queue_length"], len(self._waiting))
+            while True:
+                if self._waiting[0] == ticket and self._in_flight < self.max_concurrency:
+                    delay = self._rate_limit_delay(time.monotonic(), tokens)
+                    if delay <= 0:
+                        break
+                    self._condition.wait(timeout=delay)
+                else:
+                    self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            reservation = [time.monotonic(), float(tokens)]
+            self._window.append(reservation)
+            waited = reservation[0] - queued_at
+            self._metrics["queue_wait_total"] += waited
+            self._metrics["queue_wait_max"] = max(self._metrics["queue_wait_max"], waited)
+            self._metrics["max_in_flight"] = max(self._metrics["max_in_flight"], self._in_flight)
+            self._condition.notify_all() # 다음 대기 요청이 힙의 맨 앞이 됨
+        return reservation, waited
+
+    def _release(self, reservation: List[float], used_tokens: Optional[int]) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            if used_tokens is not None:
+                reservation[1] = float(used_tokens) # 예약 토큰을 실제 사용량으로 보정
+            self._condition.notify_all()
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        priority = _current_priority.get()
+        prompt_text = input if isinstance(input, str) else " ".join(str(getattr(message, "content", message)) for message in input)
+        tokens = approximate_tokens(prompt_text) + self.expected_output_tokens
+
+        attempt = 0
+        while True:
+            reservation, waited = self._acquire(priority, tokens)
+            if waited >= 1.0:
+                print(f"⏳ LLM 스케줄러: {waited:.1f}초 대기 후 요청 (우선순위: {priority})")
+            used_tokens = None
+            try:
+                response = self.llm.invoke(input, config, **kwargs)
+                usage = getattr(response, "usage_metadata", None) or {}
+                used_tokens = usage.get("total_tokens")
+                with self._condition:
+                    self._metrics["requests"] += 1
+                    self._metrics["tokens"] += used_tokens or tokens
+                return response
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    with self._condition:
+                        self._metrics["failures"] += 1
+                    raise
+                attempt += 1
+                delay = _retry_after_seconds(e) or min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.5) # 지터: 동시에 실패한 요청들이 한꺼번에 재시도하지 않도록
+                with self._condition:
+                    self._metrics["retries"] += 1
+                print(f"⚠️  LLM 스케줄러: 요청 실패 ({type(e).__name__}: {e}). {delay:.1f}초 후 재시도 ({attempt}/{self.max_retries})")
+            finally:
+                self._release(reservation, used_tokens)
+            time.sleep(delay) # 백오프 중에는 동시 실행 슬롯을 반납
+
+    def metrics(self) -> Dict[str, float]:
+        """누적 지표 (요청/재시도/실패 수, 사용 토큰, 대기 시간 합계/최대/평균, 최대 동시 요청 수, 현재 대기 요청 수)"""
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics["queue_wait_avg"] = metrics["queue_wait_total"] / max(metrics["requests"] + metrics["failures"] + metrics["retries"], 1)
+            metrics["in_flight"] = self._in_flight
+            metrics["queue_length"] = len(self._waiting)
+        return metrics
+
+    def summary(self) -> str:
+        metrics = self.metrics()
+        return (
+            f"LLM 스케줄러: 요청 {int(metrics['requests'])}회 (재시도 {int(metrics['retries'])}회, 실패 {int(metrics['failures'])}회), "
+            f"토큰 약 {int(metrics['tokens'])}, 대기 평균 {metrics['queue_wait_avg']:.2f}초 / 최대 {metrics['queue_wait_max']:.2f}초, "
+            f"최대 동시 요청 {int(metrics['max_in_flight'])}개"
+        )
@@ -0,0 +1,134 @@
+import os
+import re
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+from indexing.metadata_filter import DOC_TYPE_GUIDELINE, normalize_filter
+from utils.retrieval import retrieve_many
+
+MAX_KEYWORD_TERMS = 10 # 키워드(BM25) 쿼리의 최대 단어 수 (BM25 점수 계산 비용은 질의어 수에 비례)
+
+# 키워드 쿼리에서 제외할 상투적인 단어 (쿼리 템플릿의 문장 틀, 모든 문서에 흔한 단어)
+KEYWORD_STOPWORDS = {
+    "서비스", "서비스의", "서비스가", "서비스를", "해당", "관련", "관련된", "관한", "대한", "대해", "위한",
+    "또는", "및", "등", "주요", "내용", "정보", "리스크", "측면", "문제", "가능성", "방안", "항목", "기능",
+    "잠재적인", "전반적인", "공식", "명칭", "이름", "찾아주세요", "설명", "사항", "있는", "얻을", "주로", "현재", "제공된",
+}
+# 명사 뒤에 붙는 한국어 조사/접미사 (키워드의 원형과 함께 뗀 형태도 쿼리에 넣어 BM25 어휘와의 일치 가능성을 높임)
+# (용언 어미와 겹치는 "은/는"은 제외)
+KOREAN_PARTICLE_SUFFIXES = ("에서", "으로", "로부터", "의", "를", "을", "이", "가", "에", "과", "와", "로", "들")
+KEYWORD_TOKEN_PATTERN = re.compile(r"[0-9A-Za-z가-힣]+")
+
+
+class RetrievalPlan(NamedTuple):
+    """검색 계획: 벡터 검색용 의미 쿼리, BM25용 키워드 쿼리, 메타데이터 필터"""
+    semantic_query: str
+    keyword_query: str
+    metadata_filter: Optional[Dict[str, Any]] = None
+
+
+def extract_keywords(*texts: str, max_terms: int = MAX_KEYWORD_TERMS) -> List[str]:
+    """텍스트에서 상투어를 제외한 키워드를 순서대로(중복 제거) 추출하고, 조사를 뗀 형태도 함께 포함합니다."""
+    keywords: Dict[str, None] = {}
+    for text in texts:
+        for token in KEYWORD_TOKEN_PATTERN.findall(text or ""):
+            if token in KEYWORD_STOPWORDS or len(token) < 2:
+                continue
+            stem = next(
+                (token[:-len(suffix)] for suffix in KOREAN_PARTICLE_SUFFIXES if token.endswith(suffix) and len(token) - len(suffix) >= 2),
+                None
+            )
+            if stem in KEYWORD_STOPWORDS: # 예: "서비스에"
+                continue
+            keywords.setdefault(token, None)
+            if stem:
+                keywords.setdefault(stem, None)
+    return list(keywords)[:max_terms]
+
+
+class QueryPlanner:
+    """
+    에이전트의 (평가 항목, 측면/키워드) 쌍을 짧은 키워드 쿼리 + 의미 쿼리 + 메타데이터 필터로 변환합니다.
+    문서명 나열(“주요 참고 문서: a.pdf, b.pdf ...”)은 쿼리 문장 대신 source_file 필터로 옮기고,
+    같은 계획은 한 번만 검색하도록 병합합니다.
+    """
+
+    def __init__(self, subject: str = "", documents: Optional[List[str]] = None):
+        """
+        Args:
+            subject: 서비스 이름 또는 URL (서비스 문서 대상 의미 쿼리에만 포함).
+            documents: 참고 문서 경로 목록. 서비스 문서 대상 계획의 source_file 필터가 됩니다.
+        """
+        self.subject = (subject or "").strip()
+        self.source_files = sorted({os.path.basename(path) for path in documents or []}) or None
+
+    def plan(
+        self,
+        concept: str,
+        aspect: str = "",
+        doc_types: Optional[List[str]] = None,
+        extra_keywords: Optional[List[str]] = None
+    ) -> RetrievalPlan:
+        """
+        (항목, 측면) 쌍 하나에 대한 검색 계획을 만듭니다.
+
+        Args:
+            concept: 평가 항목 또는 찾을 개념 (예: "서비스의 개인정보보호(Privacy) 관련 리스크").
+            aspect: 세부 측면 또는 키워드 (예: "데이터 수집 및 처리의 적절성"). 없으면 빈 문자열.
+            doc_types: 검색할 문서 유형 리스트 (None이면 유형 제한 없음).
+            extra_keywords: 키워드 쿼리에만 추가할 단어 (예: 참조 가이드라인 키워드 "OECD").
+        """
+        guideline_only = doc_types is not None and set(doc_types) == {DOC_TYPE_GUIDELINE}
+        parts = [concept.strip(), aspect.strip()]
+        if self.subject and not guideline_only: # 가이드라인 문서에는 서비스 이름이 등장하지 않으므로 제외
+            parts.insert(0, self.subject)
+        semantic_query = " - ".join(part for part in parts if part)
+        keywords = list(dict.fromkeys([*(extra_keywords or []), *extract_keywords(concept, aspect)]))
+        keyword_query = " ".join(keywords) or " ".join(KEYWORD_TOKEN_PATTERN.findall(f"{concept} {aspect}"))
+
+        metadata_filter: Dict[str, Any] = {}
+        if doc_types:
+            metadata_filter["doc_type"] = list(doc_types)
+        if self.source_files and not guideline_only: # 공유 가이드라인 컬렉션의 문서는 서비스 문서 목록에 없을 수 있음
+            metadata_filter["source_file"] = self.source_files
+        return RetrievalPlan(semantic_query, keyword_query, metadata_filter or None)
+
+
+def merge_plans(plans: List[RetrievalPlan]) -> Tuple[List[RetrievalPlan], List[int]]:
+    """
+    중복 계획을 병합합니다.
+
+    Returns:
+        (고유 계획 리스트, 원래 계획별 고유 계획 인덱스 리스트).
+    """
+    unique_index: Dict[str, int] = {}
+    unique_plans: List[RetrievalPlan] = []
+    positions: List[int] = []
+    for plan in plans:
+        key = json.dumps(
+            [plan.semantic_query, plan.keyword_query, normalize_filter(plan.metadata_filter)], sort_keys=True, ensure_ascii=False
+        )
+        if key not in unique_index:
+            unique_index[key] = len(unique_plans)
+            unique_plans.append(plan)
+        positions.append(unique_index[key])
+    return unique_plans, positions
+
+
+def retrieve_plans(retriever: Any, plans: List[RetrievalPlan]) -> List[Union[List[Document], Exception]]:
+    """
+    검색 계획들을 병합한 뒤 한 번의 배치 검색으로 처리하고, 원래 계획 순서대로 결과를 돌려줍니다.
+    (의미 쿼리는 벡터 검색, 키워드 쿼리는 BM25에 사용되며, 필터 결과가 비면 필터 없이 다시 검색)
+    """
+    unique_plans, positions = merge_plans(plans)
+    if len(unique_plans) < len(plans):
+        print(f"정보(query_planner): 검색 계획 {len(plans)}개 중 중복을 병합하여 {len(unique_plans)}개만 검색합니다.")
+    results = retrieve_many(
+        retriever,
+        [plan.semantic_query for plan in unique_plans],
+        [plan.metadata_filter for plan in unique_plans],
+        keyword_queries=[plan.keyword_query for plan in unique_plans],
+    )
+    return [results[position] for position in positions]
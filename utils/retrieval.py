@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+from langchain_core.documents import Document
+
+from indexing.metadata_filter import matches_filter
+
+DEFAULT_MAX_CONCURRENCY = 4 # batch_retrieve를 지원하지 않는 리트리버의 동시 검색 쿼리 수
+
+
+def _retrieve_one(retriever: Any, query: str, metadata_filter: Optional[Dict[str, Any]]) -> Union[List[Document], Exception]:
+    try:
+        if hasattr(retriever, 'invoke'):
+            docs = retriever.invoke(query)
+        elif hasattr(retriever, 'get_relevant_documents'):
+            docs = retriever.get_relevant_documents(query)
+        else:
+            return AttributeError("Retriever에 적절한 검색 메소드가 없습니다.")
+        return [doc for doc in docs if matches_filter(doc.metadata, metadata_filter)]
+    except Exception as e:
+        return e
+
+
+def _retrieve_batch(
+    retriever: Any,
+    queries: List[str],
+    metadata_filters: Optional[List[Optional[Dict[str, Any]]]],
+    keyword_queries: Optional[List[str]] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+) -> List[Union[List[Document], Exception]]:
+    if hasattr(retriever, 'batch_retrieve'):
+        try:
+            if keyword_queries is not None:
+                return retriever.batch_retrieve(queries, metadata_filters, keyword_queries=keyword_queries)
+            if metadata_filters is None:
+                return retriever.batch_retrieve(queries)
+            return retriever.batch_retrieve(queries, metadata_filters)
+        except Exception as e:
+            print(f"경고(retrieval): 배치 검색 실패 ({e}). 쿼리별 검색으로 전환합니다.")
+
+    # 배치/필터를 지원하지 않는 리트리버: 쿼리별 검색을 스레드 풀에서 동시에 실행한 뒤 필터 적용 (결과는 쿼리 순서 유지)
+    metadata_filters = metadata_filters or [None] * len(queries)
+    if max_concurrency <= 1 or len(queries) == 1:
+        return [_retrieve_one(retriever, query, metadata_filter) for query, metadata_filter in zip(queries, metadata_filters)]
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(queries)), thread_name_prefix="retrieval") as executor:
+        return list(executor.map(lambda args: _retrieve_one(retriever, *args), zip(queries, metadata_filters)))
+
+
+# 여러 RAG 쿼리를 한 번에 검색하는 함수
+def retrieve_many(
+    retriever: Any,
+    queries: List[str],
+    metadata_filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+    fallback_to_unfiltered: bool = True,
+    keyword_queries: Optional[List[str]] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+) -> List[Union[List[Document], Exception]]:
+    """
+    retriever가 batch_retrieve를 지원하면 모든 쿼리를 한 번의 배치 검색으로 처리하고,
+    그렇지 않으면 쿼리별 invoke(또는 get_relevant_documents)를 최대 max_concurrency개씩 동시에 호출합니다.
+    어느 경우든 결과는 쿼리 순서대로 반환되므로 이를 조립한 프롬프트는 실행마다 같습니다.
+
+    Args:
+        retriever: 리트리버 (HybridRetriever, CachedRetriever 또는 일반 LangChain 리트리버).
+        queries: 검색 쿼리 리스트.
+        metadata_filters: 쿼리별 메타데이터 필터 리스트 (예: {"doc_type": ["terms", "privacy"]}).
+        fallback_to_unfiltered: 필터 결과가 비어 있는 쿼리(해당 유형의 문서가 없거나 이전 버전 인덱스)를 필터 없이 다시 검색할지 여부.
+        keyword_queries: 쿼리별 BM25용 키워드 쿼리 리스트 (None이면 queries를 그대로 사용). batch_retrieve를 지원하는 리트리버에만 적용됩니다.
+        max_concurrency: 쿼리별 검색 시 동시에 실행할 최대 쿼리 수 (1이면 순차 검색).
+
+    Returns:
+        쿼리 순서와 같은 결과 리스트. 각 원소는 검색된 Document 리스트이거나, 검색 실패 시 발생한 예외.
+    """
+    if not queries:
+        return []
+
+    results = _retrieve_batch(retriever, queries, metadata_filters, keyword_queries, max_concurrency)
+    if metadata_filters and fallback_to_unfiltered:
+        retry_positions = [
+            position for position, (docs, metadata_filter) in enumerate(zip(results, metadata_filters))
+            if metadata_filter and isinstance(docs, list) and not docs
+        ]
+        if retry_positions:
+            print(f"정보(retrieval): 필터 조건에 맞는 문서가 없는 {len(retry_positions)}개 쿼리는 필터 없이 다시 검색합니다.")
+            retried = _retrieve_batch(
+                retriever,
+                [queries[position] for position in retry_positions],
+                None,
+                [keyword_queries[position] for position in retry_positions] if keyword_queries is not None else None,
+                max_concurrency
+            )
+            for position, docs in zip(retry_positions, retried):
+                results[position] = docs
+    return results
@@ -0,0 +1,77 @@
+"""
+작성자 : kp
+작성일 : 2025-05-21
+목적 : 진단 그래프의 노드별 State 체크포인트 저장과 실패한 실행의 재개
+내용 : LangGraph SqliteSaver로 superstep마다 State를 실행 ID(thread_id)별로 저장하고,
+       --resume <실행 ID>로 마지막으로 성공한 노드 다음부터 다시 실행할 지점을 찾습니다.
+       체크포인트 파일이 계속 커지지 않도록 실행이 끝날 때마다 가장 최근 실행 keep_runs개만 남기고 이전 실행의 기록을 삭제합니다.
+"""
+
+import os
+import re
+import uuid
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+DEFAULT_CHECKPOINT_PATH = "./cache/checkpoints.sqlite"
+DEFAULT_KEEP_RUNS = 20 # 체크포인트를 보관할 최근 실행 수
+FATAL_ERROR_NODE = "handle_fatal_error"
+
+
+def new_run_id(service_name: str) -> str:
+    """실행 ID (예: daglo_20250521_101500_1a2b3c). 그래프 체크포인트의 thread_id로 사용되며 --resume에 그대로 전달합니다."""
+    safe_name = re.sub(r"[^\w-]+", "_", service_name).strip("_") or "run"
+    return f"{safe_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+def run_config(run_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": run_id}}
+
+
+def create_checkpointer(checkpoint_path: str = DEFAULT_CHECKPOINT_PATH) -> Any:
+    """
+    노드(superstep)마다 State를 저장하는 SQLite 체크포인터를 생성합니다.
+    병렬 브랜치가 여러 스레드에서 체크포인트를 기록하므로 연결은 스레드 간 공유를 허용합니다.
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    if os.path.dirname(checkpoint_path):
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    return SqliteSaver(sqlite3.connect(checkpoint_path, check_same_thread=False))
+
+
+def prune_checkpoints(checkpointer: Any, keep_runs: int = DEFAULT_KEEP_RUNS) -> int:
+    """
+    마지막으로 기록된 시점 기준 가장 최근 실행 keep_runs개의 체크포인트만 남기고 나머지 실행의 기록을 삭제합니다.
+    (삭제된 페이지는 SQLite가 이후 기록에 재사용하므로 파일 크기가 보관 실행 수에 비례하는 수준으로 유지됨)
+    Returns:
+        삭제한 실행 수.
+    """
+    checkpointer.setup()
+    rows = checkpointer.conn.execute(
+        "SELECT thread_id FROM checkpoints GROUP BY thread_id ORDER BY MAX(rowid) DESC"
+    ).fetchall()
+    stale_run_ids = [row[0] for row in rows[max(keep_runs, 1):]]
+    for run_id in stale_run_ids:
+        checkpointer.delete_thread(run_id)
+    return len(stale_run_ids)
+
+
+def find_resume_point(graph: Any, run_id: str) -> Optional[Any]:
+    """
+    실행 ID의 체크포인트 기록에서 다시 시작할 지점(StateSnapshot)을 찾습니다.
+    오류가 기록되지 않았고 실행할 노드가 남아 있는 가장 최근 체크포인트, 즉 마지막으로 성공한 노드 직후의 상태를 반환합니다.
+    (노드에서 예외가 발생해 중단된 실행은 마지막 체크포인트, 노드가 오류를 기록하고 handle_fatal_error 등으로 끝난 실행은 그 노드 직전 체크포인트)
+    오류 없이 끝난 실행은 마지막 체크포인트(다음 노드 없음)를, 기록이 없으면 None을 반환합니다.
+    """
+    history = list(graph.get_state_history(run_config(run_id))) # 최신 체크포인트부터
+    if not history:
+        return None
+    latest = history[0]
+    if not latest.next and not latest.values.get("error_message"):
+        return latest
+    for snapshot in history:
+        if snapshot.next and FATAL_ERROR_NODE not in snapshot.next and not snapshot.values.get("error_message"):
+            return snapshot
+    return None